@@ -4,14 +4,17 @@ A comprehensive disaster management platform with AI-powered predictions and com
 """
 
 import os
+import sys
 import logging
 import json
 import uuid
+import base64
+import io
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, abort
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, send_from_directory, abort, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
@@ -22,6 +25,19 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
 
+import click
+from sqlalchemy import tuple_
+from jinja2 import TemplateSyntaxError
+
+from utils import (
+    EmailService, EmailQueue, NewsletterSender, SafeSpotService, WeatherService, OverpassTileCache,
+    ElevationService, IncidentBulkIngestor, IncidentExporter, IncidentStatsRollup, IncidentClusterer,
+    IncidentSearchIndex, IncidentEventBroker, ResponseCache, FastJSONProvider, ModelSerializer,
+    EmergencyKitGenerator, DistrictKitPlanner, EmergencyKitStore, FileService, ResumableUploadService, UploadConflict,
+    ImageClassifier, MediaPipeline, MediaStore, HammingIndex, incident_confirmation_email
+)
+from geo import SafeSpotIndex, WeatherAlertIndex, rows_within
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,6 +51,7 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -42,6 +59,7 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:/
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # 25MB max file size
+app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
 
 # Email configuration
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -49,6 +67,103 @@ app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
 app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_POOL_SIZE'] = int(os.environ.get('MAIL_POOL_SIZE', 4))
+app.config['MAIL_POOL_IDLE_TIMEOUT'] = int(os.environ.get('MAIL_POOL_IDLE_TIMEOUT', 60))
+app.config['MAIL_MAX_MESSAGES_PER_CONNECTION'] = int(os.environ.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100))
+
+# Weather API configuration
+app.config['OPENWEATHER_API_KEY'] = os.environ.get('OPENWEATHER_API_KEY')
+app.config['OPENWEATHER_CALLS_PER_MINUTE'] = int(os.environ.get('OPENWEATHER_CALLS_PER_MINUTE', 60))
+app.config['OPENWEATHER_CACHE_TTL'] = int(os.environ.get('OPENWEATHER_CACHE_TTL', 600))  # seconds
+app.config['OPENWEATHER_STALE_TTL'] = int(os.environ.get('OPENWEATHER_STALE_TTL', 3600))  # seconds
+
+# Outbound email queue configuration
+app.config['EMAIL_QUEUE_WORKERS'] = int(os.environ.get('EMAIL_QUEUE_WORKERS', 2))
+app.config['EMAIL_QUEUE_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_QUEUE_MAX_ATTEMPTS', 5))
+app.config['EMAIL_QUEUE_BACKOFF_SECONDS'] = int(os.environ.get('EMAIL_QUEUE_BACKOFF_SECONDS', 30))
+app.config['EMAIL_QUEUE_POLL_INTERVAL'] = int(os.environ.get('EMAIL_QUEUE_POLL_INTERVAL', 5))
+app.config['EMAIL_QUEUE_BATCH_SIZE'] = int(os.environ.get('EMAIL_QUEUE_BATCH_SIZE', 50))
+
+# Bulk incident ingestion and export configuration
+app.config['INCIDENT_BULK_MAX_ROWS'] = int(os.environ.get('INCIDENT_BULK_MAX_ROWS', 50000))
+app.config['INCIDENT_BULK_CHUNK_SIZE'] = int(os.environ.get('INCIDENT_BULK_CHUNK_SIZE', 5000))
+app.config['INCIDENT_EXPORT_CHUNK_SIZE'] = int(os.environ.get('INCIDENT_EXPORT_CHUNK_SIZE', 5000))
+
+# Incident statistics rollup configuration
+app.config['INCIDENT_STATS_CELL_DEG'] = float(os.environ.get('INCIDENT_STATS_CELL_DEG', 1.0))  # ~110 km regions
+
+# Full-text search configuration ('auto' uses FTS5 on SQLite builds that have it, else the portable term index)
+app.config['INCIDENT_SEARCH_BACKEND'] = os.environ.get('INCIDENT_SEARCH_BACKEND', 'auto')  # auto, fts5 or terms
+app.config['INCIDENT_SEARCH_MAX_RANKED'] = int(os.environ.get('INCIDENT_SEARCH_MAX_RANKED', 10000))  # Broader matches rank the newest
+
+# Event clustering configuration (reports of a type this close in space and time form one event)
+app.config['EVENT_CLUSTERING_ENABLED'] = os.environ.get('EVENT_CLUSTERING_ENABLED', 'True').lower() == 'true'
+app.config['EVENT_RADIUS_KM'] = float(os.environ.get('EVENT_RADIUS_KM', 2.0))
+app.config['EVENT_WINDOW_HOURS'] = float(os.environ.get('EVENT_WINDOW_HOURS', 24))
+
+# Live incident stream configuration
+app.config['INCIDENT_STREAM_BUFFER_SIZE'] = int(os.environ.get('INCIDENT_STREAM_BUFFER_SIZE', 1000))
+app.config['INCIDENT_STREAM_HEARTBEAT'] = int(os.environ.get('INCIDENT_STREAM_HEARTBEAT', 15))  # seconds
+
+# Response cache configuration
+app.config['RESPONSE_CACHE_ENABLED'] = os.environ.get('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # memory or redis
+app.config['RESPONSE_CACHE_REDIS_URL'] = os.environ.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+app.config['RESPONSE_CACHE_MAX_AGE'] = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 0))  # seconds before clients revalidate
+
+# Emergency kit engine configuration
+app.config['EMERGENCY_KIT_CACHE_SIZE'] = int(os.environ.get('EMERGENCY_KIT_CACHE_SIZE', 4096))
+app.config['EMERGENCY_KIT_BATCH_MAX'] = int(os.environ.get('EMERGENCY_KIT_BATCH_MAX', 10000))
+
+# Newsletter fan-out configuration
+app.config['NEWSLETTER_BATCH_SIZE'] = int(os.environ.get('NEWSLETTER_BATCH_SIZE', 500))
+app.config['NEWSLETTER_CONCURRENCY'] = int(os.environ.get('NEWSLETTER_CONCURRENCY', 4))
+app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000')
+
+# Spatial index configuration
+app.config['SAFE_SPOT_INDEX_CELL_DEG'] = float(os.environ.get('SAFE_SPOT_INDEX_CELL_DEG', 0.05))
+app.config['WEATHER_ALERT_INDEX_CELL_DEG'] = float(os.environ.get('WEATHER_ALERT_INDEX_CELL_DEG', 0.5))
+app.config['WEATHER_ALERT_DEFAULT_RADIUS_KM'] = float(os.environ.get('WEATHER_ALERT_DEFAULT_RADIUS_KM', 50))
+
+# Overpass (OpenStreetMap) proxy configuration
+app.config['OVERPASS_URL'] = os.environ.get('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+app.config['OVERPASS_CACHE_DIR'] = os.environ.get('OVERPASS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'overpass'))
+app.config['OVERPASS_TILE_ZOOM'] = int(os.environ.get('OVERPASS_TILE_ZOOM', 12))
+app.config['OVERPASS_TILE_TTL'] = int(os.environ.get('OVERPASS_TILE_TTL', 7 * 24 * 3600))  # seconds
+app.config['OVERPASS_REQUESTS_PER_MINUTE'] = int(os.environ.get('OVERPASS_REQUESTS_PER_MINUTE', 30))
+
+# Resumable media upload configuration
+app.config['MEDIA_UPLOAD_MAX_BYTES'] = int(os.environ.get('MEDIA_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))  # whole file
+app.config['MEDIA_UPLOAD_MAX_CHUNK'] = int(os.environ.get('MEDIA_UPLOAD_MAX_CHUNK', 32 * 1024 * 1024))  # per PATCH request
+app.config['MEDIA_UPLOAD_STALE_HOURS'] = int(os.environ.get('MEDIA_UPLOAD_STALE_HOURS', 24))
+app.config['MEDIA_DUPLICATE_RADIUS'] = int(os.environ.get('MEDIA_DUPLICATE_RADIUS', 8))  # pHash bits out of 64
+
+# Media pipeline configuration (thumbnails, web variants, metadata stripping; video posters need ffmpeg)
+app.config['MEDIA_PIPELINE_ENABLED'] = os.environ.get('MEDIA_PIPELINE_ENABLED', 'True').lower() == 'true'
+app.config['MEDIA_PIPELINE_WORKERS'] = int(os.environ.get('MEDIA_PIPELINE_WORKERS', 2))  # worker processes
+app.config['MEDIA_THUMBNAIL_SIZE'] = int(os.environ.get('MEDIA_THUMBNAIL_SIZE', 320))  # square, pixels
+app.config['MEDIA_WEB_MAX_SIZE'] = int(os.environ.get('MEDIA_WEB_MAX_SIZE', 1600))  # longest side, pixels
+app.config['MEDIA_JPEG_QUALITY'] = int(os.environ.get('MEDIA_JPEG_QUALITY', 82))
+app.config['MEDIA_CACHE_MAX_AGE'] = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 86400))  # seconds
+app.config['FFMPEG_BINARY'] = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+app.config['FFPROBE_BINARY'] = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+
+# Image classifier configuration (model files from training.ipynb; needs torch and torchvision)
+app.config['CLASSIFIER_MODEL_PATH'] = os.environ.get('CLASSIFIER_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier', 'best_model.pth'))
+app.config['CLASSIFIER_CLASSES_PATH'] = os.environ.get('CLASSIFIER_CLASSES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier', 'classes.pkl'))
+app.config['CLASSIFIER_MAX_BATCH'] = int(os.environ.get('CLASSIFIER_MAX_BATCH', 16))
+app.config['CLASSIFIER_MAX_WAIT_MS'] = float(os.environ.get('CLASSIFIER_MAX_WAIT_MS', 10))
+app.config['CLASSIFIER_THREADS'] = int(os.environ.get('CLASSIFIER_THREADS', 4))  # torch intra-op threads
+app.config['CLASSIFIER_PREPROCESS_WORKERS'] = int(os.environ.get('CLASSIFIER_PREPROCESS_WORKERS', 4))
+app.config['CLASSIFIER_TOP_K'] = int(os.environ.get('CLASSIFIER_TOP_K', 3))
+app.config['CLASSIFIER_BATCH_MAX_IMAGES'] = int(os.environ.get('CLASSIFIER_BATCH_MAX_IMAGES', 64))
+
+# Elevation lookup configuration
+app.config['ELEVATION_API_URL'] = os.environ.get('ELEVATION_API_URL', 'https://api.open-elevation.com/api/v1/lookup')
+app.config['ELEVATION_GRID_DEG'] = float(os.environ.get('ELEVATION_GRID_DEG', 0.001))  # ~110 m cells
+app.config['ELEVATION_MAX_POINTS'] = int(os.environ.get('ELEVATION_MAX_POINTS', 1000))
+app.config['ELEVATION_REQUESTS_PER_MINUTE'] = int(os.environ.get('ELEVATION_REQUESTS_PER_MINUTE', 60))
 
 # Create upload directory
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -58,90 +173,65 @@ db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 CORS(app)
 
-# Database Models
-class IncidentReport(db.Model):
-    """Model for incident reports submitted by users"""
-    id = db.Column(db.Integer, primary_key=True)
-    report_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
-    email = db.Column(db.String(120), nullable=False)
-    incident_type = db.Column(db.String(50), nullable=False)
-    location = db.Column(db.String(200), nullable=False)
-    latitude = db.Column(db.Float, nullable=True)
-    longitude = db.Column(db.Float, nullable=True)
-    datetime_occurred = db.Column(db.DateTime, nullable=True)
-    description = db.Column(db.Text, nullable=False)
-    media_files = db.Column(db.JSON, nullable=True)  # Store file paths as JSON
-    consent = db.Column(db.Boolean, nullable=False, default=False)
-    status = db.Column(db.String(20), default='pending')  # pending, verified, resolved
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'report_id': self.report_id,
-            'email': self.email,
-            'incident_type': self.incident_type,
-            'location': self.location,
-            'latitude': self.latitude,
-            'longitude': self.longitude,
-            'datetime_occurred': self.datetime_occurred.isoformat() if self.datetime_occurred else None,
-            'description': self.description,
-            'media_files': self.media_files,
-            'status': self.status,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
-
-class NewsletterSubscription(db.Model):
-    """Model for newsletter subscriptions"""
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    subscribed_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'email': self.email,
-            'subscribed_at': self.subscribed_at.isoformat(),
-            'is_active': self.is_active
-        }
-
-class EmergencyKit(db.Model):
-    """Model for emergency kit configurations"""
-    id = db.Column(db.Integer, primary_key=True)
-    kit_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
-    family_size = db.Column(db.Integer, nullable=False)
-    adults = db.Column(db.Integer, nullable=False)
-    children = db.Column(db.Integer, nullable=False)
-    seniors = db.Column(db.Integer, nullable=False)
-    has_medical_conditions = db.Column(db.Boolean, default=False)
-    has_disabilities = db.Column(db.Boolean, default=False)
-    has_pets = db.Column(db.Boolean, default=False)
-    kit_duration = db.Column(db.Integer, nullable=False)  # days
-    budget_range = db.Column(db.String(20), nullable=False)
-    disaster_type = db.Column(db.String(50), nullable=False)
-    kit_items = db.Column(db.JSON, nullable=True)  # Store kit configuration as JSON
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'kit_id': self.kit_id,
-            'family_size': self.family_size,
-            'adults': self.adults,
-            'children': self.children,
-            'seniors': self.seniors,
-            'has_medical_conditions': self.has_medical_conditions,
-            'has_disabilities': self.has_disabilities,
-            'has_pets': self.has_pets,
-            'kit_duration': self.kit_duration,
-            'budget_range': self.budget_range,
-            'disaster_type': self.disaster_type,
-            'kit_items': self.kit_items,
-            'created_at': self.created_at.isoformat()
-        }
+# Database Models (defined in models.py, which imports ``db`` from this module).
+# Register this module as ``app`` first so ``python app.py`` shares one db instance.
+sys.modules.setdefault('app', sys.modules[__name__])
+from models import IncidentReport, NewsletterSubscription, NewsletterCampaign, EmergencyKit, WeatherAlert, SafeSpot, DisasterEvent
+
+# Services
+response_cache = ResponseCache(app)
+file_service = FileService(app.config['UPLOAD_FOLDER'], app.config['ALLOWED_EXTENSIONS'])
+email_service = EmailService(app)
+email_queue = EmailQueue(app, db, email_service)
+incident_stats = IncidentStatsRollup(app, db)
+incident_events = IncidentEventBroker(
+    buffer_size=app.config['INCIDENT_STREAM_BUFFER_SIZE'], heartbeat=app.config['INCIDENT_STREAM_HEARTBEAT']
+)
+incident_clusterer = IncidentClusterer(app, db)
+incident_search = IncidentSearchIndex(app, db)
+incident_ingestor = IncidentBulkIngestor(
+    db, email_queue, chunk_size=app.config['INCIDENT_BULK_CHUNK_SIZE'], stats=incident_stats, events=incident_events,
+    clusterer=incident_clusterer, search=incident_search
+)
+image_classifier = ImageClassifier(app, db)
+media_pipeline = MediaPipeline(app, db, events=incident_events, classifier=image_classifier)
+media_store = MediaStore(app, db)
+media_uploads = ResumableUploadService(
+    db, file_service, max_length=app.config['MEDIA_UPLOAD_MAX_BYTES'], events=incident_events, store=media_store
+)
+incident_exporter = IncidentExporter(db, chunk_size=app.config['INCIDENT_EXPORT_CHUNK_SIZE'])
+newsletter_sender = NewsletterSender(app, db, email_service)
+safe_spot_index = SafeSpotIndex(app, db)
+overpass_tile_cache = OverpassTileCache(
+    db,
+    overpass_url=app.config['OVERPASS_URL'],
+    cache_dir=app.config['OVERPASS_CACHE_DIR'],
+    zoom=app.config['OVERPASS_TILE_ZOOM'],
+    ttl=app.config['OVERPASS_TILE_TTL'],
+    requests_per_minute=app.config['OVERPASS_REQUESTS_PER_MINUTE']
+)
+safe_spot_service = SafeSpotService(safe_spot_index, overpass_tile_cache)
+elevation_service = ElevationService(
+    db,
+    api_url=app.config['ELEVATION_API_URL'],
+    grid_deg=app.config['ELEVATION_GRID_DEG'],
+    requests_per_minute=app.config['ELEVATION_REQUESTS_PER_MINUTE']
+)
+weather_alert_index = WeatherAlertIndex(app, db)
+kit_generator = EmergencyKitGenerator(max_entries=app.config['EMERGENCY_KIT_CACHE_SIZE'])
+district_kit_planner = DistrictKitPlanner(kit_generator)
+kit_store = EmergencyKitStore(db, kit_generator, max_entries=app.config['EMERGENCY_KIT_CACHE_SIZE'])
+weather_service = WeatherService(
+    app.config['OPENWEATHER_API_KEY'],
+    calls_per_minute=app.config['OPENWEATHER_CALLS_PER_MINUTE'],
+    cache_ttl=app.config['OPENWEATHER_CACHE_TTL'],
+    stale_ttl=app.config['OPENWEATHER_STALE_TTL']
+)
+
+@app.before_request
+def start_email_queue():
+    """Start email delivery in whichever process serves requests (idempotent)"""
+    email_queue.start()
 
 # Error Handlers
 @app.errorhandler(404)
@@ -167,53 +257,26 @@ def handle_exception(e):
 
 # Utility Functions
 def send_email(to_email: str, subject: str, body: str, is_html: bool = False) -> bool:
-    """Send email notification"""
-    try:
-        if not app.config['MAIL_USERNAME'] or not app.config['MAIL_PASSWORD']:
-            logger.warning("Email credentials not configured")
-            return False
-            
-        msg = MIMEMultipart()
-        msg['From'] = app.config['MAIL_USERNAME']
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        if is_html:
-            msg.attach(MIMEText(body, 'html'))
-        else:
-            msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(app.config['MAIL_SERVER'], app.config['MAIL_PORT'])
-        server.starttls()
-        server.login(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-        server.send_message(msg)
-        server.quit()
-        
-        logger.info(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {str(e)}")
-        return False
+    """Send email notification over the pooled SMTP connections"""
+    return email_service.send_email(to_email, subject, body, is_html)
 
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return file_service.allowed_file(filename)
 
 def save_uploaded_files(files) -> List[str]:
     """Save uploaded files and return list of file paths"""
-    saved_files = []
-    for file in files:
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            saved_files.append(filename)
-            logger.info(f"File saved: {filename}")
-    return saved_files
+    return file_service.save_uploaded_files(files)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    """Decode a cursor from encode_cursor(); raises ValueError if malformed"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, row_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
 
 # Main Routes
 @app.route('/')
@@ -309,25 +372,18 @@ def submit_incident_report():
         )
         
         db.session.add(incident)
-        db.session.commit()
-        
-        # Send confirmation email
-        email_body = f"""
-        Thank you for reporting the incident. Your report has been received and assigned ID: {incident.report_id}
-        
-        Incident Details:
-        - Type: {incident.incident_type}
-        - Location: {incident.location}
-        - Description: {incident.description}
-        - Status: {incident.status}
-        
-        We will review your report and contact you if additional information is needed.
+        db.session.flush()
         
-        Stay safe,
-        DisasterSense Team
-        """
+        # Queue confirmation email in the same transaction as the report
+        email_body = incident_confirmation_email(
+            incident.report_id, incident.incident_type, incident.location, incident.description, incident.status
+        )
         
-        send_email(incident.email, "Incident Report Confirmation", email_body)
+        email_queue.enqueue(incident.email, "Incident Report Confirmation", email_body)
+        event = incident_events.snapshot(incident)
+        db.session.commit()
+        email_queue.notify()
+        incident_events.publish('incident.created', event)
         
         logger.info(f"Incident report submitted: {incident.report_id}")
         return jsonify({
@@ -341,6 +397,232 @@ def submit_incident_report():
         db.session.rollback()
         return jsonify({'error': 'Failed to submit incident report'}), 500
 
+@app.route('/api/incident-reports/bulk', methods=['POST'])
+def submit_incident_reports_bulk():
+    """Submit many incident reports at once (JSON array or NDJSON) for partner feeds"""
+    try:
+        parse_errors = set()
+        if 'ndjson' in (request.content_type or ''):
+            records = []
+            for line in request.get_data(as_text=True).splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    parse_errors.add(len(records))
+                    records.append(None)
+        else:
+            records = request.get_json(silent=True)
+            if isinstance(records, dict):
+                records = records.get('reports')
+            if not isinstance(records, list):
+                return jsonify({'error': 'Expected a JSON array of reports or NDJSON'}), 400
+        
+        if not records:
+            return jsonify({'error': 'No reports submitted'}), 400
+        if len(records) > app.config['INCIDENT_BULK_MAX_ROWS']:
+            return jsonify({'error': f"At most {app.config['INCIDENT_BULK_MAX_ROWS']} reports per request"}), 400
+        
+        results = incident_ingestor.ingest(records)
+        for index in parse_errors:
+            results[index]['error'] = 'Invalid JSON'
+        
+        created = sum(1 for result in results if result['success'])
+        logger.info(f"Bulk incident ingest: {created} created, {len(results) - created} rejected")
+        return jsonify({
+            'success': True,
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error submitting incident reports: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to submit incident reports'}), 500
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable media upload: {filename, length, report_id?}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            upload = media_uploads.create(data.get('filename'), data.get('length'), data.get('report_id'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify({
+            'success': True,
+            'upload_id': upload.upload_id,
+            'offset': 0,
+            'max_chunk_size': app.config['MEDIA_UPLOAD_MAX_CHUNK']
+        })
+        response.status_code = 201
+        response.headers['Location'] = url_for('get_upload', upload_id=upload.upload_id)
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error creating upload: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create upload'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Upload progress; HEAD returns just the Upload-Offset / Upload-Length headers"""
+    upload = media_uploads.get(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    response = jsonify(upload.to_dict())
+    response.headers['Upload-Offset'] = str(upload.offset)
+    response.headers['Upload-Length'] = str(upload.length)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def append_upload(upload_id):
+    """Append one chunk (application/offset+octet-stream) at the Upload-Offset header"""
+    try:
+        if request.mimetype != 'application/offset+octet-stream':
+            return jsonify({'error': 'Content-Type must be application/offset+octet-stream'}), 415
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Upload-Offset header is required'}), 400
+        
+        # Chunks are streamed to disk, so they get their own limit instead of MAX_CONTENT_LENGTH
+        request.max_content_length = app.config['MEDIA_UPLOAD_MAX_CHUNK']
+        try:
+            new_offset = media_uploads.append(upload_id, offset, request.stream)
+        except LookupError:
+            return jsonify({'error': 'Upload not found'}), 404
+        except UploadConflict as e:
+            return jsonify({'error': str(e), 'offset': e.offset}), 409, {'Upload-Offset': str(e.offset)}
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 413
+        
+        return '', 204, {'Upload-Offset': str(new_offset)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error appending to upload {upload_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to store upload chunk'}), 500
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Finish an upload and attach it to its incident report: {report_id?, sha256?}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            upload = media_uploads.complete(upload_id, data.get('report_id'), data.get('sha256'))
+        except LookupError:
+            return jsonify({'error': 'Upload not found'}), 404
+        except UploadConflict as e:
+            return jsonify({'error': str(e), 'offset': e.offset}), 409
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Classifications are kept per report: bytes seen before get a copy of
+        # the stored prediction rather than a second pass through the model
+        blob = media_store.get_stored(upload.stored_filename)
+        if upload.report_id and image_classifier.is_image(upload.stored_filename):
+            if not image_classifier.copy_classification(upload.report_id, upload.stored_filename):
+                if image_classifier.is_configured:
+                    image_classifier.classify_media(upload.report_id, upload.stored_filename)
+        # Bytes seen before already have their variants
+        if upload.report_id and (blob is None or not blob.variants):
+            media_pipeline.submit(upload.report_id, upload.stored_filename, strip=False)
+        return jsonify({'success': True, 'upload': upload.to_dict(), 'media': blob.to_dict() if blob else None})
+        
+    except Exception as e:
+        logger.error(f"Error completing upload {upload_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to complete upload'}), 500
+
+@app.route('/media/<path:filename>', methods=['GET'])
+def serve_media(filename):
+    """Stored incident media and its thumbnail/web variants"""
+    if any(part.startswith('.') for part in filename.split('/')):
+        abort(404)  # unfinished uploads live in .partial
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=app.config['MEDIA_CACHE_MAX_AGE'])
+
+@app.route('/api/media/metrics', methods=['GET'])
+def media_pipeline_metrics():
+    """Counters for the background media pipeline and the media store"""
+    return jsonify({**media_pipeline.get_metrics(), 'store': media_store.get_metrics()})
+
+@app.route('/api/media/<sha256>/duplicates', methods=['GET'])
+def media_duplicates(sha256):
+    """Reports that uploaded these bytes and stored images that look the same (?radius= bits)"""
+    try:
+        radius = request.args.get('radius', type=int)
+        if radius is not None and not 0 <= radius <= 32:
+            return jsonify({'error': 'radius must be between 0 and 32'}), 400
+        result = media_store.duplicates(sha256.lower(), radius)
+        if result is None:
+            return jsonify({'error': 'Media not found'}), 404
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"Error finding duplicates of {sha256}: {str(e)}")
+        return jsonify({'error': 'Failed to find duplicates'}), 500
+
+@app.route('/api/classify', methods=['POST'])
+def classify_image():
+    """Classify one image (multipart ``image`` field, or the raw image as the body)"""
+    try:
+        if not image_classifier.is_configured:
+            return jsonify({'error': 'Image classifier is not available'}), 503
+        
+        upload = request.files.get('image')
+        image = upload.read() if upload else request.get_data()
+        if not image:
+            return jsonify({'error': 'No image provided'}), 400
+        
+        result = image_classifier.classify([image])[0]
+        if not result.pop('success'):
+            return jsonify(result), 400
+        return jsonify(result)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error classifying image: {str(e)}")
+        return jsonify({'error': 'Failed to classify image'}), 500
+
+@app.route('/api/classify/batch', methods=['POST'])
+def classify_images_batch():
+    """Classify several images (multipart ``images`` fields) in one call"""
+    try:
+        if not image_classifier.is_configured:
+            return jsonify({'error': 'Image classifier is not available'}), 503
+        
+        uploads = request.files.getlist('images')
+        if not uploads:
+            return jsonify({'error': 'No images provided'}), 400
+        if len(uploads) > app.config['CLASSIFIER_BATCH_MAX_IMAGES']:
+            return jsonify({'error': f"At most {app.config['CLASSIFIER_BATCH_MAX_IMAGES']} images per request"}), 400
+        
+        results = image_classifier.classify([upload.read() for upload in uploads])
+        for upload, result in zip(uploads, results):
+            result['filename'] = upload.filename
+        return jsonify({'success': True, 'results': results})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error classifying images: {str(e)}")
+        return jsonify({'error': 'Failed to classify images'}), 500
+
+@app.route('/api/classify/metrics', methods=['GET'])
+def classifier_metrics():
+    """Micro-batching and latency figures for the image classifier"""
+    return jsonify(image_classifier.get_metrics())
+
 @app.route('/api/newsletter', methods=['POST'])
 def subscribe_newsletter():
     """Subscribe to newsletter"""
@@ -373,45 +655,115 @@ def subscribe_newsletter():
         db.session.rollback()
         return jsonify({'error': 'Failed to subscribe to newsletter'}), 500
 
+@app.route('/api/newsletter/unsubscribe/<token>', methods=['GET'])
+def unsubscribe_newsletter(token):
+    """Unsubscribe from newsletter via the per-subscriber token"""
+    try:
+        subscription = NewsletterSubscription.query.filter_by(unsubscribe_token=token).first()
+        if not subscription:
+            return jsonify({'error': 'Subscription not found'}), 404
+        
+        subscription.is_active = False
+        db.session.commit()
+        
+        logger.info(f"Newsletter unsubscription: {subscription.email}")
+        return jsonify({'success': True, 'message': 'Successfully unsubscribed from newsletter'})
+        
+    except Exception as e:
+        logger.error(f"Error unsubscribing from newsletter: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to unsubscribe from newsletter'}), 500
+
+@app.route('/api/newsletter/campaigns', methods=['POST'])
+def create_newsletter_campaign():
+    """Create a newsletter campaign and start sending it (admin endpoint)"""
+    try:
+        data = request.get_json()
+        
+        for field in ['subject', 'body']:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        if not email_service.is_configured:
+            return jsonify({'error': 'Email delivery is not configured'}), 503
+        
+        try:
+            NewsletterSender.compile(data['body'], data.get('is_html', False))
+        except TemplateSyntaxError as e:
+            return jsonify({'error': f'Invalid body template: {e.message} (line {e.lineno})'}), 400
+        
+        campaign = NewsletterCampaign(
+            subject=data['subject'],
+            body_template=data['body'],
+            is_html=data.get('is_html', False)
+        )
+        db.session.add(campaign)
+        db.session.commit()
+        
+        newsletter_sender.start(campaign.campaign_id)
+        
+        logger.info(f"Newsletter campaign created: {campaign.campaign_id}")
+        return jsonify({
+            'success': True,
+            'campaign_id': campaign.campaign_id,
+            'message': 'Newsletter campaign started'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error creating newsletter campaign: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create newsletter campaign'}), 500
+
+@app.route('/api/newsletter/campaigns/<campaign_id>', methods=['GET'])
+def get_newsletter_campaign(campaign_id):
+    """Get newsletter campaign progress (admin endpoint)"""
+    campaign = NewsletterCampaign.query.filter_by(campaign_id=campaign_id).first()
+    if not campaign:
+        return jsonify({'error': 'Campaign not found'}), 404
+    return jsonify(campaign.to_dict())
+
+@app.route('/api/newsletter/campaigns/<campaign_id>/resume', methods=['POST'])
+def resume_newsletter_campaign(campaign_id):
+    """Resume an interrupted newsletter campaign from its last checkpoint (admin endpoint)"""
+    campaign = NewsletterCampaign.query.filter_by(campaign_id=campaign_id).first()
+    if not campaign:
+        return jsonify({'error': 'Campaign not found'}), 404
+    if campaign.status == 'completed':
+        return jsonify({'error': 'Campaign already completed'}), 400
+    if not email_service.is_configured:
+        return jsonify({'error': 'Email delivery is not configured'}), 503
+    if not newsletter_sender.start(campaign_id):
+        return jsonify({'error': 'Campaign is already running'}), 409
+    
+    logger.info(f"Newsletter campaign resumed: {campaign_id}")
+    return jsonify({'success': True, 'campaign_id': campaign_id, 'message': 'Newsletter campaign resumed'}), 202
+
 @app.route('/api/emergency-kit', methods=['POST'])
 def generate_emergency_kit():
     """Generate emergency kit configuration"""
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['family_size', 'adults', 'children', 'seniors', 'kit_duration', 'budget_range', 'disaster_type']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'{field} is required'}), 400
+        try:
+            params = kit_generator.parse_household(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Generate kit items based on parameters
-        kit_items = generate_kit_items(
-            disaster_type=data['disaster_type'],
-            family_size=data['family_size'],
-            adults=data['adults'],
-            children=data['children'],
-            seniors=data['seniors'],
-            has_medical=data.get('has_medical_conditions', False),
-            has_disabilities=data.get('has_disabilities', False),
-            has_pets=data.get('has_pets', False),
-            duration=data['kit_duration'],
-            budget=data['budget_range']
-        )
+        # The body is stored once per distinct configuration; the row only references it
+        content_hash, kit_items = kit_store.save(params)
         
-        # Save kit configuration
         kit = EmergencyKit(
-            family_size=data['family_size'],
-            adults=data['adults'],
-            children=data['children'],
-            seniors=data['seniors'],
-            has_medical_conditions=data.get('has_medical_conditions', False),
-            has_disabilities=data.get('has_disabilities', False),
-            has_pets=data.get('has_pets', False),
-            kit_duration=data['kit_duration'],
-            budget_range=data['budget_range'],
-            disaster_type=data['disaster_type'],
-            kit_items=kit_items
+            family_size=params['family_size'],
+            adults=params['adults'],
+            children=params['children'],
+            seniors=params['seniors'],
+            has_medical_conditions=params['has_medical'],
+            has_disabilities=params['has_disabilities'],
+            has_pets=params['has_pets'],
+            kit_duration=params['duration'],
+            budget_range=params['budget'],
+            disaster_type=params['disaster_type'],
+            content_hash=content_hash
         )
         
         db.session.add(kit)
@@ -430,119 +782,395 @@ def generate_emergency_kit():
         db.session.rollback()
         return jsonify({'error': 'Failed to generate emergency kit'}), 500
 
-def generate_kit_items(disaster_type: str, family_size: int, adults: int, children: int, 
-                      seniors: int, has_medical: bool, has_disabilities: bool, 
-                      has_pets: bool, duration: int, budget: str) -> Dict[str, Any]:
-    """Generate emergency kit items based on parameters"""
-    
-    # Base items for all disasters
-    base_items = {
-        'water': {'quantity': f"{family_size * duration * 4} liters", 'priority': 'high'},
-        'food': {'quantity': f"{family_size * duration * 3} meals", 'priority': 'high'},
-        'first_aid_kit': {'quantity': '1', 'priority': 'high'},
-        'flashlight': {'quantity': f"{family_size}", 'priority': 'high'},
-        'batteries': {'quantity': '20+', 'priority': 'high'},
-        'radio': {'quantity': '1', 'priority': 'medium'},
-        'whistle': {'quantity': f"{family_size}", 'priority': 'medium'},
-        'blankets': {'quantity': f"{family_size}", 'priority': 'medium'},
-        'important_documents': {'quantity': '1 set', 'priority': 'high'},
-        'cash': {'quantity': '₹5000+', 'priority': 'high'}
-    }
-    
-    # Disaster-specific items
-    disaster_items = {
-        'Flood': {
-            'water_purification_tablets': {'quantity': '50+', 'priority': 'high'},
-            'waterproof_bags': {'quantity': f"{family_size}", 'priority': 'high'},
-            'life_jackets': {'quantity': f"{family_size}", 'priority': 'high'},
-            'sandbags': {'quantity': '20+', 'priority': 'medium'}
-        },
-        'Earthquake': {
-            'hard_hats': {'quantity': f"{family_size}", 'priority': 'high'},
-            'work_gloves': {'quantity': f"{family_size * 2}", 'priority': 'medium'},
-            'crowbar': {'quantity': '1', 'priority': 'medium'},
-            'dust_masks': {'quantity': f"{family_size * 5}", 'priority': 'high'}
-        },
-        'Cyclone': {
-            'tarps': {'quantity': '2+', 'priority': 'high'},
-            'rope': {'quantity': '50+ meters', 'priority': 'medium'},
-            'duct_tape': {'quantity': '5+ rolls', 'priority': 'medium'},
-            'emergency_shelter': {'quantity': '1', 'priority': 'high'}
-        },
-        'Landslide': {
-            'emergency_shovel': {'quantity': '1', 'priority': 'high'},
-            'walkie_talkies': {'quantity': '2+', 'priority': 'medium'},
-            'emergency_blanket': {'quantity': f"{family_size}", 'priority': 'high'}
-        }
-    }
-    
-    # Special needs items
-    special_items = {}
-    if has_medical:
-        special_items.update({
-            'prescription_medications': {'quantity': '7+ days supply', 'priority': 'high'},
-            'medical_equipment': {'quantity': 'As needed', 'priority': 'high'},
-            'medical_records': {'quantity': '1 copy', 'priority': 'high'}
-        })
-    
-    if has_disabilities:
-        special_items.update({
-            'assistive_devices': {'quantity': 'As needed', 'priority': 'high'},
-            'communication_aids': {'quantity': 'As needed', 'priority': 'high'}
-        })
-    
-    if has_pets:
-        special_items.update({
-            'pet_food': {'quantity': f"{duration * 2} days", 'priority': 'medium'},
-            'pet_carrier': {'quantity': '1+', 'priority': 'medium'},
-            'pet_medications': {'quantity': 'As needed', 'priority': 'medium'}
+@app.route('/api/emergency-kit/<kit_id>', methods=['GET'])
+def get_emergency_kit(kit_id):
+    """Get a saved kit; the body comes from the content store's memory when it can"""
+    try:
+        serializer = ModelSerializer.for_model(EmergencyKit)
+        row = EmergencyKit.query.with_entities(*serializer.columns).filter(EmergencyKit.kit_id == kit_id).first()
+        if row is None:
+            return jsonify({'error': 'Kit not found'}), 404
+        
+        kit = serializer.rows([row])[0]
+        if kit['content_hash']:
+            kit['kit_items'] = kit_store.body(kit['content_hash'])
+        kit['kit_items'] = kit['kit_items'] or {}
+        return jsonify(kit)
+        
+    except Exception as e:
+        logger.error(f"Error fetching emergency kit {kit_id}: {str(e)}")
+        return jsonify({'error': 'Failed to fetch emergency kit'}), 500
+
+@app.route('/api/emergency-kit/batch', methods=['POST'])
+def generate_emergency_kits_batch():
+    """Plan kits for many households in one call (relief agencies); nothing is saved"""
+    try:
+        data = request.get_json(silent=True)
+        households = data.get('households') if isinstance(data, dict) else data
+        if not isinstance(households, list) or not households:
+            return jsonify({'error': 'Expected a non-empty JSON array of households'}), 400
+        if len(households) > app.config['EMERGENCY_KIT_BATCH_MAX']:
+            return jsonify({'error': f"At most {app.config['EMERGENCY_KIT_BATCH_MAX']} households per request"}), 400
+        
+        results = kit_generator.generate_batch(households)
+        planned = [result['kit'] for result in results if result['success']]
+        return jsonify({
+            'success': True,
+            'planned': len(planned),
+            'failed': len(results) - len(planned),
+            'total_estimated_cost': sum(kit['estimated_cost'] for kit in planned),
+            'results': results
         })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error planning emergency kits: {str(e)}")
+        return jsonify({'error': 'Failed to plan emergency kits'}), 500
+
+@app.route('/api/emergency-kit/district', methods=['POST'])
+def plan_district_kits():
+    """Total kit supplies for a district from household census rows (CSV upload or JSON)
     
-    # Combine all items
-    all_items = {**base_items, **disaster_items.get(disaster_type, {}), **special_items}
-    
-    # Calculate estimated cost based on budget
-    cost_multipliers = {'basic': 1.0, 'standard': 1.5, 'premium': 2.0}
-    multiplier = cost_multipliers.get(budget, 1.0)
-    base_cost = family_size * duration * 500  # Base cost per person per day
-    estimated_cost = int(base_cost * multiplier)
-    
-    return {
-        'items': all_items,
-        'estimated_cost': estimated_cost,
-        'total_items': len(all_items),
-        'high_priority_items': len([item for item in all_items.values() if item['priority'] == 'high']),
-        'disaster_type': disaster_type,
-        'family_size': family_size,
-        'duration_days': duration
-    }
+    ``disaster_type``, ``kit_duration`` and ``budget_range`` (query string, or
+    JSON body keys) apply to households that do not carry their own value.
+    """
+    try:
+        data = request.get_json(silent=True) if request.is_json else None
+        options = data if isinstance(data, dict) else request.args
+        try:
+            kit_duration = int(options.get('kit_duration', 7))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'kit_duration must be an integer'}), 400
+        if kit_duration < 1:
+            return jsonify({'error': 'kit_duration must be at least 1'}), 400
+        
+        if request.is_json:
+            households = data.get('households') if isinstance(data, dict) else data
+            if not isinstance(households, list) or not all(isinstance(household, dict) for household in households):
+                return jsonify({'error': 'Expected a JSON array of household objects'}), 400
+        else:
+            upload = request.files.get('file')
+            try:
+                households = district_kit_planner.read_csv(upload.stream if upload else io.BytesIO(request.get_data()))
+            except (ValueError, UnicodeDecodeError) as e:
+                return jsonify({'error': f'Could not read census CSV: {str(e)}'}), 400
+        
+        plan = district_kit_planner.plan(
+            households,
+            disaster_type=options.get('disaster_type'),
+            kit_duration=kit_duration,
+            budget_range=options.get('budget_range', 'standard')
+        )
+        logger.info(f"District kit plan: {plan['households']} households, {plan['skipped_rows']} skipped")
+        return jsonify(plan)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error planning district kits: {str(e)}")
+        return jsonify({'error': 'Failed to plan district kits'}), 500
 
 @app.route('/api/incidents', methods=['GET'])
+@response_cache.cached(IncidentReport)
 def get_incidents():
-    """Get incident reports (admin endpoint)"""
+    """Get incident reports, newest first (admin endpoint)
+    
+    Pages with an opaque ``cursor`` on (created_at, id), so deep pages cost the
+    same as the first; ``page`` keeps the old offset behaviour. ``fields``
+    selects only the named columns and ``include_total=false`` skips COUNT(*).
+    """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        per_page = min(request.args.get('per_page', 10, type=int), 200)
+        page = request.args.get('page', type=int)
+        cursor = request.args.get('cursor')
         status = request.args.get('status')
+        include_total = request.args.get('include_total', 'true').lower() != 'false'
+        
+        fields = IncidentReport.API_FIELDS
+        if request.args.get('fields'):
+            fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+            unknown = [field for field in fields if field not in IncidentReport.API_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
         
-        query = IncidentReport.query
+        # The keyset columns are always selected so the next cursor can be built
+        serializer = ModelSerializer.for_model(IncidentReport, fields, empty_lists=('media_files',))
+        selected = list(dict.fromkeys(serializer.fields + ('created_at', 'id')))
+        query = db.session.query(*[getattr(IncidentReport, field) for field in selected])
         if status:
-            query = query.filter_by(status=status)
+            query = query.filter(IncidentReport.status == status)
+        
+        response = {}
+        if include_total:
+            response['total'] = db.session.query(db.func.count(IncidentReport.id)).filter(
+                *([IncidentReport.status == status] if status else [])
+            ).scalar()
+        
+        query = query.order_by(IncidentReport.created_at.desc(), IncidentReport.id.desc())
+        if page and not cursor:
+            rows = query.offset((max(page, 1) - 1) * per_page).limit(per_page + 1).all()
+            response['current_page'] = page
+            if include_total:
+                response['pages'] = -(-response['total'] // per_page)
+        else:
+            if cursor:
+                try:
+                    created_at, row_id = decode_cursor(cursor)
+                except (ValueError, UnicodeDecodeError):
+                    return jsonify({'error': 'Invalid cursor'}), 400
+                query = query.filter(tuple_(IncidentReport.created_at, IncidentReport.id) < (created_at, row_id))
+            rows = query.limit(per_page + 1).all()
+        
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        response['incidents'] = serializer.rows(rows)
+        response['has_more'] = has_more
+        response['next_cursor'] = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        logger.error(f"Error fetching incidents: {str(e)}")
+        return jsonify({'error': 'Failed to fetch incidents'}), 500
+
+@app.route('/api/incidents/export', methods=['GET'])
+def export_incidents():
+    """Stream incident reports as CSV or Parquet (admin endpoint)"""
+    try:
+        export_format = request.args.get('format', 'csv')
+        status = request.args.get('status')
+        since = request.args.get('since')
+        
+        if export_format not in IncidentExporter.CONTENT_TYPES:
+            return jsonify({'error': 'Format must be csv or parquet'}), 400
+        try:
+            since = datetime.fromisoformat(since) if since else None
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 datetime'}), 400
         
-        incidents = query.order_by(IncidentReport.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        if export_format == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+            chunks = incident_exporter.iter_parquet(since, status)
+        else:
+            chunks = incident_exporter.iter_csv(since, status)
+        
+        filename = f"incidents-{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return Response(
+            stream_with_context(chunks),
+            mimetype=IncidentExporter.CONTENT_TYPES[export_format],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
         
+    except Exception as e:
+        logger.error(f"Error exporting incidents: {str(e)}")
+        return jsonify({'error': 'Failed to export incidents'}), 500
+
+@app.route('/api/incidents/search', methods=['GET'])
+@response_cache.cached(IncidentReport)
+def search_incidents():
+    """Ranked full-text search over incident descriptions and locations (admin endpoint)
+    
+    Every word in ``q`` must match; ``word*``, and the last word unless
+    ``prefix=false``, match as prefixes. Combines with ``status``,
+    ``incident_type``, ``since`` and ``until`` (created_at); pages with ``page``.
+    """
+    try:
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({'error': 'q is required'}), 400
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        page = max(request.args.get('page', 1, type=int), 1)
+        prefix = request.args.get('prefix', 'true').lower() != 'false'
+        try:
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+            until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        except ValueError:
+            return jsonify({'error': 'since and until must be ISO 8601 datetimes'}), 400
+        
+        fields = IncidentReport.API_FIELDS
+        if request.args.get('fields'):
+            fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+            unknown = [field for field in fields if field not in IncidentReport.API_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        filters = {field: request.args[field] for field in ('status', 'incident_type') if request.args.get(field)}
+        hits = incident_search.search(
+            q, filters, since, until, limit=per_page + 1, offset=(page - 1) * per_page, prefix=prefix
+        )
+        has_more = len(hits) > per_page
+        scores = dict(hits[:per_page])
+        
+        # Matches are ranked by the index; their columns come from one primary key lookup
+        serializer = ModelSerializer.for_model(IncidentReport, fields, empty_lists=('media_files',))
+        selected = list(dict.fromkeys(serializer.fields + ('id',)))
+        rows = db.session.query(*[getattr(IncidentReport, field) for field in selected]).filter(
+            IncidentReport.id.in_(list(scores))
+        ).all()
+        rows.sort(key=lambda row: (-scores[row.id], -row.id))
+        incidents = serializer.rows(rows)
+        for incident, row in zip(incidents, rows):
+            incident['score'] = round(scores[row.id], 4)
+        
         return jsonify({
-            'incidents': [incident.to_dict() for incident in incidents.items],
-            'total': incidents.total,
-            'pages': incidents.pages,
-            'current_page': page
+            'incidents': incidents,
+            'current_page': page,
+            'has_more': has_more,
+            'backend': incident_search.backend
         })
         
     except Exception as e:
-        logger.error(f"Error fetching incidents: {str(e)}")
-        return jsonify({'error': 'Failed to fetch incidents'}), 500
+        logger.error(f"Error searching incidents: {str(e)}")
+        return jsonify({'error': 'Failed to search incidents'}), 500
+
+@app.route('/api/incidents/stats', methods=['GET'])
+@response_cache.cached(IncidentReport)
+def get_incident_stats():
+    """Incident counts for the dashboards, read from the incident_stats rollup"""
+    try:
+        try:
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+            until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        except ValueError:
+            return jsonify({'error': 'since and until must be ISO 8601 datetimes'}), 400
+        
+        filters = {field: request.args[field] for field in ('incident_type', 'status', 'priority', 'geo_cell')
+                   if request.args.get(field)}
+        group_by = [dimension.strip() for dimension in request.args.get('group_by', '').split(',') if dimension.strip()]
+        unknown = [dimension for dimension in group_by if dimension not in IncidentStatsRollup.DIMENSIONS]
+        if unknown:
+            return jsonify({'error': f"Unknown group_by dimensions: {', '.join(unknown)}"}), 400
+        
+        stats = incident_stats.summary(since, until, filters)
+        if group_by:
+            stats['groups'] = incident_stats.query(group_by, since, until, filters)
+        stats['geo_cell_deg'] = incident_stats.cell_deg
+        
+        return jsonify(stats)
+        
+    except Exception as e:
+        logger.error(f"Error fetching incident stats: {str(e)}")
+        return jsonify({'error': 'Failed to fetch incident stats'}), 500
+
+@app.route('/api/incidents/stream', methods=['GET'])
+def stream_incidents():
+    """Server-Sent Events feed of new and updated incidents
+    
+    Filters: ``incident_type`` and ``status`` (comma-separated) and
+    ``bbox=min_lat,min_lng,max_lat,max_lng``. Reconnecting clients resume
+    from ``Last-Event-ID`` (or ``last_event_id``) out of the in-memory buffer.
+    """
+    try:
+        types = {value for value in request.args.get('incident_type', '').split(',') if value}
+        statuses = {value for value in request.args.get('status', '').split(',') if value}
+        bbox = None
+        if request.args.get('bbox'):
+            try:
+                min_lat, min_lng, max_lat, max_lng = (float(value) for value in request.args['bbox'].split(','))
+            except ValueError:
+                return jsonify({'error': 'bbox must be min_lat,min_lng,max_lat,max_lng'}), 400
+            bbox = (min_lat, min_lng, max_lat, max_lng)
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        
+        def matches(incident: Dict[str, Any]) -> bool:
+            if types and incident['incident_type'] not in types:
+                return False
+            if statuses and incident['status'] not in statuses:
+                return False
+            if bbox:
+                lat, lng = incident['latitude'], incident['longitude']
+                if lat is None or lng is None or not (bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]):
+                    return False
+            return True
+        
+        return Response(
+            incident_events.subscribe(last_event_id, matches),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error opening incident stream: {str(e)}")
+        return jsonify({'error': 'Failed to open incident stream'}), 500
+
+@app.route('/api/events', methods=['GET'])
+@response_cache.cached(DisasterEvent)
+def get_events():
+    """Clustered incident events, most recently active first
+    
+    Filters: ``incident_type``, ``since`` (last report at or after, ISO 8601)
+    and ``min_reports``. Pages with an opaque ``cursor`` like /api/incidents.
+    """
+    try:
+        per_page = min(request.args.get('per_page', 20, type=int), 200)
+        min_reports = request.args.get('min_reports', 1, type=int)
+        cursor = request.args.get('cursor')
+        try:
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 datetime'}), 400
+        
+        # The id rides along after the API fields so the next cursor can be built
+        serializer = ModelSerializer.for_model(DisasterEvent, DisasterEvent.API_FIELDS)
+        query = db.session.query(*serializer.columns, DisasterEvent.id)
+        if request.args.get('incident_type'):
+            query = query.filter(DisasterEvent.incident_type == request.args['incident_type'])
+        if since:
+            query = query.filter(DisasterEvent.last_reported_at >= since)
+        if min_reports > 1:
+            query = query.filter(DisasterEvent.report_count >= min_reports)
+        if cursor:
+            try:
+                last_reported_at, row_id = decode_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(tuple_(DisasterEvent.last_reported_at, DisasterEvent.id) < (last_reported_at, row_id))
+        
+        rows = query.order_by(DisasterEvent.last_reported_at.desc(), DisasterEvent.id.desc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        return jsonify({
+            'events': serializer.rows(rows),
+            'has_more': has_more,
+            'next_cursor': encode_cursor(rows[-1].last_reported_at, rows[-1].id) if has_more else None,
+            'radius_km': incident_clusterer.radius_km,
+            'window_hours': incident_clusterer.window.total_seconds() / 3600
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching events: {str(e)}")
+        return jsonify({'error': 'Failed to fetch events'}), 500
+
+@app.route('/api/events/<event_id>', methods=['GET'])
+@response_cache.cached(DisasterEvent, IncidentReport)
+def get_event(event_id):
+    """One event with its most recent reports (up to ``per_page``)"""
+    try:
+        event = DisasterEvent.query.filter_by(event_id=event_id).first()
+        if event is None:
+            return jsonify({'error': 'Event not found'}), 404
+        
+        per_page = min(request.args.get('per_page', 50, type=int), 500)
+        fields = ('report_id', 'incident_type', 'location', 'latitude', 'longitude', 'datetime_occurred',
+                  'description', 'media_files', 'status', 'priority', 'created_at')
+        serializer = ModelSerializer.for_model(IncidentReport, fields, empty_lists=('media_files',))
+        rows = db.session.query(*serializer.columns).filter(IncidentReport.event_id == event_id).order_by(
+            IncidentReport.created_at.desc(), IncidentReport.id.desc()
+        ).limit(per_page).all()
+        return jsonify({'event': event.to_dict(), 'reports': serializer.rows(rows)})
+        
+    except Exception as e:
+        logger.error(f"Error fetching event {event_id}: {str(e)}")
+        return jsonify({'error': 'Failed to fetch event'}), 500
 
 @app.route('/api/incidents/<report_id>', methods=['PUT'])
 def update_incident_status(report_id):
@@ -560,7 +1188,9 @@ def update_incident_status(report_id):
         
         incident.status = new_status
         incident.updated_at = datetime.utcnow()
+        event = incident_events.snapshot(incident)
         db.session.commit()
+        incident_events.publish('incident.updated', event)
         
         logger.info(f"Incident {report_id} status updated to {new_status}")
         return jsonify({'success': True, 'message': 'Status updated successfully'})
@@ -571,64 +1201,128 @@ def update_incident_status(report_id):
         return jsonify({'error': 'Failed to update status'}), 500
 
 @app.route('/api/weather-alerts', methods=['GET'])
+@response_cache.cached(WeatherAlert, ttl=60)
 def get_weather_alerts():
-    """Get weather alerts for the area"""
+    """Get active weather alerts, optionally only those covering lat/lng"""
     try:
-        # This would integrate with a weather API like OpenWeatherMap
-        # For now, return mock data
-        alerts = [
-            {
-                'id': 1,
-                'type': 'flood_warning',
-                'severity': 'moderate',
-                'message': 'Heavy rainfall expected in next 24 hours. Ensure your emergency kit is ready!',
-                'location': 'Mumbai, Maharashtra',
-                'valid_until': (datetime.utcnow() + timedelta(hours=24)).isoformat()
-            }
-        ]
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        now = datetime.utcnow()
+        
+        if lat is None or lng is None:
+            serializer = ModelSerializer.for_model(WeatherAlert)
+            rows = WeatherAlert.query.with_entities(*serializer.columns).filter(
+                WeatherAlert.is_active.is_(True),
+                WeatherAlert.valid_from <= now,
+                WeatherAlert.valid_until > now
+            ).order_by(WeatherAlert.valid_from.desc())
+            return jsonify({'alerts': serializer.rows(rows)})
         
-        return jsonify({'alerts': alerts})
+        covering = weather_alert_index.covering(lat, lng, at=now)
+        alerts = []
+        if covering:
+            serializer = ModelSerializer.for_model(WeatherAlert)
+            rows = WeatherAlert.query.with_entities(*serializer.columns).filter(
+                WeatherAlert.id.in_([alert_id for alert_id, _ in covering])
+            )
+            found = {alert['id']: alert for alert in serializer.rows(rows)}
+            for alert_id, distance in covering:
+                if alert_id in found:
+                    alert = found[alert_id]
+                    alert['distance_km'] = round(distance, 2) if distance is not None else None
+                    alerts.append(alert)
+        
+        # Provider alerts are cached per map tile, so repeated page loads cost no API calls
+        provider_alerts = weather_service.get_weather_alerts(lat, lng) if weather_service.api_key else []
+        
+        return jsonify({'alerts': alerts, 'provider_alerts': provider_alerts})
         
     except Exception as e:
         logger.error(f"Error fetching weather alerts: {str(e)}")
         return jsonify({'error': 'Failed to fetch weather alerts'}), 500
 
+def alert_recipients(alert: WeatherAlert) -> List[str]:
+    """Emails of consenting incident reporters located inside an alert's circle"""
+    if alert.latitude is None or alert.longitude is None:
+        return []
+    
+    query = db.session.query(
+        IncidentReport.latitude, IncidentReport.longitude, IncidentReport.email
+    ).filter(IncidentReport.consent.is_(True))
+    radius = alert.radius_km or app.config['WEATHER_ALERT_DEFAULT_RADIUS_KM']
+    return sorted({
+        row.email for row, _ in rows_within(
+            query, IncidentReport.latitude, IncidentReport.longitude, alert.latitude, alert.longitude, radius
+        )
+    })
+
+@app.route('/api/weather-alerts/<alert_id>/recipients', methods=['GET'])
+def get_weather_alert_recipients(alert_id):
+    """List reporters inside an alert's area (admin endpoint)"""
+    try:
+        alert = WeatherAlert.query.filter_by(alert_id=alert_id).first()
+        if not alert:
+            return jsonify({'error': 'Alert not found'}), 404
+        
+        recipients = alert_recipients(alert)
+        return jsonify({'alert_id': alert_id, 'total': len(recipients), 'recipients': recipients})
+        
+    except Exception as e:
+        logger.error(f"Error fetching alert recipients: {str(e)}")
+        return jsonify({'error': 'Failed to fetch alert recipients'}), 500
+
+@app.route('/api/weather-alerts/<alert_id>/notify', methods=['POST'])
+def notify_weather_alert(alert_id):
+    """Queue the alert by email to every reporter inside its area (admin endpoint)"""
+    try:
+        alert = WeatherAlert.query.filter_by(alert_id=alert_id).first()
+        if not alert:
+            return jsonify({'error': 'Alert not found'}), 404
+        
+        recipients = alert_recipients(alert)
+        email_body = f"""
+        {alert.title}
+        
+        Severity: {alert.severity}
+        Area: {alert.location}
+        Valid until: {alert.valid_until.strftime('%Y-%m-%d %H:%M')} UTC
+        
+        {alert.description}
+        
+        Stay safe,
+        DisasterSense Team
+        """
+        for email in recipients:
+            email_queue.enqueue(email, f"[{alert.severity.upper()}] {alert.title}", email_body)
+        db.session.commit()
+        email_queue.notify()
+        
+        logger.info(f"Weather alert {alert_id} queued for {len(recipients)} recipients")
+        return jsonify({'success': True, 'queued': len(recipients), 'message': 'Alert notifications queued'})
+        
+    except Exception as e:
+        logger.error(f"Error notifying weather alert: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to notify weather alert'}), 500
+
 @app.route('/api/safe-spots', methods=['GET'])
+@response_cache.cached(SafeSpot, ttl=300)
 def get_safe_spots():
-    """Get safe spots for evacuation"""
+    """Get safe spots for evacuation, nearest first"""
     try:
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
         disaster_type = request.args.get('disaster_type', 'earthquake')
-        radius = request.args.get('radius', 5, type=int)  # km
+        spot_type = request.args.get('spot_type')
+        radius = min(request.args.get('radius', 5, type=float), 50)  # km
+        limit = min(request.args.get('limit', 20, type=int), 200)
         
-        if not lat or not lng:
+        if lat is None or lng is None:
             return jsonify({'error': 'Latitude and longitude are required'}), 400
         
-        # This would integrate with OpenStreetMap Overpass API
-        # For now, return mock data
-        safe_spots = [
-            {
-                'id': 1,
-                'name': 'Local Park',
-                'type': 'open_space',
-                'latitude': lat + 0.01,
-                'longitude': lng + 0.01,
-                'distance_km': 1.2,
-                'capacity': 100,
-                'facilities': ['shelter', 'water', 'toilets']
-            },
-            {
-                'id': 2,
-                'name': 'Community Center',
-                'type': 'shelter',
-                'latitude': lat - 0.01,
-                'longitude': lng + 0.02,
-                'distance_km': 2.1,
-                'capacity': 200,
-                'facilities': ['shelter', 'medical', 'food']
-            }
-        ]
+        safe_spots = safe_spot_service.find_safe_spots(
+            lat, lng, disaster_type, radius_km=radius, limit=limit, spot_type=spot_type
+        )
         
         return jsonify({'safe_spots': safe_spots})
         
@@ -636,6 +1330,679 @@ def get_safe_spots():
         logger.error(f"Error fetching safe spots: {str(e)}")
         return jsonify({'error': 'Failed to fetch safe spots'}), 500
 
+@app.route('/api/elevation', methods=['GET', 'POST'])
+def get_elevation():
+    """Batch elevation lookup (open-elevation compatible request and response)"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            locations = data.get('locations') or []
+            points = [(float(loc['latitude']), float(loc['longitude'])) for loc in locations]
+        else:
+            # locations=lat,lng|lat,lng
+            raw = request.args.get('locations', '')
+            points = [tuple(float(value) for value in pair.split(',')) for pair in raw.split('|') if pair]
+        
+        if not points:
+            return jsonify({'error': 'At least one location is required'}), 400
+        if len(points) > app.config['ELEVATION_MAX_POINTS']:
+            return jsonify({'error': f"At most {app.config['ELEVATION_MAX_POINTS']} locations per request"}), 400
+        if any(len(point) != 2 or not -90 <= point[0] <= 90 or not -180 <= point[1] <= 180 for point in points):
+            return jsonify({'error': 'Invalid coordinates'}), 400
+        
+        elevations = elevation_service.lookup(points)
+        
+        return jsonify({'results': [
+            {'latitude': lat, 'longitude': lng, 'elevation': elevation}
+            for (lat, lng), elevation in zip(points, elevations)
+        ]})
+        
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid locations'}), 400
+    except Exception as e:
+        logger.error(f"Error fetching elevations: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to fetch elevations'}), 500
+
+@app.route('/api/email-queue/metrics', methods=['GET'])
+def get_email_queue_metrics():
+    """Outbound email queue depth and delivery latency (admin endpoint)"""
+    try:
+        return jsonify(email_queue.get_metrics())
+    except Exception as e:
+        logger.error(f"Error fetching email queue metrics: {str(e)}")
+        return jsonify({'error': 'Failed to fetch email queue metrics'}), 500
+
+@app.route('/api/cache/metrics', methods=['GET'])
+def get_cache_metrics():
+    """Response cache hit ratio per endpoint (admin endpoint)"""
+    try:
+        return jsonify(response_cache.get_metrics())
+    except Exception as e:
+        logger.error(f"Error fetching cache metrics: {str(e)}")
+        return jsonify({'error': 'Failed to fetch cache metrics'}), 500
+
+@app.cli.command('drain-email-queue')
+def drain_email_queue():
+    """Deliver all due queued emails and exit"""
+    processed = email_queue.drain()
+    print(f"Processed {processed} queued emails")
+
+@app.cli.command('send-newsletter')
+@click.option('--subject', help='Subject line for a new campaign')
+@click.option('--body-file', type=click.File('r'), help='Jinja2 template for the message body')
+@click.option('--html', is_flag=True, help='Send the body as HTML')
+@click.option('--resume', 'resume_id', help='Resume an existing campaign by campaign_id')
+def send_newsletter(subject, body_file, html, resume_id):
+    """Send a newsletter campaign to all active subscribers (or retry a partial one with --resume)"""
+    if not email_service.is_configured:
+        raise click.ClickException('Email delivery is not configured (set MAIL_USERNAME and MAIL_PASSWORD)')
+    if resume_id:
+        campaign_id = resume_id
+    else:
+        if not subject or not body_file:
+            raise click.UsageError('--subject and --body-file are required for a new campaign')
+        body = body_file.read()
+        try:
+            NewsletterSender.compile(body, html)
+        except TemplateSyntaxError as e:
+            raise click.UsageError(f'Invalid body template: {e.message} (line {e.lineno})')
+        campaign = NewsletterCampaign(subject=subject, body_template=body, is_html=html)
+        db.session.add(campaign)
+        db.session.commit()
+        campaign_id = campaign.campaign_id
+        print(f"Created campaign {campaign_id}")
+    
+    campaign = newsletter_sender.run(campaign_id)
+    print(f"Campaign {campaign_id} {campaign.status}: {campaign.sent_count} sent, {campaign.failed_count} failed")
+
+@app.cli.command('export-incidents')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'export_format', type=click.Choice(['parquet', 'csv']), default='parquet')
+@click.option('--since', type=click.DateTime(), help='Only reports created at or after this time')
+@click.option('--status', help='Only reports with this status')
+def export_incidents_command(output, export_format, since, status):
+    """Export incident reports to a Parquet (one row group per chunk) or CSV file"""
+    if export_format == 'parquet':
+        count = incident_exporter.write_parquet(output, since, status)
+    else:
+        count = incident_exporter.write_csv(output, since, status)
+    print(f"Exported {count} incident reports to {output}")
+
+@app.cli.command('rebuild-incident-stats')
+def rebuild_incident_stats():
+    """Recompute the incident_stats rollup from incident_reports"""
+    rows = incident_stats.rebuild()
+    print(f"Rebuilt incident stats: {rows} rollup rows")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create the incident search index if needed and refill it from every report"""
+    count = incident_search.rebuild()
+    print(f"Indexed {count} incident reports ({incident_search.backend})")
+
+@app.cli.command('cluster-incidents')
+def cluster_incidents():
+    """Rebuild the disaster_events table from every incident report"""
+    events = incident_clusterer.recluster()
+    print(f"Clustered incident reports into {events} events")
+
+@app.cli.command('plan-district-kits')
+@click.argument('census', type=click.Path(exists=True, dir_okay=False))
+@click.option('--disaster-type', help='Disaster type for households without one')
+@click.option('--duration', type=click.IntRange(min=1), default=7, help='Kit duration in days for households without one')
+@click.option('--budget', type=click.Choice(['basic', 'standard', 'premium']), default='standard')
+def plan_district_kits_command(census, disaster_type, duration, budget):
+    """Print total kit supplies and cost for a household census CSV as JSON"""
+    plan = district_kit_planner.plan(
+        district_kit_planner.read_csv(census), disaster_type=disaster_type, kit_duration=duration, budget_range=budget
+    )
+    print(json.dumps(plan, indent=2, ensure_ascii=False))
+
+@app.cli.command('compact-emergency-kits')
+def compact_emergency_kits():
+    """Move inline kit bodies of older EmergencyKit rows into the shared content store"""
+    moved = kit_store.compact()
+    print(f"Moved {moved} emergency kit bodies into the content store")
+
+@app.cli.command('purge-stale-uploads')
+@click.option('--hours', type=int, default=None, help='Age in hours (default MEDIA_UPLOAD_STALE_HOURS)')
+def purge_stale_uploads(hours):
+    """Delete unfinished media uploads that have not progressed recently"""
+    hours = hours if hours is not None else app.config['MEDIA_UPLOAD_STALE_HOURS']
+    purged = media_uploads.purge_stale(timedelta(hours=hours))
+    print(f"Purged {purged} stale uploads")
+
+@app.cli.command('process-media')
+@click.option('--report-id', default=None, help='Only this incident report')
+def process_media(report_id):
+    """Create variants for stored media that has none yet and strip its metadata"""
+    query = IncidentReport.query.filter(IncidentReport.media_files.isnot(None))
+    if report_id:
+        query = query.filter_by(report_id=report_id)
+    futures = []
+    for report in query.yield_per(500):
+        for item in report.media_files or []:
+            if isinstance(item, str) and media_pipeline.handles(item):
+                if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], item)):
+                    # Content-addressed files were stripped when they were stored
+                    futures.append(media_pipeline.submit(report.report_id, item, strip='/' not in item))
+    for future in filter(None, futures):
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Error processing media: {str(e)}")
+    media_pipeline.stop()
+    metrics = media_pipeline.get_metrics()
+    print(f"Processed {metrics['processed']} media files ({metrics['failed']} failed, "
+          f"{metrics['located']} reports located from GPS tags)")
+
+@app.cli.command('dedupe-media')
+def dedupe_media():
+    """Move media attached before content-addressed storage into it, dropping byte-identical copies"""
+    counts = media_store.adopt_legacy()
+    metrics = media_store.get_metrics()
+    print(f"Moved {counts['files']} files into the store ({counts['deduplicated']} were duplicates, "
+          f"{metrics['bytes_saved'] / 1024 ** 2:.1f} MB freed, {counts['missing']} missing)")
+
+@app.cli.command('benchmark-media-index')
+@click.option('--hashes', 'total', type=int, default=1000000, help='Stored hashes')
+@click.option('--queries', type=int, default=1000, help='Lookups to time')
+@click.option('--radius', type=int, default=None, help='Hamming radius (default MEDIA_DUPLICATE_RADIUS)')
+def benchmark_media_index(total, queries, radius):
+    """Time Hamming-radius lookups in the multi-index table against a full NumPy scan"""
+    import time
+    import numpy as np
+    
+    radius = radius if radius is not None else app.config['MEDIA_DUPLICATE_RADIUS']
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 64, total, dtype=np.uint64)
+    # Queries are stored hashes with a few bits flipped, like a re-encoded copy
+    flips = [rng.choice(64, rng.integers(0, radius + 1), replace=False) for _ in range(queries)]
+    targets = [int(hashes[i]) ^ sum(1 << int(bit) for bit in bits) for i, bits in zip(rng.integers(0, total, queries), flips)]
+    
+    started = time.monotonic()
+    index = HammingIndex()
+    index.add_many(np.arange(total), hashes)
+    build = time.monotonic() - started
+    
+    started = time.monotonic()
+    found = [index.search(target, radius) for target in targets]
+    indexed = (time.monotonic() - started) / queries
+    
+    sample = targets[:min(queries, 100)]
+    started = time.monotonic()
+    scanned = [np.flatnonzero(np.bitwise_count(hashes ^ np.uint64(target)) <= radius) for target in sample]
+    scan = (time.monotonic() - started) / len(sample)
+    assert all(sorted(value for _, value in hits) == rows.tolist() for hits, rows in zip(found, scanned))
+    
+    print(f"{total} hashes, radius {radius}: build {build:.2f} s, "
+          f"lookup {indexed * 1000:.3f} ms (full scan {scan * 1000:.2f} ms, {scan / indexed:.0f}x)")
+
+@app.cli.command('benchmark-classifier')
+@click.option('--requests', 'total', type=int, default=512, help='Images to classify')
+@click.option('--concurrency', type=int, default=32, help='Concurrent callers')
+@click.option('--trained', is_flag=True, help='Use the trained model instead of a random stand-in')
+def benchmark_classifier(total, concurrency, trained):
+    """Compare one-at-a-time inference with micro-batching on synthetic images"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import numpy as np
+    from PIL import Image
+    
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(16):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+        images.append(buffer.getvalue())
+    
+    model = classes = None
+    if not trained:
+        model, classes = ImageClassifier.stand_in_model(4), ['flood', 'fire', 'earthquake', 'normal']
+    
+    for max_batch in (1, app.config['CLASSIFIER_MAX_BATCH']):
+        classifier = ImageClassifier(app, db)
+        classifier.max_batch = max_batch
+        classifier.start(model, classes)
+        classifier.classify(images[:4])  # warm up
+        classifier._latencies.clear()
+        classifier._batch_sizes.clear()
+        
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as callers:
+            list(callers.map(lambda i: classifier.submit(images[i % len(images)]).result(), range(total)))
+        elapsed = time.monotonic() - started
+        metrics = classifier.get_metrics()
+        classifier.stop()
+        print(f"max_batch={max_batch:<3} {total / elapsed:7.1f} images/s  mean batch {metrics['mean_batch_size']}  "
+              f"p50 {metrics['latency_ms_p50']} ms  p95 {metrics['latency_ms_p95']} ms  p99 {metrics['latency_ms_p99']} ms")
+
+@app.cli.command('benchmark-safe-spots')
+@click.option('--spots', 'sizes', type=int, multiple=True, default=(10000, 100000, 1000000),
+              help='Indexed safe spots; repeat for several sizes (default 10k, 100k and 1M)')
+@click.option('--queries', type=int, default=500, help='Lookups to time per size')
+@click.option('--radius', type=float, default=5.0, help='Search radius in km')
+@click.option('--k', type=int, default=10, help='Nearest spots per lookup')
+def benchmark_safe_spots(sizes, queries, radius, k):
+    """Time radius and k-nearest lookups in SafeSpotIndex against a full NumPy scan"""
+    import time
+    import numpy as np
+    from geo import haversine_km
+    
+    spot_types = ['hospital', 'shelter', 'school', 'police']
+    for total in sizes:
+        rng = np.random.default_rng(0)
+        # Spots cluster around a few cities, like the Overpass data does
+        centers = rng.uniform((8, 68), (32, 92), (20, 2))
+        points = centers[rng.integers(0, len(centers), total)] + rng.normal(0, 0.3, (total, 2))
+        lats, lons = points[:, 0], points[:, 1]
+        targets = [(lats[i] + rng.normal(0, 0.05), lons[i] + rng.normal(0, 0.05)) for i in rng.integers(0, total, queries)]
+        
+        started = time.monotonic()
+        index = SafeSpotIndex()
+        index.cell_deg = app.config['SAFE_SPOT_INDEX_CELL_DEG']
+        index.build((i, lats[i], lons[i], spot_types[i % len(spot_types)], None) for i in range(total))
+        build = time.monotonic() - started
+        
+        timings = {}
+        for label, kwargs in (('radius', {'radius_km': radius}), ('k-nearest', {'k': k})):
+            started = time.monotonic()
+            found = [index.query(lat, lon, **kwargs) for lat, lon in targets]
+            indexed = (time.monotonic() - started) / queries
+            
+            started = time.monotonic()
+            scanned = []
+            for lat, lon in targets:
+                distances = haversine_km(lat, lon, lats, lons)
+                # Only the matches are sorted, as a tuned scan would
+                rows = np.flatnonzero(distances <= radius) if label == 'radius' else np.argpartition(distances, min(k, total - 1))[:k]
+                scanned.append(rows[np.lexsort((rows, distances[rows]))])
+            scan = (time.monotonic() - started) / queries
+            assert all([spot_id for spot_id, _ in hits] == rows.tolist() for hits, rows in zip(found, scanned))
+            timings[label] = (indexed, scan)
+        
+        print(f"{total} spots: build {build:.2f} s")
+        for label, (indexed, scan) in timings.items():
+            print(f"  {label:<9} lookup {indexed * 1000:.3f} ms (full scan {scan * 1000:.2f} ms, {scan / indexed:.0f}x)")
+
+@app.cli.command('benchmark-haversine')
+@click.option('--points', 'total', type=int, default=100000, help='Points ranked from one origin')
+@click.option('--origins', type=int, default=500, help='Rows of the pairwise distance matrix')
+def benchmark_haversine(total, origins):
+    """Time the NumPy haversine kernels against a scalar math loop"""
+    import math
+    import time
+    import numpy as np
+    from geo import EARTH_RADIUS_KM, haversine_km, pairwise_haversine_km
+    
+    def scalar_km(lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+    
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(-60, 60, total), rng.uniform(-180, 180, total)
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+    
+    started = time.monotonic()
+    vectorized = haversine_km(19.07, 72.87, lats, lons)
+    one_to_many = time.monotonic() - started
+    started = time.monotonic()
+    scalar = [scalar_km(19.07, 72.87, lat, lon) for lat, lon in zip(lat_list, lon_list)]
+    one_to_many_scalar = time.monotonic() - started
+    assert np.allclose(vectorized, scalar)
+    
+    others = min(total, 2000)
+    started = time.monotonic()
+    matrix = pairwise_haversine_km(lats[:origins], lons[:origins], lats[:others], lons[:others])
+    pairwise = time.monotonic() - started
+    started = time.monotonic()
+    rows = [[scalar_km(lat_list[i], lon_list[i], lat_list[j], lon_list[j]) for j in range(others)] for i in range(origins)]
+    pairwise_scalar = time.monotonic() - started
+    assert np.allclose(matrix, rows)
+    
+    print(f"1 x {total}: {one_to_many * 1000:.2f} ms (scalar loop {one_to_many_scalar * 1000:.1f} ms, "
+          f"{one_to_many_scalar / one_to_many:.0f}x)")
+    print(f"{origins} x {others}: {pairwise * 1000:.2f} ms (scalar loop {pairwise_scalar * 1000:.1f} ms, "
+          f"{pairwise_scalar / pairwise:.0f}x)")
+
+@app.cli.command('benchmark-pagination')
+@click.option('--rows', 'total', type=int, default=200000, help='Incident reports in the scratch database')
+@click.option('--per-page', type=int, default=50, help='Rows per page')
+@click.option('--repeat', type=int, default=20, help='Fetches timed per page depth')
+def benchmark_pagination(total, per_page, repeat):
+    """Time deep /api/incidents pages with keyset cursors against OFFSET in a scratch SQLite database"""
+    import tempfile
+    import time
+    from sqlalchemy import create_engine, insert, select
+    
+    table = IncidentReport.__table__
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = create_engine(f"sqlite:///{os.path.join(scratch, 'pagination.db')}")
+        table.create(engine)
+        started_at = datetime(2024, 1, 1)
+        with engine.begin() as connection:
+            for start in range(0, total, 10000):
+                connection.execute(insert(table), [{
+                    'report_id': str(uuid.uuid4()), 'email': 'bench@example.org', 'incident_type': 'flood',
+                    'location': 'Bench', 'description': 'Benchmark report', 'consent': True, 'status': 'pending',
+                    'created_at': started_at + timedelta(seconds=i // 3), 'updated_at': started_at
+                } for i in range(start, min(start + 10000, total))])
+        
+        # Same shape as /api/incidents?fields=report_id,status; several rows share a created_at
+        query = select(table.c.report_id, table.c.status, table.c.created_at, table.c.id).order_by(
+            table.c.created_at.desc(), table.c.id.desc()
+        )
+        print(f"{total} reports, {per_page} per page")
+        with engine.connect() as connection:
+            for page in (1, 10, 100, 1000, total // per_page):
+                offset = (page - 1) * per_page
+                if offset >= total:
+                    continue
+                previous = connection.execute(query.offset(offset - 1).limit(1)).one() if offset else None
+                keyset = query if previous is None else query.where(
+                    tuple_(table.c.created_at, table.c.id) < (previous.created_at, previous.id)
+                )
+                
+                started = time.monotonic()
+                for _ in range(repeat):
+                    by_offset = connection.execute(query.offset(offset).limit(per_page + 1)).all()
+                offset_seconds = (time.monotonic() - started) / repeat
+                
+                started = time.monotonic()
+                for _ in range(repeat):
+                    by_cursor = connection.execute(keyset.limit(per_page + 1)).all()
+                cursor_seconds = (time.monotonic() - started) / repeat
+                assert by_offset == by_cursor
+                
+                print(f"page {page:>6}: cursor {cursor_seconds * 1000:.2f} ms, offset {offset_seconds * 1000:.2f} ms "
+                      f"({offset_seconds / cursor_seconds:.0f}x)")
+        engine.dispose()
+
+@app.cli.command('benchmark-bulk-ingest')
+@click.option('--reports', 'total', type=int, default=50000, help='Reports in the batch')
+@click.option('--no-clustering', is_flag=True, help='Skip placing the reports in events afterwards')
+@click.option('--no-search-index', is_flag=True, help='Drop the FTS5 sync triggers first, to see what they cost')
+def benchmark_bulk_ingest(total, no_clustering, no_search_index):
+    """Time IncidentBulkIngestor on one synthetic batch against a scratch SQLite database
+    
+    Event placement runs in the background after each batch commits, so it
+    is timed separately, the way the placement worker runs it.
+    """
+    import random
+    import tempfile
+    import time
+    
+    rng = random.Random(0)
+    types = ['flood', 'fire', 'earthquake', 'cyclone', 'landslide']
+    records = [{
+        'email': f"reporter{i}@example.org", 'incident_type': rng.choice(types), 'location': f"Ward {i % 500}",
+        'latitude': round(rng.uniform(18.9, 19.3), 5), 'longitude': round(rng.uniform(72.8, 73.1), 5),
+        'datetime': f"2024-07-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00Z",
+        'description': f"Water rising near ward {i % 500}, road {i % 37} blocked", 'consent': i % 3 != 0
+    } for i in range(total)]
+    for i in range(0, total, 50):
+        records[i]['email'] = 'not-an-email'  # 2% rejected, as partner feeds send some bad rows
+    payload = json.dumps(records)
+    
+    with tempfile.TemporaryDirectory() as scratch:
+        bench_app = Flask(__name__)
+        bench_app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(scratch, 'ingest.db')}",
+            SQLALCHEMY_TRACK_MODIFICATIONS=False, EMAIL_QUEUE_WORKERS=0
+        )
+        db.init_app(bench_app)
+        with bench_app.app_context():
+            db.create_all()
+            if no_search_index:
+                for trigger in ('ai', 'ad', 'au'):
+                    db.session.connection().exec_driver_sql(f"DROP TRIGGER IF EXISTS {IncidentSearchIndex.TABLE}_{trigger}")
+                db.session.commit()
+            # No clusterer: its worker would place reports in the app's own database
+            ingestor = IncidentBulkIngestor(
+                db, EmailQueue(bench_app, db, email_service), chunk_size=app.config['INCIDENT_BULK_CHUNK_SIZE'],
+                stats=incident_stats, events=incident_events, search=incident_search
+            )
+            
+            started = time.monotonic()
+            parsed = json.loads(payload)
+            parse = time.monotonic() - started
+            
+            started = time.monotonic()
+            ingestor.validate(parsed)
+            validate = time.monotonic() - started
+            
+            started = time.monotonic()
+            results = ingestor.ingest(parsed)
+            ingest = time.monotonic() - started
+            
+            created = sum(1 for result in results if result['success'])
+            assert db.session.query(db.func.count(IncidentReport.id)).scalar() == created
+            
+            placement = None
+            if not no_clustering and incident_clusterer.enabled:
+                started = time.monotonic()
+                while incident_clusterer.place_pending():
+                    pass
+                placement = time.monotonic() - started
+                events = db.session.query(db.func.count(DisasterEvent.id)).scalar()
+            db.session.remove()
+            db.engine.dispose()
+    
+    print(f"{total} reports ({created} valid), chunks of {ingestor.chunk_size}, "
+          f"search index {'off' if no_search_index else 'on'}: parse {parse:.2f} s, validate {validate:.2f} s, "
+          f"ingest {ingest:.2f} s ({total / ingest:,.0f} reports/s, {total / (parse + ingest):,.0f} reports/s with parsing)")
+    if placement is not None:
+        print(f"event placement (background): {placement:.2f} s ({created / placement:,.0f} reports/s, {events} events)")
+
+@app.cli.command('benchmark-incident-stats')
+@click.option('--reports', 'total', type=int, default=200000, help='Incident reports in the scratch database')
+@click.option('--days', type=int, default=30, help='Days the reports are spread over')
+@click.option('--repeat', type=int, default=10, help='Runs timed per query')
+def benchmark_incident_stats(total, days, repeat):
+    """Time dashboard counts from the incident_stats rollup against a live GROUP BY in a scratch SQLite database"""
+    import random
+    import tempfile
+    import time
+    from sqlalchemy import insert
+    
+    rng = random.Random(0)
+    types = ['flood', 'fire', 'earthquake', 'cyclone', 'landslide']
+    # Most reports stay pending at medium priority; each city sits inside one rollup cell
+    statuses, status_weights = ['pending', 'verified', 'resolved'], [70, 20, 10]
+    priorities, priority_weights = ['low', 'medium', 'high', 'critical'], [15, 60, 20, 5]
+    cities = [(rng.randrange(8, 32) + 0.5, rng.randrange(68, 92) + 0.5) for _ in range(24)]
+    ended_at = datetime(2024, 8, 1)
+    
+    with tempfile.TemporaryDirectory() as scratch:
+        bench_app = Flask(__name__)
+        bench_app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(scratch, 'stats.db')}", SQLALCHEMY_TRACK_MODIFICATIONS=False
+        )
+        db.init_app(bench_app)
+        with bench_app.app_context():
+            db.create_all()
+            for start in range(0, total, 10000):
+                rows = []
+                for i in range(start, min(start + 10000, total)):
+                    latitude, longitude = rng.choice(cities)
+                    created_at = ended_at - timedelta(seconds=rng.uniform(0, days * 86400))
+                    rows.append({
+                        'report_id': str(uuid.uuid4()), 'email': 'bench@example.org', 'incident_type': rng.choice(types),
+                        'location': 'Bench', 'latitude': latitude + rng.uniform(-0.4, 0.4),
+                        'longitude': longitude + rng.uniform(-0.4, 0.4), 'description': 'Benchmark report',
+                        'consent': True, 'status': rng.choices(statuses, status_weights)[0],
+                        'priority': rng.choices(priorities, priority_weights)[0],
+                        'created_at': created_at, 'updated_at': created_at
+                    })
+                db.session.execute(insert(IncidentReport.__table__), rows)
+            db.session.commit()
+            rollup_rows = incident_stats.rebuild()
+            
+            def live(since=None):
+                """The same totals grouped from incident_reports"""
+                query = db.session.query(
+                    IncidentReport.incident_type, IncidentReport.status, IncidentReport.priority,
+                    db.func.count(IncidentReport.id)
+                )
+                if since:
+                    query = query.filter(IncidentReport.created_at >= since)
+                summary = {'total': 0, 'by_type': {}, 'by_status': {}, 'by_priority': {}}
+                for incident_type, status, priority, count in query.group_by(
+                    IncidentReport.incident_type, IncidentReport.status, IncidentReport.priority
+                ):
+                    summary['total'] += count
+                    for bucket, value in (('by_type', incident_type), ('by_status', status), ('by_priority', priority)):
+                        summary[bucket][value] = summary[bucket].get(value, 0) + count
+                return summary
+            
+            print(f"{total} reports over {days} days, {rollup_rows} rollup rows")
+            for label, since in (('all time', None), ('last 7 days', ended_at - timedelta(days=7))):
+                started = time.monotonic()
+                for _ in range(repeat):
+                    from_rollup = incident_stats.summary(since)
+                rollup_seconds = (time.monotonic() - started) / repeat
+                
+                started = time.monotonic()
+                for _ in range(repeat):
+                    grouped = live(since)
+                live_seconds = (time.monotonic() - started) / repeat
+                assert from_rollup == grouped
+                
+                print(f"{label:<11}: rollup {rollup_seconds * 1000:.1f} ms, live GROUP BY {live_seconds * 1000:.1f} ms "
+                      f"({live_seconds / rollup_seconds:.1f}x)")
+            db.session.remove()
+            db.engine.dispose()
+
+@app.cli.command('benchmark-serialization')
+@click.option('--rows', 'total', type=int, default=10000, help='Incident reports serialized per run')
+@click.option('--repeat', type=int, default=5, help='Runs timed per path')
+def benchmark_serialization(total, repeat):
+    """Time an /api/incidents body built from to_dict() and the stdlib encoder against ModelSerializer rows and orjson"""
+    import tempfile
+    import time
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy import insert
+    from utils import orjson
+    
+    started_at = datetime(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as scratch:
+        bench_app = Flask(__name__)
+        bench_app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(scratch, 'serialization.db')}",
+            SQLALCHEMY_TRACK_MODIFICATIONS=False
+        )
+        db.init_app(bench_app)
+        stdlib_json, fast_json = DefaultJSONProvider(bench_app), FastJSONProvider(bench_app)
+        with bench_app.app_context():
+            db.create_all()
+            db.session.execute(insert(IncidentReport.__table__), [{
+                'report_id': str(uuid.uuid4()), 'email': f"reporter{i}@example.org", 'incident_type': 'flood',
+                'location': f"Ward {i % 500}", 'latitude': 19.0 + i * 1e-5, 'longitude': 72.8 + i * 1e-5,
+                'datetime_occurred': started_at + timedelta(minutes=i), 'description': f"Water rising near ward {i % 500}",
+                'media_files': [f"{i}.jpg"] if i % 4 == 0 else None, 'consent': True, 'status': 'pending',
+                'priority': 'medium', 'created_at': started_at + timedelta(minutes=i),
+                'updated_at': started_at + timedelta(minutes=i)
+            } for i in range(total)])
+            db.session.commit()
+            serializer = ModelSerializer.for_model(IncidentReport, IncidentReport.API_FIELDS, empty_lists=('media_files',))
+            
+            def timed(build, provider):
+                """Best of ``repeat`` runs of building the body; (load seconds, encode seconds, body)"""
+                best = None
+                for _ in range(repeat):
+                    db.session.expunge_all()
+                    started = time.monotonic()
+                    items = build()
+                    loaded = time.monotonic()
+                    body = provider.response({'incidents': items}).get_data()
+                    run = (loaded - started, time.monotonic() - loaded, body)
+                    if best is None or sum(run[:2]) < sum(best[:2]):
+                        best = run
+                return best
+            
+            def from_models():
+                return [report.to_dict() for report in IncidentReport.query.order_by(IncidentReport.id)]
+            
+            def from_rows():
+                return serializer.rows(db.session.query(*serializer.columns).order_by(IncidentReport.id))
+            
+            models_load, models_encode, models_body = timed(from_models, stdlib_json)
+            rows_load, rows_encode, rows_body = timed(from_rows, fast_json)
+            assert json.loads(models_body) == json.loads(rows_body)
+            db.session.remove()
+            db.engine.dispose()
+    
+    encoder = 'orjson' if orjson is not None else 'stdlib json (orjson is not installed)'
+    print(f"{total} reports, best of {repeat}")
+    print(f"to_dict() + stdlib json: load {models_load * 1000:.0f} ms, encode {models_encode * 1000:.0f} ms, "
+          f"total {(models_load + models_encode) * 1000:.0f} ms")
+    print(f"ModelSerializer rows + {encoder}: load {rows_load * 1000:.0f} ms, encode {rows_encode * 1000:.0f} ms, "
+          f"total {(rows_load + rows_encode) * 1000:.0f} ms "
+          f"({(models_load + models_encode) / (rows_load + rows_encode):.1f}x)")
+
+@app.cli.command('benchmark-email-pool')
+@click.option('--messages', 'total', type=int, default=100, help='Messages sent per run')
+@click.option('--greeting-delay', type=float, default=5.0, help='Milliseconds the stand-in server waits before greeting')
+def benchmark_email_pool(total, greeting_delay):
+    """Time one EmailService batch over a pooled connection against a new SMTP session per message"""
+    import socketserver
+    import threading
+    import time
+    
+    class SinkHandler(socketserver.StreamRequestHandler):
+        """Accepts every command and drops the messages, after a connection setup delay"""
+        
+        def handle(self):
+            self.server.connections += 1
+            time.sleep(greeting_delay / 1000)  # stands in for the TCP, TLS and greeting round trips
+            self.wfile.write(b"220 sink ESMTP\r\n")
+            for line in self.rfile:
+                verb = line.split(b' ', 1)[0].strip().upper()
+                if verb in (b'EHLO', b'HELO'):
+                    self.wfile.write(b"250-sink\r\n250-AUTH PLAIN\r\n250 OK\r\n")
+                elif verb == b'AUTH':
+                    self.wfile.write(b"235 Authenticated\r\n")
+                elif verb == b'DATA':
+                    self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    while self.rfile.readline() not in (b".\r\n", b""):
+                        pass
+                    self.wfile.write(b"250 Queued\r\n")
+                elif verb == b'QUIT':
+                    self.wfile.write(b"221 Bye\r\n")
+                    return
+                else:
+                    self.wfile.write(b"250 OK\r\n")
+    
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SinkHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    messages = [(f"reporter{i}@example.org", "Incident update", f"Update {i}", False) for i in range(total)]
+    timings = {}
+    try:
+        for label, per_connection in (('pooled', total), ('one session per message', 1)):
+            bench_app = Flask(__name__)
+            bench_app.config.update(
+                MAIL_SERVER='127.0.0.1', MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False,
+                MAIL_USERNAME='sender@example.org', MAIL_PASSWORD='secret', MAIL_TIMEOUT=5,
+                MAIL_MAX_MESSAGES_PER_CONNECTION=per_connection
+            )
+            service = EmailService(bench_app)
+            connections = server.connections
+            started = time.monotonic()
+            assert service.send_bulk(messages) == [None] * total
+            timings[label] = (time.monotonic() - started, server.connections - connections)
+    finally:
+        server.shutdown()
+        server.server_close()
+    
+    pooled = timings['pooled'][0]
+    print(f"{total} messages, {greeting_delay:g} ms connection setup")
+    for label, (seconds, connections) in timings.items():
+        print(f"{label:<23} {seconds * 1000:.0f} ms, SMTP sessions opened: {connections} ({seconds / pooled:.1f}x)")
+
 # Health check endpoint
 @app.route('/health')
 def health_check():
@@ -14,6 +14,20 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 25 * 1024 * 1024  # 25MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
+    MEDIA_UPLOAD_MAX_BYTES = int(os.environ.get('MEDIA_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))  # whole resumable upload
+    MEDIA_UPLOAD_MAX_CHUNK = int(os.environ.get('MEDIA_UPLOAD_MAX_CHUNK', 32 * 1024 * 1024))  # per PATCH request
+    MEDIA_UPLOAD_STALE_HOURS = int(os.environ.get('MEDIA_UPLOAD_STALE_HOURS', 24))
+    MEDIA_DUPLICATE_RADIUS = int(os.environ.get('MEDIA_DUPLICATE_RADIUS', 8))  # perceptual hash bits out of 64
+    
+    # Media pipeline settings (thumbnails, web variants, metadata stripping)
+    MEDIA_PIPELINE_ENABLED = os.environ.get('MEDIA_PIPELINE_ENABLED', 'True').lower() == 'true'
+    MEDIA_PIPELINE_WORKERS = int(os.environ.get('MEDIA_PIPELINE_WORKERS', 2))
+    MEDIA_THUMBNAIL_SIZE = int(os.environ.get('MEDIA_THUMBNAIL_SIZE', 320))
+    MEDIA_WEB_MAX_SIZE = int(os.environ.get('MEDIA_WEB_MAX_SIZE', 1600))
+    MEDIA_JPEG_QUALITY = int(os.environ.get('MEDIA_JPEG_QUALITY', 82))
+    MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 86400))
+    FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+    FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
     
     # Email settings
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -21,9 +35,87 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE', 4))
+    MAIL_POOL_IDLE_TIMEOUT = int(os.environ.get('MAIL_POOL_IDLE_TIMEOUT', 60))
+    MAIL_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100))
+    
+    # Outbound email queue settings
+    EMAIL_QUEUE_WORKERS = int(os.environ.get('EMAIL_QUEUE_WORKERS', 2))
+    EMAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get('EMAIL_QUEUE_MAX_ATTEMPTS', 5))
+    EMAIL_QUEUE_BACKOFF_SECONDS = int(os.environ.get('EMAIL_QUEUE_BACKOFF_SECONDS', 30))
+    EMAIL_QUEUE_POLL_INTERVAL = int(os.environ.get('EMAIL_QUEUE_POLL_INTERVAL', 5))
+    EMAIL_QUEUE_BATCH_SIZE = int(os.environ.get('EMAIL_QUEUE_BATCH_SIZE', 50))
+    
+    # Bulk incident ingestion and export settings
+    INCIDENT_BULK_MAX_ROWS = int(os.environ.get('INCIDENT_BULK_MAX_ROWS', 50000))
+    INCIDENT_BULK_CHUNK_SIZE = int(os.environ.get('INCIDENT_BULK_CHUNK_SIZE', 5000))
+    INCIDENT_EXPORT_CHUNK_SIZE = int(os.environ.get('INCIDENT_EXPORT_CHUNK_SIZE', 5000))
+    
+    # Incident statistics rollup settings
+    INCIDENT_STATS_CELL_DEG = float(os.environ.get('INCIDENT_STATS_CELL_DEG', 1.0))  # ~110 km regions
+    
+    # Full-text search settings
+    INCIDENT_SEARCH_BACKEND = os.environ.get('INCIDENT_SEARCH_BACKEND', 'auto')  # auto, fts5 or terms
+    INCIDENT_SEARCH_MAX_RANKED = int(os.environ.get('INCIDENT_SEARCH_MAX_RANKED', 10000))
+    
+    # Event clustering settings
+    EVENT_CLUSTERING_ENABLED = os.environ.get('EVENT_CLUSTERING_ENABLED', 'True').lower() == 'true'
+    EVENT_RADIUS_KM = float(os.environ.get('EVENT_RADIUS_KM', 2.0))
+    EVENT_WINDOW_HOURS = float(os.environ.get('EVENT_WINDOW_HOURS', 24))
+    
+    # Live incident stream settings
+    INCIDENT_STREAM_BUFFER_SIZE = int(os.environ.get('INCIDENT_STREAM_BUFFER_SIZE', 1000))
+    INCIDENT_STREAM_HEARTBEAT = int(os.environ.get('INCIDENT_STREAM_HEARTBEAT', 15))  # seconds
+    
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # memory or redis
+    RESPONSE_CACHE_REDIS_URL = os.environ.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+    RESPONSE_CACHE_MAX_AGE = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 0))  # seconds before clients revalidate
+    
+    # Image classifier settings (model files exported from training.ipynb)
+    CLASSIFIER_MODEL_PATH = os.environ.get('CLASSIFIER_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier', 'best_model.pth'))
+    CLASSIFIER_CLASSES_PATH = os.environ.get('CLASSIFIER_CLASSES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier', 'classes.pkl'))
+    CLASSIFIER_MAX_BATCH = int(os.environ.get('CLASSIFIER_MAX_BATCH', 16))
+    CLASSIFIER_MAX_WAIT_MS = float(os.environ.get('CLASSIFIER_MAX_WAIT_MS', 10))
+    CLASSIFIER_THREADS = int(os.environ.get('CLASSIFIER_THREADS', 4))
+    CLASSIFIER_PREPROCESS_WORKERS = int(os.environ.get('CLASSIFIER_PREPROCESS_WORKERS', 4))
+    CLASSIFIER_TOP_K = int(os.environ.get('CLASSIFIER_TOP_K', 3))
+    CLASSIFIER_BATCH_MAX_IMAGES = int(os.environ.get('CLASSIFIER_BATCH_MAX_IMAGES', 64))
+    
+    # Emergency kit engine settings
+    EMERGENCY_KIT_CACHE_SIZE = int(os.environ.get('EMERGENCY_KIT_CACHE_SIZE', 4096))
+    EMERGENCY_KIT_BATCH_MAX = int(os.environ.get('EMERGENCY_KIT_BATCH_MAX', 10000))
+    
+    # Newsletter fan-out settings
+    NEWSLETTER_BATCH_SIZE = int(os.environ.get('NEWSLETTER_BATCH_SIZE', 500))
+    NEWSLETTER_CONCURRENCY = int(os.environ.get('NEWSLETTER_CONCURRENCY', 4))
+    PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000')
+    
+    # Spatial index settings
+    SAFE_SPOT_INDEX_CELL_DEG = float(os.environ.get('SAFE_SPOT_INDEX_CELL_DEG', 0.05))
+    WEATHER_ALERT_INDEX_CELL_DEG = float(os.environ.get('WEATHER_ALERT_INDEX_CELL_DEG', 0.5))
+    WEATHER_ALERT_DEFAULT_RADIUS_KM = float(os.environ.get('WEATHER_ALERT_DEFAULT_RADIUS_KM', 50))
+    
+    # Overpass (OpenStreetMap) proxy settings
+    OVERPASS_URL = os.environ.get('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+    OVERPASS_CACHE_DIR = os.environ.get('OVERPASS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'overpass'))
+    OVERPASS_TILE_ZOOM = int(os.environ.get('OVERPASS_TILE_ZOOM', 12))
+    OVERPASS_TILE_TTL = int(os.environ.get('OVERPASS_TILE_TTL', 7 * 24 * 3600))  # seconds
+    OVERPASS_REQUESTS_PER_MINUTE = int(os.environ.get('OVERPASS_REQUESTS_PER_MINUTE', 30))
+    
+    # Elevation lookup settings
+    ELEVATION_API_URL = os.environ.get('ELEVATION_API_URL', 'https://api.open-elevation.com/api/v1/lookup')
+    ELEVATION_GRID_DEG = float(os.environ.get('ELEVATION_GRID_DEG', 0.001))  # ~110 m cells
+    ELEVATION_MAX_POINTS = int(os.environ.get('ELEVATION_MAX_POINTS', 1000))
+    ELEVATION_REQUESTS_PER_MINUTE = int(os.environ.get('ELEVATION_REQUESTS_PER_MINUTE', 60))
     
     # API Keys
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
+    OPENWEATHER_CALLS_PER_MINUTE = int(os.environ.get('OPENWEATHER_CALLS_PER_MINUTE', 60))
+    OPENWEATHER_CACHE_TTL = int(os.environ.get('OPENWEATHER_CACHE_TTL', 600))  # seconds
+    OPENWEATHER_STALE_TTL = int(os.environ.get('OPENWEATHER_STALE_TTL', 3600))  # seconds
     GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
     
     @staticmethod
@@ -0,0 +1,502 @@
+"""
+Geospatial helpers and in-memory spatial indexes for DisasterSense Flask application
+"""
+
+import logging
+import math
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+def haversine_km(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Distances in kilometers from one origin to arrays of coordinates"""
+    lat_r = math.radians(lat)
+    lats_r = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lats_r - lat_r
+    dlon = np.radians(np.asarray(lons, dtype=np.float64)) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat_r) * np.cos(lats_r) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def iter_pairwise_haversine_km(lats1, lons1, lats2, lons2, 
+                               max_chunk_elements: int = 4_000_000) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (row_offset, block) slices of the N x M distance matrix.
+    
+    Each block covers as many rows as fit in ``max_chunk_elements`` cells, so
+    callers that reduce per row (nearest, counts within a radius) never hold
+    the full matrix in memory.
+    """
+    lats1_r = np.radians(np.asarray(lats1, dtype=np.float64))
+    lons1_r = np.radians(np.asarray(lons1, dtype=np.float64))
+    lats2_r = np.radians(np.asarray(lats2, dtype=np.float64))
+    lons2_r = np.radians(np.asarray(lons2, dtype=np.float64))
+    cos1 = np.cos(lats1_r)
+    cos2 = np.cos(lats2_r)
+    
+    rows_per_chunk = max(1, max_chunk_elements // max(len(lats2_r), 1))
+    for start in range(0, len(lats1_r), rows_per_chunk):
+        stop = start + rows_per_chunk
+        a = np.sin((lats2_r[None, :] - lats1_r[start:stop, None]) / 2) ** 2
+        a += cos1[start:stop, None] * cos2[None, :] * np.sin((lons2_r[None, :] - lons1_r[start:stop, None]) / 2) ** 2
+        np.minimum(a, 1.0, out=a)
+        np.sqrt(a, out=a)
+        np.arcsin(a, out=a)
+        a *= 2 * EARTH_RADIUS_KM
+        yield start, a
+
+def pairwise_haversine_km(lats1, lons1, lats2, lons2, max_chunk_elements: int = 4_000_000) -> np.ndarray:
+    """N x M matrix of distances in kilometers, computed in bounded-size chunks"""
+    out = np.empty((len(lats1), len(lats2)), dtype=np.float64)
+    for start, block in iter_pairwise_haversine_km(lats1, lons1, lats2, lons2, max_chunk_elements):
+        out[start:start + len(block)] = block
+    return out
+
+def cell_of(latitude: float, longitude: float, cell_deg: float) -> Tuple[int, int]:
+    """Grid cell (row, col) containing a coordinate"""
+    return int(math.floor(latitude / cell_deg)), int(math.floor(longitude / cell_deg))
+
+def cell_range(lat: float, lon: float, radius_km: float, cell_deg: float) -> Tuple[int, int, int, int]:
+    """(row_min, col_min, row_max, col_max) of the grid cells overlapping a circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)), 180)
+    row_min, col_min = cell_of(lat - dlat, lon - dlon, cell_deg)
+    row_max, col_max = cell_of(lat + dlat, lon + dlon, cell_deg)
+    return row_min, col_min, row_max, col_max
+
+def tile_xy(lat: float, lon: float, zoom: int) -> Tuple[int, int]:
+    """Slippy-map (x, y) tile containing a coordinate"""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bounds(x: int, y: int, zoom: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) bounds of a slippy-map tile"""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def tiles_covering(lat: float, lon: float, radius_km: float, zoom: int) -> List[Tuple[int, int]]:
+    """Slippy-map tiles overlapping the bounding box of a circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)), 180)
+    x_min, y_min = tile_xy(lat + dlat, lon - dlon, zoom)
+    x_max, y_max = tile_xy(lat - dlat, lon + dlon, zoom)
+    return [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+class CommittedChangeIndex:
+    """Base for in-memory indexes that mirror a table.
+    
+    Subclasses call ``_watch`` with a model and a snapshot function; inserts,
+    updates and deletes are collected per session and handed to ``_upsert``
+    and ``_remove`` only after the transaction commits.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._changes_key = f"{type(self).__name__}_{id(self)}_changes"
+    
+    def _watch(self, model, snapshot):
+        """Track committed changes to ``model`` rows"""
+        self._snapshot = snapshot
+        event.listen(model, 'after_insert', self._record_upsert)
+        event.listen(model, 'after_update', self._record_upsert)
+        event.listen(model, 'after_delete', self._record_delete)
+        event.listen(Session, 'after_commit', self._apply_pending)
+        event.listen(Session, 'after_rollback', self._discard_pending)
+    
+    def _load_rows(self) -> Iterable[tuple]:
+        raise NotImplementedError
+    
+    def _clear(self):
+        raise NotImplementedError
+    
+    def _upsert(self, *row):
+        raise NotImplementedError
+    
+    def _remove(self, key):
+        raise NotImplementedError
+    
+    def build(self, rows: Optional[Iterable[tuple]] = None):
+        """(Re)build the index from snapshot rows, reading the table when none are given"""
+        with self._lock:
+            self._clear()
+            for row in (rows if rows is not None else self._load_rows()):
+                self._upsert(*row)
+            self._built = True
+        logger.info(f"{type(self).__name__} built with {len(self)} entries")
+    
+    def ensure_built(self):
+        """Build from the database on first use"""
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+    
+    def _record_upsert(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(self._changes_key, []).append(('upsert', self._snapshot(target)))
+    
+    def _record_delete(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(self._changes_key, []).append(('delete', target.id))
+    
+    def _apply_pending(self, session):
+        changes = session.info.pop(self._changes_key, None)
+        if not changes:
+            return
+        with self._lock:
+            if not self._built:
+                return  # The first query will read the committed rows
+            for op, payload in changes:
+                if op == 'upsert':
+                    self._upsert(*payload)
+                else:
+                    self._remove(payload)
+    
+    def _discard_pending(self, session):
+        session.info.pop(self._changes_key, None)
+
+class SafeSpotIndex(CommittedChangeIndex):
+    """Grid-bucketed spatial index over the SafeSpot table.
+    
+    Coordinates live in flat NumPy arrays addressed by slot; each grid cell
+    holds the slots inside it. Queries gather the slots of the cells that
+    cover the search circle and run one vectorized haversine pass over them.
+    The index is built lazily from the table and kept current by applying
+    committed SafeSpot inserts, updates and deletes.
+    """
+    
+    def __init__(self, app=None, db=None):
+        super().__init__()
+        self.app = app
+        self.db = db
+        self.cell_deg = 0.05
+        self._clear()
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize spatial index and subscribe to SafeSpot changes"""
+        from models import SafeSpot
+        
+        self.app = app
+        self.db = db
+        self.cell_deg = app.config.get('SAFE_SPOT_INDEX_CELL_DEG', 0.05)
+        self._watch(SafeSpot, lambda spot: (spot.id, spot.latitude, spot.longitude, spot.spot_type, spot.disaster_types))
+    
+    def _clear(self):
+        """Allocate empty storage"""
+        capacity = 1024
+        self._lats = np.zeros(capacity, dtype=np.float64)
+        self._lons = np.zeros(capacity, dtype=np.float64)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._types = np.full(capacity, -1, dtype=np.int32)
+        self._disasters = np.zeros(capacity, dtype=np.int64)  # Bitmask of suitable disaster types, 0 = any
+        self._size = 0
+        self._free: List[int] = []
+        self._slot_by_id: Dict[int, int] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._type_codes: Dict[str, int] = {}
+        self._disaster_bits: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._slot_by_id)
+    
+    def _load_rows(self) -> Iterable[Tuple[int, float, float, str, Any]]:
+        from models import SafeSpot
+        
+        return self.db.session.query(
+            SafeSpot.id, SafeSpot.latitude, SafeSpot.longitude, SafeSpot.spot_type, SafeSpot.disaster_types
+        ).yield_per(10000)
+    
+    def upsert(self, spot_id: int, latitude: float, longitude: float, spot_type: str, disaster_types: Any = None):
+        """Insert or move a single spot"""
+        with self._lock:
+            self._upsert(spot_id, latitude, longitude, spot_type, disaster_types)
+    
+    def remove(self, spot_id: int):
+        """Remove a single spot"""
+        with self._lock:
+            self._remove(spot_id)
+    
+    def _remove(self, spot_id: int):
+        slot = self._slot_by_id.pop(spot_id, None)
+        if slot is None:
+            return
+        self._cells[cell_of(self._lats[slot], self._lons[slot], self.cell_deg)].remove(slot)
+        self._ids[slot] = -1
+        self._free.append(slot)
+    
+    def _upsert(self, spot_id, latitude, longitude, spot_type, disaster_types):
+        if spot_id in self._slot_by_id:
+            self._remove(spot_id)
+        if latitude is None or longitude is None:
+            return
+        
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self._lats):
+                self._grow()
+            slot = self._size
+            self._size += 1
+        
+        self._lats[slot] = latitude
+        self._lons[slot] = longitude
+        self._ids[slot] = spot_id
+        self._types[slot] = self._type_code(spot_type)
+        self._disasters[slot] = self._disaster_mask(disaster_types, create=True)
+        self._slot_by_id[spot_id] = slot
+        self._cells.setdefault(cell_of(latitude, longitude, self.cell_deg), []).append(slot)
+    
+    def _grow(self):
+        """Double slot capacity"""
+        capacity = len(self._lats) * 2
+        for name, fill in (('_lats', 0), ('_lons', 0), ('_ids', -1), ('_types', -1), ('_disasters', 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+    
+    def _type_code(self, spot_type: Optional[str]) -> int:
+        key = (spot_type or '').lower()
+        if key not in self._type_codes:
+            self._type_codes[key] = len(self._type_codes)
+        return self._type_codes[key]
+    
+    def _disaster_mask(self, disaster_types: Any, create: bool = False) -> int:
+        """Bitmask for a list of disaster types (bits are assigned on first sight)"""
+        mask = 0
+        for name in disaster_types or []:
+            key = str(name).lower()
+            if key not in self._disaster_bits:
+                if not create or len(self._disaster_bits) >= 63:
+                    continue
+                self._disaster_bits[key] = 1 << len(self._disaster_bits)
+            mask |= self._disaster_bits[key]
+        return mask
+    
+    # Queries
+    
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Slots in the grid cells overlapping the search circle"""
+        row_min, col_min, row_max, col_max = cell_range(lat, lon, radius_km, self.cell_deg)
+        
+        slots: List[int] = []
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+            # Circle covers more cells than are populated: walk the populated ones instead
+            for (row, col), cell_slots in self._cells.items():
+                if row_min <= row <= row_max and col_min <= col <= col_max:
+                    slots.extend(cell_slots)
+        else:
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    cell_slots = self._cells.get((row, col))
+                    if cell_slots:
+                        slots.extend(cell_slots)
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+    
+    def _filter(self, slots: np.ndarray, spot_type: Optional[str], disaster_type: Optional[str]) -> np.ndarray:
+        if spot_type:
+            code = self._type_codes.get(spot_type.lower())
+            if code is None:
+                return slots[:0]
+            slots = slots[self._types[slots] == code]
+        if disaster_type:
+            bit = self._disaster_mask([disaster_type])
+            masks = self._disasters[slots]
+            # Spots without declared disaster types are treated as general purpose
+            slots = slots[(masks == 0) | ((masks & bit) != 0)] if bit else slots[masks == 0]
+        return slots
+    
+    def query(self, lat: float, lon: float, radius_km: Optional[float] = None, k: Optional[int] = None,
+              spot_type: Optional[str] = None, disaster_type: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Nearest spots as (spot_id, distance_km), closest first.
+        
+        With ``radius_km`` only spots inside the circle are returned (at most
+        ``k`` of them when given). Without it, the k nearest spots are found by
+        growing the search radius until the k-th hit is provably closest.
+        """
+        self.ensure_built()
+        if radius_km is None and not k:
+            raise ValueError("Either radius_km or k is required")
+        
+        with self._lock:
+            if not self._slot_by_id or (spot_type and spot_type.lower() not in self._type_codes):
+                return []
+            
+            search_km = radius_km if radius_km is not None else self.cell_deg * KM_PER_DEGREE_LAT
+            while True:
+                slots = self._filter(self._candidates(lat, lon, search_km), spot_type, disaster_type)
+                distances = haversine_km(lat, lon, self._lats[slots], self._lons[slots])
+                within = distances <= search_km
+                if radius_km is not None or within.sum() >= k or search_km >= math.pi * EARTH_RADIUS_KM:
+                    break
+                search_km *= 2
+            
+            slots, distances = slots[within], distances[within]
+            if k and len(slots) > k:
+                nearest = np.argpartition(distances, k - 1)[:k]
+                slots, distances = slots[nearest], distances[nearest]
+            order = np.argsort(distances, kind='stable')
+            return [(int(self._ids[s]), float(d)) for s, d in zip(slots[order], distances[order])]
+
+class WeatherAlertIndex(CommittedChangeIndex):
+    """Grid index of active WeatherAlert circles for point-coverage lookups.
+    
+    Each alert is registered in every grid cell its circle overlaps, so a
+    lookup reads a single cell and checks only the alerts registered there.
+    Alerts without coordinates are treated as covering every point.
+    """
+    
+    def __init__(self, app=None, db=None):
+        super().__init__()
+        self.app = app
+        self.db = db
+        self.cell_deg = 0.5
+        self.default_radius_km = 50.0
+        self._clear()
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize alert index and subscribe to WeatherAlert changes"""
+        from models import WeatherAlert
+        
+        self.app = app
+        self.db = db
+        self.cell_deg = app.config.get('WEATHER_ALERT_INDEX_CELL_DEG', 0.5)
+        self.default_radius_km = app.config.get('WEATHER_ALERT_DEFAULT_RADIUS_KM', 50.0)
+        self._watch(WeatherAlert, lambda alert: (
+            alert.id, alert.latitude, alert.longitude, alert.radius_km,
+            alert.valid_from, alert.valid_until, alert.is_active
+        ))
+    
+    def _clear(self):
+        self._alerts: Dict[int, Tuple[Optional[float], Optional[float], float, datetime, datetime]] = {}
+        self._cells: Dict[Tuple[int, int], set] = {}
+        self._cells_by_alert: Dict[int, List[Tuple[int, int]]] = {}
+        self._global: set = set()
+        self._next_expiry: Optional[datetime] = None
+    
+    def __len__(self) -> int:
+        return len(self._alerts)
+    
+    def _load_rows(self) -> Iterable[tuple]:
+        from models import WeatherAlert
+        
+        return self.db.session.query(
+            WeatherAlert.id, WeatherAlert.latitude, WeatherAlert.longitude, WeatherAlert.radius_km,
+            WeatherAlert.valid_from, WeatherAlert.valid_until, WeatherAlert.is_active
+        ).filter(
+            WeatherAlert.is_active.is_(True),
+            WeatherAlert.valid_until > datetime.utcnow()
+        ).all()
+    
+    def _remove(self, alert_id: int):
+        if self._alerts.pop(alert_id, None) is None:
+            return
+        self._global.discard(alert_id)
+        for cell in self._cells_by_alert.pop(alert_id, []):
+            members = self._cells[cell]
+            members.discard(alert_id)
+            if not members:
+                del self._cells[cell]
+    
+    def _upsert(self, alert_id, latitude, longitude, radius_km, valid_from, valid_until, is_active):
+        self._remove(alert_id)
+        if not is_active or valid_until <= datetime.utcnow():
+            return
+        
+        radius_km = radius_km or self.default_radius_km
+        self._alerts[alert_id] = (latitude, longitude, radius_km, valid_from, valid_until)
+        if self._next_expiry is None or valid_until < self._next_expiry:
+            self._next_expiry = valid_until
+        
+        if latitude is None or longitude is None:
+            self._global.add(alert_id)
+            return
+        
+        row_min, col_min, row_max, col_max = cell_range(latitude, longitude, radius_km, self.cell_deg)
+        cells = [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(alert_id)
+        self._cells_by_alert[alert_id] = cells
+    
+    def _prune_expired(self, now: datetime):
+        """Drop alerts whose validity window has ended"""
+        if self._next_expiry is None or now < self._next_expiry:
+            return
+        for alert_id in [a for a, entry in self._alerts.items() if entry[4] <= now]:
+            self._remove(alert_id)
+        self._next_expiry = min((entry[4] for entry in self._alerts.values()), default=None)
+    
+    def covering(self, lat: float, lon: float, at: Optional[datetime] = None) -> List[Tuple[int, Optional[float]]]:
+        """Alerts in force at ``at`` whose circle covers the point, as (id, distance_km), nearest first"""
+        self.ensure_built()
+        at = at or datetime.utcnow()
+        
+        with self._lock:
+            self._prune_expired(datetime.utcnow())
+            candidates = [
+                alert_id for alert_id in self._cells.get(cell_of(lat, lon, self.cell_deg), ())
+                if self._alerts[alert_id][3] <= at
+            ]
+            covering_global = [
+                (alert_id, None) for alert_id in self._global if self._alerts[alert_id][3] <= at
+            ]
+            if not candidates:
+                return covering_global
+            
+            entries = [self._alerts[alert_id] for alert_id in candidates]
+            distances = haversine_km(lat, lon, [e[0] for e in entries], [e[1] for e in entries])
+            radii = np.array([e[2] for e in entries])
+            hits = sorted(
+                (float(d), alert_id) for alert_id, d, inside in zip(candidates, distances, distances <= radii) if inside
+            )
+            return [(alert_id, d) for d, alert_id in hits] + covering_global
+
+def rows_within(query, lat_column, lon_column, lat: float, lon: float, radius_km: float, 
+                chunk_size: int = 10000) -> Iterator[Tuple[Any, float]]:
+    """Stream (row, distance_km) for rows of ``query`` inside a circle.
+    
+    The query must select the latitude and longitude as its first two
+    columns. A bounding-box filter lets the database use its coordinate
+    indexes; the exact haversine test runs vectorized per chunk.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)), 180)
+    query = query.filter(
+        lat_column.between(lat - dlat, lat + dlat),
+        lon_column.between(lon - dlon, lon + dlon)
+    )
+    
+    chunk: List[Any] = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _chunk_within(chunk, lat, lon, radius_km)
+            chunk = []
+    if chunk:
+        yield from _chunk_within(chunk, lat, lon, radius_km)
+
+def _chunk_within(rows: List[Any], lat: float, lon: float, radius_km: float) -> Iterator[Tuple[Any, float]]:
+    distances = haversine_km(lat, lon, [row[0] for row in rows], [row[1] for row in rows])
+    for index in np.flatnonzero(distances <= radius_km):
+        yield rows[index], float(distances[index])
@@ -15,8 +15,8 @@ class IncidentReport(db.Model):
     email = db.Column(db.String(120), nullable=False, index=True)
     incident_type = db.Column(db.String(50), nullable=False, index=True)
     location = db.Column(db.String(200), nullable=False)
-    latitude = db.Column(db.Float, nullable=True)
-    longitude = db.Column(db.Float, nullable=True)
+    latitude = db.Column(db.Float, nullable=True, index=True)
+    longitude = db.Column(db.Float, nullable=True, index=True)
     datetime_occurred = db.Column(db.DateTime, nullable=True)
     description = db.Column(db.Text, nullable=False)
     media_files = db.Column(db.JSON, nullable=True)  # Store file paths as JSON
@@ -25,9 +25,24 @@ class IncidentReport(db.Model):
     priority = db.Column(db.String(10), default='medium')  # low, medium, high, critical
     assigned_to = db.Column(db.String(100), nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    event_id = db.Column(db.String(36), nullable=True, index=True)  # DisasterEvent.event_id
+    cluster_cell = db.Column(db.String(100), nullable=True, index=True)  # Grid key the clusterer looks neighbours up by
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Keyset pagination walks (created_at, id) newest first, optionally within a status
+    __table_args__ = (
+        db.Index('ix_incident_reports_created_at_id', 'created_at', 'id'),
+        db.Index('ix_incident_reports_status_created_at_id', 'status', 'created_at', 'id'),
+    )
+    
+    # Fields exposed by the API, in to_dict() order
+    API_FIELDS = (
+        'id', 'report_id', 'email', 'incident_type', 'location', 'latitude', 'longitude',
+        'datetime_occurred', 'description', 'media_files', 'consent', 'status', 'priority',
+        'assigned_to', 'notes', 'event_id', 'created_at', 'updated_at'
+    )
+    
     def to_dict(self):
         """Convert model to dictionary"""
         return {
@@ -46,6 +61,7 @@ class IncidentReport(db.Model):
             'priority': self.priority,
             'assigned_to': self.assigned_to,
             'notes': self.notes,
+            'event_id': self.event_id,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
@@ -96,7 +112,8 @@ class EmergencyKit(db.Model):
     kit_duration = db.Column(db.Integer, nullable=False)  # days
     budget_range = db.Column(db.String(20), nullable=False)
     disaster_type = db.Column(db.String(50), nullable=False, index=True)
-    kit_items = db.Column(db.JSON, nullable=True)  # Store kit configuration as JSON
+    kit_items = db.Column(db.JSON, nullable=True)  # Inline body, legacy rows only
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # EmergencyKitContent holding the body
     is_public = db.Column(db.Boolean, default=False)  # Allow sharing of kit configurations
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -118,6 +135,7 @@ class EmergencyKit(db.Model):
             'budget_range': self.budget_range,
             'disaster_type': self.disaster_type,
             'kit_items': self.kit_items or {},
+            'content_hash': self.content_hash,
             'is_public': self.is_public,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
@@ -126,6 +144,18 @@ class EmergencyKit(db.Model):
     def __repr__(self):
         return f'<EmergencyKit {self.kit_id}: {self.disaster_type}>'
 
+class EmergencyKitContent(db.Model):
+    """Kit body stored once per distinct configuration, shared by EmergencyKit rows"""
+    __tablename__ = 'emergency_kit_contents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)  # sha256 of the normalized parameters
+    kit_items = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EmergencyKitContent {self.content_hash[:12]}>'
+
 class WeatherAlert(db.Model):
     """Model for weather alerts and warnings"""
     __tablename__ = 'weather_alerts'
@@ -255,3 +285,301 @@ class UserFeedback(db.Model):
     
     def __repr__(self):
         return f'<UserFeedback {self.feedback_id}: {self.feedback_type}>'
+
+class OutboundEmail(db.Model):
+    """Model for queued outbound emails awaiting background delivery"""
+    __tablename__ = 'outbound_emails'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    email_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    to_email = db.Column(db.String(120), nullable=False, index=True)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    is_html = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    locked_at = db.Column(db.DateTime, nullable=True)  # Set while a worker is delivering the message
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'email_id': self.email_id,
+            'to_email': self.to_email,
+            'subject': self.subject,
+            'is_html': self.is_html,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<OutboundEmail {self.email_id}: {self.status}>'
+
+class NewsletterCampaign(db.Model):
+    """Model for newsletter bulletins fanned out to active subscribers"""
+    __tablename__ = 'newsletter_campaigns'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    subject = db.Column(db.String(200), nullable=False)
+    body_template = db.Column(db.Text, nullable=False)  # Jinja2 template rendered per subscriber
+    is_html = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, sending, completed, partial, failed
+    last_subscriber_id = db.Column(db.Integer, nullable=False, default=0)  # Keyset cursor for resuming
+    retry_subscriber_ids = db.Column(db.JSON, nullable=True)  # Subscribers whose send failed, retried on the next run
+    sent_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)  # Subscribers awaiting a retry
+    last_error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'campaign_id': self.campaign_id,
+            'subject': self.subject,
+            'is_html': self.is_html,
+            'status': self.status,
+            'last_subscriber_id': self.last_subscriber_id,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<NewsletterCampaign {self.campaign_id}: {self.status}>'
+
+class ElevationSample(db.Model):
+    """Model for grid-quantized elevation lookups cached from the elevation API"""
+    __tablename__ = 'elevation_samples'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cell_key = db.Column(db.BigInteger, unique=True, nullable=False, index=True)  # Packed grid row/column
+    latitude = db.Column(db.Float, nullable=False)  # Grid cell centre
+    longitude = db.Column(db.Float, nullable=False)
+    elevation = db.Column(db.Float, nullable=True)  # Meters above sea level
+    source = db.Column(db.String(50), nullable=False, default='open-elevation')
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'elevation': self.elevation,
+            'source': self.source,
+            'fetched_at': self.fetched_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<ElevationSample {self.latitude},{self.longitude}: {self.elevation}>'
+
+class IncidentStat(db.Model):
+    """Rollup of incident report counts per hour, type, status, priority and geo cell"""
+    __tablename__ = 'incident_stats'
+    __table_args__ = (
+        db.UniqueConstraint('hour_bucket', 'incident_type', 'status', 'priority', 'geo_cell', name='uq_incident_stats_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    hour_bucket = db.Column(db.DateTime, nullable=False, index=True)  # created_at truncated to the hour
+    incident_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    priority = db.Column(db.String(10), nullable=False)
+    geo_cell = db.Column(db.String(24), nullable=False)  # "row:col" on the stats grid, or "unknown"
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'hour_bucket': self.hour_bucket.isoformat(),
+            'incident_type': self.incident_type,
+            'status': self.status,
+            'priority': self.priority,
+            'geo_cell': self.geo_cell,
+            'count': self.count
+        }
+    
+    def __repr__(self):
+        return f'<IncidentStat {self.hour_bucket} {self.incident_type}/{self.status}: {self.count}>'
+
+class IncidentSearchTerm(db.Model):
+    """Posting of one search term in one incident report (search index for databases without FTS5)"""
+    __tablename__ = 'incident_search_terms'
+    __table_args__ = (
+        db.UniqueConstraint('term', 'incident_id', name='uq_incident_search_terms_term_incident'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(64), nullable=False)  # Lowercased, accents stripped; prefix lookups scan the unique index
+    incident_id = db.Column(db.Integer, nullable=False, index=True)  # IncidentReport.id
+    weight = db.Column(db.Float, nullable=False)  # Occurrences, weighted by field
+    
+    def __repr__(self):
+        return f'<IncidentSearchTerm {self.term} -> {self.incident_id}>'
+
+class DisasterEvent(db.Model):
+    """Model for one real-world event: incident reports of a type clustered in space and time"""
+    __tablename__ = 'disaster_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    incident_type = db.Column(db.String(50), nullable=False, index=True)
+    location = db.Column(db.String(200), nullable=True)  # From the first report
+    latitude = db.Column(db.Float, nullable=False)  # Centroid of the reports
+    longitude = db.Column(db.Float, nullable=False)
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+    priority = db.Column(db.String(10), default='medium')  # Highest priority among the reports
+    first_reported_at = db.Column(db.DateTime, nullable=False)  # Earliest occurrence (or submission) time
+    last_reported_at = db.Column(db.DateTime, nullable=False)  # Latest one
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Dashboards list the most recently active events first
+    __table_args__ = (
+        db.Index('ix_disaster_events_last_reported_at_id', 'last_reported_at', 'id'),
+    )
+    
+    API_FIELDS = (
+        'event_id', 'incident_type', 'location', 'latitude', 'longitude', 'report_count', 'priority',
+        'first_reported_at', 'last_reported_at', 'created_at', 'updated_at'
+    )
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'event_id': self.event_id,
+            'incident_type': self.incident_type,
+            'location': self.location,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'report_count': self.report_count,
+            'priority': self.priority,
+            'first_reported_at': self.first_reported_at.isoformat(),
+            'last_reported_at': self.last_reported_at.isoformat(),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<DisasterEvent {self.event_id}: {self.incident_type} x{self.report_count}>'
+
+class MediaUpload(db.Model):
+    """Model for resumable chunked media uploads attached to incident reports"""
+    __tablename__ = 'media_uploads'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    report_id = db.Column(db.String(36), nullable=True, index=True)  # IncidentReport.report_id
+    filename = db.Column(db.String(255), nullable=False)  # Sanitized client filename
+    stored_filename = db.Column(db.String(255), nullable=True, index=True)  # Name in the upload folder once complete
+    length = db.Column(db.BigInteger, nullable=False)  # Declared total size in bytes
+    offset = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes received so far
+    sha256 = db.Column(db.String(64), nullable=True)  # Of the bytes as received, set when the upload completes
+    status = db.Column(db.String(20), default='uploading', index=True)  # uploading, complete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'upload_id': self.upload_id,
+            'report_id': self.report_id,
+            'filename': self.filename,
+            'stored_filename': self.stored_filename,
+            'length': self.length,
+            'offset': self.offset,
+            'sha256': self.sha256,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<MediaUpload {self.upload_id}: {self.offset}/{self.length}>'
+
+class MediaBlob(db.Model):
+    """Model for content-addressed media files shared by every upload of the same bytes"""
+    __tablename__ = 'media_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)  # Of the stored bytes, after metadata stripping
+    stored_filename = db.Column(db.String(255), nullable=False, index=True)  # <sha256[:2]>/<sha256>.<ext> in the upload folder
+    length = db.Column(db.BigInteger, nullable=False)
+    phash = db.Column(db.BigInteger, nullable=True)  # 64-bit perceptual hash as signed int; images only
+    near_duplicate_of = db.Column(db.String(64), nullable=True, index=True)  # MediaBlob.sha256 first seen
+    near_duplicate_distance = db.Column(db.Integer, nullable=True)  # Hamming distance to that blob
+    latitude = db.Column(db.Float, nullable=True)  # GPS position read before stripping; never exposed in to_dict
+    longitude = db.Column(db.Float, nullable=True)
+    variants = db.Column(db.JSON, nullable=True)  # {thumbnail, web[, poster]} from the media pipeline
+    upload_count = db.Column(db.Integer, nullable=False, default=0)  # Completed uploads of these bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def phash_hex(self):
+        """Perceptual hash as 16 hex digits"""
+        return None if self.phash is None else f'{self.phash & 0xFFFFFFFFFFFFFFFF:016x}'
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'sha256': self.sha256,
+            'stored_filename': self.stored_filename,
+            'length': self.length,
+            'phash': self.phash_hex,
+            'near_duplicate_of': self.near_duplicate_of,
+            'near_duplicate_distance': self.near_duplicate_distance,
+            'variants': self.variants,
+            'upload_count': self.upload_count,
+            'created_at': self.created_at.isoformat(),
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None
+        }
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.sha256[:12]}: {self.upload_count} uploads>'
+
+class MediaClassification(db.Model):
+    """Model for image classifier predictions on incident media"""
+    __tablename__ = 'media_classifications'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.String(36), nullable=True, index=True)  # IncidentReport.report_id
+    filename = db.Column(db.String(255), nullable=False, index=True)  # Stored media filename
+    label = db.Column(db.String(100), nullable=False, index=True)
+    confidence = db.Column(db.Float, nullable=False)
+    top_labels = db.Column(db.JSON, nullable=True)  # [{label, confidence}, ...], best first
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'report_id': self.report_id,
+            'filename': self.filename,
+            'label': self.label,
+            'confidence': self.confidence,
+            'top_labels': self.top_labels or [],
+            'created_at': self.created_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<MediaClassification {self.filename}: {self.label}>'
@@ -5,7 +5,7 @@ Run this file to start the Flask development server.
 """
 
 import os
-from app import app, db
+from app import app, db, email_queue
 
 if __name__ == '__main__':
     # Create database tables if they don't exist
@@ -13,14 +13,24 @@ if __name__ == '__main__':
         db.create_all()
         print("Database tables created/verified")
     
+    # Start background email delivery in the process that serves requests:
+    # with the reloader that is the child, without it this process
+    use_reloader = os.environ.get('FLASK_USE_RELOADER', 'True').lower() == 'true'
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        email_queue.start()
+    
     # Run the Flask application
     print("Starting DisasterSense Flask application...")
     print("Access the application at: http://localhost:5000")
     print("Press Ctrl+C to stop the server")
     
-    app.run(
-        debug=True,
-        host='0.0.0.0',
-        port=5000,
-        threaded=True
-    )
+    try:
+        app.run(
+            debug=True,
+            host='0.0.0.0',
+            port=5000,
+            threaded=True,
+            use_reloader=use_reloader
+        )
+    finally:
+        email_queue.stop()
@@ -0,0 +1,9 @@
+"""Shared test setup: put the application modules on the path"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import the app get a private in-memory database
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
@@ -0,0 +1,63 @@
+"""Tests for bulk ingest and placing its reports in events afterwards"""
+
+from datetime import datetime
+
+import pytest
+
+from app import app, db, email_service, incident_clusterer, incident_search
+from models import DisasterEvent, IncidentReport, OutboundEmail
+from utils import EmailQueue, IncidentBulkIngestor
+
+
+@pytest.fixture
+def ingestor():
+    with app.app_context():
+        db.create_all()
+        queue = EmailQueue(app, db, email_service)
+        queue.num_workers = 0
+        yield IncidentBulkIngestor(db, queue, chunk_size=3, search=incident_search)
+        db.session.remove()
+        db.drop_all()
+
+
+def record(i, **overrides):
+    return {
+        'email': f"reporter{i}@example.org", 'incident_type': 'flood', 'location': f"Ward {i}",
+        'latitude': 19.07 + i * 0.001, 'longitude': 72.87, 'datetime': '2024-07-01T10:30:00.250000Z',
+        'description': f"Water rising near ward {i}", 'consent': True, **overrides
+    }
+
+
+def test_rows_are_stored_as_the_orm_would_store_them(ingestor):
+    results = ingestor.ingest([record(i) for i in range(7)] + [record(7, email='not-an-email')])
+
+    assert [result['success'] for result in results] == [True] * 7 + [False]
+    report = IncidentReport.query.filter_by(report_id=results[4]['report_id']).one()
+    assert report.datetime_occurred == datetime(2024, 7, 1, 10, 30, 0, 250000)
+    assert report.consent is True
+    assert report.created_at is not None and report.updated_at == report.created_at
+    assert db.session.query(db.func.count(OutboundEmail.id)).scalar() == 7
+    assert IncidentReport.query.filter(IncidentReport.created_at == report.created_at).count() >= 3
+
+
+def test_ingested_reports_are_placed_in_events_afterwards(ingestor):
+    stored = IncidentReport(
+        report_id='existing', email='first@example.org', incident_type='flood', location='Ward 0',
+        latitude=19.07, longitude=72.87, datetime_occurred=datetime(2024, 7, 1, 9), description='Flooding',
+        consent=True
+    )
+    db.session.add(stored)
+    db.session.commit()
+    event_id = stored.event_id
+    assert event_id is not None
+
+    ingestor.ingest([record(i) for i in range(5)] + [record(5, latitude=19.5)])
+    assert IncidentReport.query.filter(IncidentReport.event_id.is_(None)).count() == 6
+
+    while incident_clusterer.place_pending():
+        pass
+
+    assert IncidentReport.query.filter(IncidentReport.event_id.is_(None)).count() == 0
+    assert IncidentReport.query.filter_by(event_id=event_id).count() == 6
+    assert DisasterEvent.query.filter_by(event_id=event_id).one().report_count == 6
+    assert DisasterEvent.query.count() == 2
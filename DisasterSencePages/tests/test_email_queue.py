@@ -0,0 +1,68 @@
+"""Tests for starting and stopping the email queue's worker pool"""
+
+import threading
+import time
+
+from flask import Flask
+
+from utils import EmailQueue
+
+
+class StubEmailService:
+    is_configured = True
+    pool = None
+
+
+class StubSession:
+    def remove(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class StubDB:
+    session = StubSession()
+
+
+class MetricsRecordingQueue(EmailQueue):
+    """Each batch records metrics under the queue lock, as a real delivery does"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_started = threading.Event()
+
+    def process_batch(self) -> int:
+        self.batch_started.set()
+        time.sleep(0.2)  # stop() is called mid-batch
+        with self._lock:
+            self._sent_count += 1
+        return 0
+
+
+def make_queue(workers: int) -> MetricsRecordingQueue:
+    app = Flask(__name__)
+    app.config.update(EMAIL_QUEUE_WORKERS=workers, EMAIL_QUEUE_POLL_INTERVAL=0.05)
+    return MetricsRecordingQueue(app, db=StubDB(), email_service=StubEmailService())
+
+
+def test_stop_does_not_wait_on_workers_that_need_the_lock():
+    queue = make_queue(workers=2)
+    queue.start()
+    threads = list(queue._threads)
+    assert queue.batch_started.wait(2)
+
+    started = time.monotonic()
+    queue.stop(timeout=5)
+
+    assert time.monotonic() - started < 2
+    assert not any(thread.is_alive() for thread in threads)
+    assert queue._sent_count >= 1
+
+
+def test_start_without_workers_is_a_no_op():
+    queue = make_queue(workers=0)
+    queue.start()
+    queue.notify()
+
+    assert queue._threads == []
@@ -0,0 +1,176 @@
+"""Tests for pooled SMTP delivery against a stand-in SMTP server"""
+
+import socket
+import socketserver
+import threading
+
+import pytest
+from flask import Flask
+
+from utils import EmailService
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Just enough SMTP (EHLO, AUTH PLAIN, MAIL, RCPT, DATA) to accept messages.
+
+    ``rejected`` recipients get 550 at RCPT; after ``drop_after`` messages the
+    next connection-level command finds the socket closed, once.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.rejected = set()
+        self.drop_after = None
+        self.connections = 0
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stub ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b"250-stub\r\n250-AUTH PLAIN\r\n250 OK\r\n")
+            elif verb == 'AUTH':
+                self.reply("235 Authenticated")
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.rejected:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.delivered.extend(recipients)
+                    drop = server.drop_after is not None and len(server.delivered) >= server.drop_after
+                    if drop:
+                        server.drop_after = None
+                self.reply("250 Queued")
+                if drop:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+@pytest.fixture
+def smtp_server():
+    server = StubSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_service(port: int, **config) -> EmailService:
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USERNAME='sender@example.org',
+        MAIL_PASSWORD='secret', MAIL_TIMEOUT=5, MAIL_POOL_SIZE=2, **config
+    )
+    return EmailService(app)
+
+
+def batch(count: int, prefix: str = 'user'):
+    return [(f"{prefix}{i}@example.org", "Subject", f"Body {i}", False) for i in range(count)]
+
+
+def test_batch_reuses_one_connection(smtp_server):
+    service = make_service(smtp_server.port)
+
+    assert service.send_bulk(batch(50)) == [None] * 50
+    assert service.send_bulk(batch(50, 'again')) == [None] * 50
+
+    assert len(smtp_server.delivered) == 100
+    assert smtp_server.connections == 1
+    assert service.pool.connections_opened == 1
+    assert service.pool.connections_reused == 1
+
+
+def test_connection_is_recycled_after_max_messages(smtp_server):
+    service = make_service(smtp_server.port, MAIL_MAX_MESSAGES_PER_CONNECTION=10)
+
+    assert service.send_bulk(batch(25)) == [None] * 25
+    assert smtp_server.connections == 3
+
+
+def test_dropped_connection_reconnects(smtp_server):
+    service = make_service(smtp_server.port)
+    smtp_server.drop_after = 5
+
+    assert service.send_bulk(batch(12)) == [None] * 12
+    assert sorted(smtp_server.delivered) == sorted(address for address, _, _, _ in batch(12))
+    assert smtp_server.connections == 2
+
+
+def test_rejected_recipients_are_reported_per_message(smtp_server):
+    service = make_service(smtp_server.port)
+    smtp_server.rejected = {'user3@example.org', 'user7@example.org'}
+
+    results = service.send_bulk(batch(10))
+
+    failed = [i for i, error in enumerate(results) if error is not None]
+    assert failed == [3, 7]
+    assert 'No such user' in results[3]
+    assert len(smtp_server.delivered) == 8
+    assert smtp_server.connections == 1
+
+
+def test_unreachable_server_fails_the_batch_after_one_reconnect():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]  # Nothing listens here once the probe closes
+    service = make_service(port)
+    attempts = []
+    connect = service._connect
+    service.pool._factory = lambda: attempts.append(1) or connect()
+
+    results = service.send_bulk(batch(50))
+
+    assert len(results) == 50
+    assert all(error is not None for error in results)
+    assert len(attempts) == 2
+
+
+def test_pooled_batch_opens_one_connection_and_unpooled_one_per_message(smtp_server):
+    pooled = make_service(smtp_server.port)
+    assert pooled.send_bulk(batch(100)) == [None] * 100
+
+    unpooled = make_service(smtp_server.port, MAIL_MAX_MESSAGES_PER_CONNECTION=1)
+    assert unpooled.send_bulk(batch(100)) == [None] * 100
+
+    assert smtp_server.connections == 1 + 100
@@ -0,0 +1,41 @@
+"""Tests for IncidentExporter CSV and Parquet output"""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+from app import app, db, incident_exporter
+from models import IncidentReport
+
+
+@pytest.fixture
+def reports():
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            IncidentReport(email=f"reporter{i}@example.org", incident_type='flood', location='Kurla',
+                           latitude=19.07, longitude=72.88, datetime_occurred=datetime(2024, 7, 1, 10 + i),
+                           description='Water rising', media_files=['photo.jpg'] if i else None)
+            for i in range(3)
+        ])
+        db.session.commit()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def test_parquet_and_csv_exports_have_the_same_columns(reports, tmp_path):
+    with app.app_context():
+        assert incident_exporter.write_csv(tmp_path / 'incidents.csv') == 3
+        assert incident_exporter.write_parquet(tmp_path / 'incidents.parquet') == 3
+
+    csv = pd.read_csv(tmp_path / 'incidents.csv')
+    parquet = pq.read_table(tmp_path / 'incidents.parquet').to_pandas()
+
+    assert list(csv.columns) == list(IncidentReport.API_FIELDS)
+    assert list(parquet.columns) == list(IncidentReport.API_FIELDS)
+    assert parquet['event_id'].notna().all()
+    assert list(parquet['event_id']) == list(csv['event_id'])
@@ -0,0 +1,53 @@
+"""Tests for dashboard counts read from the incident_stats rollup"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db, incident_stats
+from models import IncidentReport
+
+
+@pytest.fixture
+def reports():
+    with app.app_context():
+        db.create_all()
+        start = datetime(2024, 7, 1, 9, 0)
+        for i in range(24):  # One report every 10 minutes from 09:00 to 12:50
+            db.session.add(IncidentReport(
+                email=f"reporter{i}@example.org", incident_type='flood' if i % 2 else 'fire',
+                location=f"Ward {i}", datetime_occurred=start, description='Reported',
+                consent=True, created_at=start + timedelta(minutes=10 * i)
+            ))
+        db.session.commit()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def live_count(since, until, incident_type=None):
+    query = IncidentReport.query.filter(IncidentReport.created_at >= since, IncidentReport.created_at < until)
+    if incident_type:
+        query = query.filter_by(incident_type=incident_type)
+    return query.count()
+
+
+@pytest.mark.parametrize('since, until', [
+    (datetime(2024, 7, 1, 9, 0), datetime(2024, 7, 1, 12, 0)),
+    (datetime(2024, 7, 1, 9, 25), datetime(2024, 7, 1, 12, 0)),
+    (datetime(2024, 7, 1, 9, 25), datetime(2024, 7, 1, 11, 35)),
+    (datetime(2024, 7, 1, 10, 5), datetime(2024, 7, 1, 10, 45)),
+    (datetime(2024, 7, 1, 10, 30), datetime(2024, 7, 1, 11, 20)),
+])
+def test_counts_match_the_reports_between_the_bounds(reports, since, until):
+    assert incident_stats.summary(since, until)['total'] == live_count(since, until)
+
+    flood = incident_stats.summary(since, until, {'incident_type': 'flood'})
+    assert flood['total'] == live_count(since, until, 'flood')
+
+
+def test_partial_hours_are_merged_into_their_hour_groups(reports):
+    groups = incident_stats.query(['hour'], datetime(2024, 7, 1, 9, 25), datetime(2024, 7, 1, 11, 35))
+
+    by_hour = {group['hour']: group['count'] for group in groups}
+    assert by_hour == {'2024-07-01T09:00:00': 3, '2024-07-01T10:00:00': 6, '2024-07-01T11:00:00': 4}
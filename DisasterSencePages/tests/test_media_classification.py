@@ -0,0 +1,40 @@
+"""Tests for sharing one image prediction between the reports that uploaded the same file"""
+
+import pytest
+
+from app import app, db, image_classifier
+from models import MediaClassification
+
+
+@pytest.fixture
+def stored_prediction():
+    with app.app_context():
+        db.create_all()
+        db.session.add(MediaClassification(
+            report_id='first-report', filename='ab/abcdef.jpg', label='flood', confidence=0.91,
+            top_labels=[{'label': 'flood', 'confidence': 0.91}, {'label': 'fire', 'confidence': 0.05}]
+        ))
+        db.session.commit()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+
+def test_a_repeat_upload_gets_a_copy_of_the_prediction(stored_prediction):
+    assert image_classifier.copy_classification('second-report', 'ab/abcdef.jpg')
+
+    copy = MediaClassification.query.filter_by(report_id='second-report').one()
+    assert (copy.filename, copy.label, copy.confidence) == ('ab/abcdef.jpg', 'flood', 0.91)
+    assert copy.top_labels[0] == {'label': 'flood', 'confidence': 0.91}
+
+
+def test_copying_twice_keeps_one_prediction_per_report(stored_prediction):
+    image_classifier.copy_classification('second-report', 'ab/abcdef.jpg')
+    image_classifier.copy_classification('second-report', 'ab/abcdef.jpg')
+
+    assert MediaClassification.query.filter_by(report_id='second-report').count() == 1
+
+
+def test_unclassified_files_are_left_to_the_model(stored_prediction):
+    assert not image_classifier.copy_classification('second-report', 'cd/cdef01.jpg')
+    assert MediaClassification.query.filter_by(report_id='second-report').count() == 0
@@ -0,0 +1,59 @@
+"""Tests for stripping media metadata before it is stored under its content hash"""
+
+import hashlib
+import os
+
+import pytest
+from PIL import Image
+
+from app import app, db
+from utils import MediaStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    with app.app_context():
+        db.create_all()
+        yield MediaStore(app, db)
+        db.session.remove()
+        db.drop_all()
+
+
+def photo_with_gps(path, color=(200, 30, 30)):
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'  # Make
+    exif[0x8825] = {1: 'N', 2: (19.0, 4.0, 30.0), 3: 'E', 4: (72.0, 52.0, 0.0)}  # GPSInfo
+    Image.new('RGB', (64, 48), color).save(path, 'JPEG', exif=exif)
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_stored_name_and_hash_are_of_the_stripped_bytes(store, tmp_path):
+    received = photo_with_gps(tmp_path / 'upload.part')
+
+    blob, created = store.store(str(tmp_path / 'upload.part'), received, 'photo.jpg')
+
+    path = os.path.join(store.upload_folder, blob.stored_filename)
+    with open(path, 'rb') as f:
+        stored = hashlib.sha256(f.read()).hexdigest()
+    assert created
+    assert stored == blob.sha256 != received
+    assert blob.stored_filename == store.stored_name(stored, 'photo.jpg')
+    with Image.open(path) as img:
+        assert not img.getexif()
+    assert (blob.latitude, blob.longitude) == (19.075, 72.866667)
+    assert 'latitude' not in blob.to_dict()
+    assert store.stats['stripped'] == 1
+
+
+def test_a_repeat_upload_of_the_same_photo_is_deduplicated(store, tmp_path):
+    received = photo_with_gps(tmp_path / 'first.part')
+    first, _ = store.store(str(tmp_path / 'first.part'), received, 'photo.jpg')
+    photo_with_gps(tmp_path / 'second.part')
+
+    second, created = store.store(str(tmp_path / 'second.part'), received, 'photo.jpg')
+
+    assert not created
+    assert second.id == first.id
+    assert not os.path.exists(tmp_path / 'second.part')
@@ -0,0 +1,39 @@
+"""Tests for the shared ModelSerializer instances"""
+
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.orm import declarative_base
+
+from utils import ModelSerializer
+
+Base = declarative_base()
+
+
+class Report(Base):
+    __tablename__ = 'reports'
+
+    id = Column(Integer, primary_key=True)
+    report_id = Column(String(50))
+    status = Column(String(20))
+    location = Column(String(200))
+    description = Column(String(500))
+
+
+def test_field_orderings_share_one_instance():
+    first = ModelSerializer.for_model(Report, ('status', 'report_id'))
+    second = ModelSerializer.for_model(Report, ('report_id', 'status', 'report_id'))
+
+    assert first is second
+    assert first.fields == ('report_id', 'status')
+    assert first.rows([('R-1', 'pending')]) == [{'report_id': 'R-1', 'status': 'pending'}]
+
+
+def test_instances_are_bounded(monkeypatch):
+    monkeypatch.setattr(ModelSerializer, 'MAX_INSTANCES', 3)
+    kept = ModelSerializer.for_model(Report, ('id',))
+    for fields in (('status',), ('location',), ('description',), ('status', 'location'), ('report_id',)):
+        ModelSerializer.for_model(Report, fields)
+        ModelSerializer.for_model(Report, ('id',))  # Recently used, so never evicted
+
+    assert len(ModelSerializer._instances) == 3
+    assert ModelSerializer.for_model(Report, ('id',)) is kept
+    assert ModelSerializer.for_model(Report, ('report_id',)).fields == ('report_id',)
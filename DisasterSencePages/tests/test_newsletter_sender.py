@@ -0,0 +1,91 @@
+"""Tests for resuming newsletter campaigns after a failed or crashed run"""
+
+import pytest
+
+from app import app, db
+from models import NewsletterCampaign, NewsletterSubscription
+from utils import NewsletterSender
+
+
+class Crash(BaseException):
+    """Stands in for the process dying: not caught by the sender's error handling"""
+
+
+class StubEmailService:
+    """Accepts every message until ``fail_on_call``, where it raises ``error``"""
+
+    is_configured = True
+
+    def __init__(self, fail_on_call=None, error=None):
+        self.fail_on_call = fail_on_call
+        self.error = error
+        self.calls = 0
+        self.sent = []
+
+    def send_bulk(self, messages):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise self.error
+        self.sent.extend(to_email for to_email, _, _, _ in messages)
+        return [None] * len(messages)
+
+
+@pytest.fixture
+def campaign_id():
+    """A campaign whose 25 subscribers all failed last time; the subscriber cursor is already at the end"""
+    with app.app_context():
+        db.create_all()
+        subscribers = [NewsletterSubscription(email=f"reader{i}@example.org") for i in range(25)]
+        db.session.add_all(subscribers)
+        db.session.flush()
+        campaign = NewsletterCampaign(
+            subject='Flood bulletin', body_template='Hello {{ name }}', status='partial',
+            last_subscriber_id=subscribers[-1].id, retry_subscriber_ids=[s.id for s in subscribers],
+            failed_count=25
+        )
+        db.session.add(campaign)
+        db.session.commit()
+        yield campaign.campaign_id
+        db.session.remove()
+        db.drop_all()
+
+
+def make_sender(email_service) -> NewsletterSender:
+    sender = NewsletterSender(app, db, email_service)
+    sender.batch_size = 10
+    sender.concurrency = 1
+    return sender
+
+
+def stored_retry_ids(campaign_id):
+    db.session.remove()
+    return NewsletterCampaign.query.filter_by(campaign_id=campaign_id).one().retry_subscriber_ids
+
+
+def test_crash_during_retry_pass_keeps_unretried_ids(campaign_id):
+    with app.app_context():
+        retry_ids = stored_retry_ids(campaign_id)
+        service = StubEmailService(fail_on_call=2, error=Crash())
+        with pytest.raises(Crash):
+            make_sender(service).run(campaign_id)
+        db.session.rollback()
+
+        # The first batch went out; the batch in flight and everything after it is still owed
+        assert service.sent == [f"reader{i}@example.org" for i in range(10)]
+        assert stored_retry_ids(campaign_id) == retry_ids[10:]
+
+        resumed = StubEmailService()
+        campaign = make_sender(resumed).run(campaign_id)
+        assert campaign.status == 'completed'
+        assert resumed.sent == [f"reader{i}@example.org" for i in range(10, 25)]
+        assert campaign.retry_subscriber_ids == []
+
+
+def test_error_during_retry_pass_keeps_unretried_ids(campaign_id):
+    with app.app_context():
+        retry_ids = stored_retry_ids(campaign_id)
+        campaign = make_sender(StubEmailService(fail_on_call=3, error=RuntimeError('SMTP down'))).run(campaign_id)
+
+        assert campaign.status == 'failed'
+        assert stored_retry_ids(campaign_id) == retry_ids[20:]
+        assert NewsletterCampaign.query.filter_by(campaign_id=campaign_id).one().failed_count == 5
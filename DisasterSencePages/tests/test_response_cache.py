@@ -0,0 +1,43 @@
+"""Tests for ResponseCache keys"""
+
+from flask import Flask, jsonify, request
+
+from utils import ResponseCache
+
+
+def make_app():
+    app = Flask(__name__)
+    cache = ResponseCache(app)
+    calls = []
+
+    @app.route('/echo')
+    @cache.cached()
+    def echo():
+        calls.append(request.query_string)
+        return jsonify(dict(request.args))
+
+    return app, calls
+
+
+def test_escaped_separators_do_not_collide():
+    app, calls = make_app()
+    client = app.test_client()
+
+    escaped = client.get('/echo?q=x%26status%3Dresolved')
+    split = client.get('/echo?q=x&status=resolved')
+
+    assert escaped.get_json() == {'q': 'x&status=resolved'}
+    assert split.get_json() == {'q': 'x', 'status': 'resolved'}
+    assert escaped.headers['ETag'] != split.headers['ETag']
+    assert len(calls) == 2
+
+
+def test_parameter_order_shares_an_entry():
+    app, calls = make_app()
+    client = app.test_client()
+
+    first = client.get('/echo?a=1&b=2')
+    second = client.get('/echo?b=2&a=1')
+
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert len(calls) == 1
@@ -0,0 +1,116 @@
+"""Tests for WeatherService caching and rate limiting against a stand-in HTTP server"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import TokenBucket, WeatherService
+
+
+class StubWeatherServer(ThreadingHTTPServer):
+    """Answers /onecall with one alert after ``delay`` seconds, or ``status`` when it is not 200"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubWeatherHandler)
+        self.delay = 0.0
+        self.status = 200
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+        time.sleep(server.delay)
+        if server.status != 200:
+            self.send_response(server.status)
+            self.end_headers()
+            return
+        body = json.dumps({'alerts': [{
+            'event': 'Flood Warning', 'tags': ['Flood'], 'description': 'River rising', 'sender_name': 'stub',
+            'start': 1700000000, 'end': 1700086400
+        }]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def weather_server():
+    server = StubWeatherServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_identical_lookups_share_one_upstream_call(weather_server):
+    weather_server.delay = 0.2
+    service = WeatherService(api_key='key', base_url=weather_server.url)
+
+    # Nearby points snap to the same cache tile
+    points = [(19.07 + i * 0.001, 72.87) for i in range(20)]
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(lambda point: service.get_weather_alerts(*point), points))
+
+    assert weather_server.hits == 1
+    assert all(result == results[0] for result in results)
+    assert results[0][0]['type'] == 'flood_warning'
+    assert service.cache.stats['misses'] == 1
+    assert service.cache.stats['coalesced'] + service.cache.stats['hits'] == 19
+
+
+def test_token_bucket_limits_calls():
+    bucket = TokenBucket(rate=10, capacity=3)
+
+    assert [bucket.acquire() for _ in range(4)] == [True, True, True, False]
+    started = time.monotonic()
+    assert bucket.acquire(timeout=0.5)
+    assert 0.05 <= time.monotonic() - started < 0.3
+
+
+def test_rate_limit_stops_upstream_calls(weather_server):
+    service = WeatherService(api_key='key', base_url=weather_server.url, calls_per_minute=6)
+    service.rate_limit_wait = 0
+
+    # Distinct tiles, so every lookup needs its own upstream call
+    results = [service.get_weather_alerts(10 + i, 20) for i in range(5)]
+
+    assert weather_server.hits == 1
+    assert len(results[0]) == 1
+    assert results[1:] == [[]] * 4
+
+
+def test_stale_entry_is_served_when_upstream_fails(weather_server):
+    service = WeatherService(api_key='key', base_url=weather_server.url, cache_ttl=0.05, stale_ttl=60)
+    fresh = service.get_weather_alerts(19.07, 72.87)
+
+    time.sleep(0.1)
+    weather_server.status = 500
+    stale = service.get_weather_alerts(19.07, 72.87)
+    deadline = time.monotonic() + 2
+    while service.cache.stats['refresh_errors'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert stale == fresh
+    assert service.get_weather_alerts(19.07, 72.87) == fresh
+    assert service.cache.stats['refresh_errors'] >= 1
+    assert weather_server.hits >= 2
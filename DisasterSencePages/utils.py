@@ -3,23 +3,222 @@ Utility functions for DisasterSense Flask application
 """
 
 import os
+import hashlib
 import logging
 import requests
 import json
-from datetime import datetime, timedelta
+import random
+import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import itemgetter
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, List, Optional, Any, Tuple
 from werkzeug.utils import secure_filename
+from jinja2.sandbox import SandboxedEnvironment
+
+from geo import KM_PER_DEGREE_LAT, cell_of, cell_range, haversine_km, tile_bounds, tile_xy, tiles_covering
+from flask.json.provider import DefaultJSONProvider
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+try:
+    import orjson
+except ImportError:  # Optional: responses fall back to the stdlib encoder
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+def _json_default(value: Any) -> Any:
+    """Encode values neither encoder handles natively; datetimes as ISO 8601"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes responses with orjson when it is installed.
+    
+    Both paths write datetimes as ISO 8601 (the stdlib one via ``default``),
+    sort keys and stay compact outside debug mode, so output is the same
+    with or without orjson.
+    """
+    
+    default = staticmethod(_json_default)
+    
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=_json_default, option=(
+                orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            ))
+        except TypeError:
+            return super().response(*args, **kwargs)  # e.g. integers beyond 64 bits
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+class ModelSerializer:
+    """Column-driven row serializer, built once per model and field list.
+    
+    Serializes ORM objects or plain row tuples (from ``session.query(*columns)``
+    or ``select(...)``) without hydrating instances. Datetimes are left for the
+    JSON provider to encode; JSON columns listed in ``empty_lists`` come out as
+    ``[]`` instead of null, matching the models' ``to_dict()``.
+    """
+    
+    MAX_INSTANCES = 256
+    _instances: 'OrderedDict[tuple, ModelSerializer]' = OrderedDict()
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, model, fields: Optional[Tuple[str, ...]] = None, empty_lists: Tuple[str, ...] = ()):
+        self.model = model
+        self.fields = tuple(fields or [column.key for column in model.__table__.columns])
+        self.columns = [getattr(model, field) for field in self.fields]
+        self._list_positions = [i for i, field in enumerate(self.fields) if field in empty_lists]
+    
+    @classmethod
+    def for_model(cls, model, fields: Optional[Tuple[str, ...]] = None, 
+                  empty_lists: Tuple[str, ...] = ()) -> 'ModelSerializer':
+        """Shared serializer for a model and field set, built on first use.
+        
+        Fields are put in column order and deduplicated, so every ordering of
+        the same set shares one instance; select rows with ``columns`` (or in
+        ``fields`` order). The least recently used instances are dropped past
+        ``MAX_INSTANCES``.
+        """
+        if fields:
+            order = {key: i for i, key in enumerate(model.__table__.columns.keys())}
+            fields = tuple(sorted(set(fields), key=lambda field: (order.get(field, len(order)), field)))
+        key = (model, fields or None, tuple(sorted(empty_lists)))
+        with cls._instances_lock:
+            serializer = cls._instances.get(key)
+            if serializer is not None:
+                cls._instances.move_to_end(key)
+                return serializer
+            serializer = cls._instances[key] = cls(model, fields, empty_lists)
+            while len(cls._instances) > cls.MAX_INSTANCES:
+                cls._instances.popitem(last=False)
+        return serializer
+    
+    def rows(self, rows) -> List[Dict[str, Any]]:
+        """Serialize row tuples whose values are in ``fields`` order"""
+        fields = self.fields
+        if not self._list_positions:
+            return [dict(zip(fields, row)) for row in rows]
+        results = []
+        for row in rows:
+            result = dict(zip(fields, row))
+            for i in self._list_positions:
+                if result[fields[i]] is None:
+                    result[fields[i]] = []
+            results.append(result)
+        return results
+    
+    def objects(self, instances) -> List[Dict[str, Any]]:
+        """Serialize ORM instances"""
+        fields = self.fields
+        return self.rows([tuple(getattr(instance, field) for field in fields) for instance in instances])
+
+class SMTPConnectionPool:
+    """Pool of authenticated SMTP sessions that are kept alive and reused across messages"""
+    
+    def __init__(self, factory, max_size: int = 4, idle_timeout: float = 60, 
+                 max_messages: int = 100, check_after: float = 5):
+        self._factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.check_after = check_after
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.connections_opened = 0
+        self.connections_reused = 0
+    
+    def acquire(self) -> 'PooledSMTPConnection':
+        """Get a live session, reusing an idle one when possible"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    break
+                idle_for = time.monotonic() - conn.last_used
+                if idle_for > self.idle_timeout:
+                    conn.close()
+                    continue
+                if idle_for > self.check_after and not conn.is_alive():
+                    conn.close()
+                    continue
+                with self._lock:
+                    self.connections_reused += 1
+                return conn
+            
+            conn = PooledSMTPConnection(self._factory())
+            with self._lock:
+                self.connections_opened += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def release(self, conn: 'PooledSMTPConnection', discard: bool = False):
+        """Return a session to the pool, closing it if broken or worn out"""
+        try:
+            if discard or conn.messages_sent >= self.max_messages:
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+    
+    def close_all(self):
+        """Close every idle session"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+class PooledSMTPConnection:
+    """An authenticated SMTP session tracked by SMTPConnectionPool"""
+    
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+    
+    def send_message(self, msg: MIMEMultipart):
+        """Send one message on this session"""
+        self.smtp.send_message(msg)
+        self.messages_sent += 1
+    
+    def is_alive(self) -> bool:
+        """Check the session with a NOOP"""
+        try:
+            return self.smtp.noop()[0] == 250
+        except OSError:
+            return False
+    
+    def close(self):
+        """Quit the session, ignoring errors from dead connections"""
+        try:
+            self.smtp.quit()
+        except OSError:
+            self.smtp.close()
+
 class EmailService:
     """Email service for sending notifications"""
     
     def __init__(self, app=None):
         self.app = app
+        self.pool = None
         if app:
             self.init_app(app)
     
@@ -31,29 +230,103 @@ class EmailService:
         self.mail_use_tls = app.config.get('MAIL_USE_TLS', True)
         self.mail_username = app.config.get('MAIL_USERNAME')
         self.mail_password = app.config.get('MAIL_PASSWORD')
+        self.mail_timeout = app.config.get('MAIL_TIMEOUT', 30)
+        self.pool = SMTPConnectionPool(
+            self._connect,
+            max_size=app.config.get('MAIL_POOL_SIZE', 4),
+            idle_timeout=app.config.get('MAIL_POOL_IDLE_TIMEOUT', 60),
+            max_messages=app.config.get('MAIL_MAX_MESSAGES_PER_CONNECTION', 100)
+        )
+    
+    @property
+    def is_configured(self) -> bool:
+        """Whether SMTP credentials are available"""
+        return bool(self.mail_username and self.mail_password)
+    
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new SMTP session"""
+        server = smtplib.SMTP(self.mail_server, self.mail_port, timeout=self.mail_timeout)
+        try:
+            if self.mail_use_tls:
+                server.starttls()
+            server.login(self.mail_username, self.mail_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def build_message(self, to_email: str, subject: str, body: str, is_html: bool = False) -> MIMEMultipart:
+        """Build a MIME message ready for delivery"""
+        msg = MIMEMultipart()
+        msg['From'] = self.mail_username
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        if is_html:
+            msg.attach(MIMEText(body, 'html'))
+        else:
+            msg.attach(MIMEText(body, 'plain'))
+        return msg
+    
+    def deliver(self, to_email: str, subject: str, body: str, is_html: bool = False):
+        """Deliver a single email over a pooled session, raising on failure"""
+        error = self.send_bulk([(to_email, subject, body, is_html)])[0]
+        if error is not None:
+            raise smtplib.SMTPException(error)
+    
+    def send_bulk(self, messages: List[Tuple[str, str, str, bool]]) -> List[Optional[str]]:
+        """Send many (to_email, subject, body, is_html) messages over pooled sessions.
+        
+        Returns one entry per message: None on success, otherwise the error text.
+        A session that drops mid-batch is replaced and the message retried once;
+        if the fresh session fails too, the server is taken to be down and the
+        rest of the batch fails without further connection attempts.
+        """
+        if not self.is_configured:
+            return ["Email credentials not configured"] * len(messages)
+        
+        results: List[Optional[str]] = []
+        conn = None
+        try:
+            for index, (to_email, subject, body, is_html) in enumerate(messages):
+                msg = self.build_message(to_email, subject, body, is_html)
+                for attempt in range(2):
+                    try:
+                        if conn is not None and conn.messages_sent >= self.pool.max_messages:
+                            self.pool.release(conn)
+                            conn = None
+                        if conn is None:
+                            conn = self.pool.acquire()
+                        conn.send_message(msg)
+                        results.append(None)
+                        break
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, 
+                            smtplib.SMTPDataError) as e:
+                        # Message-level rejection; the session is still usable
+                        results.append(str(e))
+                        break
+                    except OSError as e:
+                        # Session-level failure (SMTPException is an OSError): drop the
+                        # connection and retry on a fresh one
+                        if conn is not None:
+                            self.pool.release(conn, discard=True)
+                            conn = None
+                        if attempt == 1:
+                            results.extend([str(e)] * (len(messages) - index))
+                            return results
+        finally:
+            if conn is not None:
+                self.pool.release(conn)
+        return results
     
     def send_email(self, to_email: str, subject: str, body: str, is_html: bool = False) -> bool:
         """Send email notification"""
         try:
-            if not self.mail_username or not self.mail_password:
+            if not self.is_configured:
                 logger.warning("Email credentials not configured")
                 return False
             
-            msg = MIMEMultipart()
-            msg['From'] = self.mail_username
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            if is_html:
-                msg.attach(MIMEText(body, 'html'))
-            else:
-                msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.mail_server, self.mail_port)
-            server.starttls()
-            server.login(self.mail_username, self.mail_password)
-            server.send_message(msg)
-            server.quit()
+            self.deliver(to_email, subject, body, is_html)
             
             logger.info(f"Email sent successfully to {to_email}")
             return True
@@ -61,12 +334,596 @@ class EmailService:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
 
+def _insert_rows(connection, table, rows: List[Dict[str, Any]], returning: Tuple[str, ...] = (),
+                 names: Optional[List[str]] = None) -> List[tuple]:
+    """Insert rows (dicts with the same keys) into a Core table; the ``returning`` columns of each row, in any order
+    
+    On SQLite the rows go out as multi-row VALUES statements through the
+    driver. SQLAlchemy's executemany runs its bind processors per value and
+    rebuilds parameters per row, which on bulk ingest cost about as much as
+    SQLite's own work, and SQLite's FTS5 triggers flush once per statement,
+    so both the per-row Python and the statement count matter. Datetimes must be naive, as stored.
+    ``names`` picks the columns to write when rows carry other keys too.
+    Without RETURNING support an empty list is returned.
+    """
+    from sqlalchemy import DateTime
+    
+    if not rows:
+        return []
+    dialect = connection.dialect
+    names = names or list(rows[0])
+    columns = [table.c[name] for name in names]
+    if dialect.name != 'sqlite':
+        rows = [{name: row[name] for name in names} for row in rows]
+        statement = table.insert()
+        if returning and dialect.insert_executemany_returning:
+            return connection.execute(statement.returning(*[table.c[name] for name in returning]), rows).all()
+        connection.execute(statement, rows)
+        return []
+    
+    # Same text as the SQLite dialect's default DATETIME storage format. Rows
+    # mostly share their timestamps (a chunk's created_at), so each distinct
+    # value is formatted once.
+    formatted: Dict[datetime, str] = {}
+    
+    def format_datetime(value):
+        if value is None:
+            return None
+        text = formatted.get(value)
+        if text is None:
+            text = formatted[value] = value.isoformat(' ', 'microseconds')
+        return text
+    
+    processors = [(index, format_datetime if isinstance(column.type, DateTime) else column.type.bind_processor(dialect))
+                  for index, column in enumerate(columns)]
+    processors = [(index, process) for index, process in processors if process is not None]
+    values_of = itemgetter(*names) if len(names) > 1 else (lambda row: (row[names[0]],))
+    per_statement = max(1, min(dialect.insertmanyvalues_page_size, dialect.insertmanyvalues_max_parameters // len(names)))
+    placeholders = '(' + ', '.join('?' * len(names)) + ')'
+    suffix = f" RETURNING {', '.join(returning)}" if returning and dialect.insert_returning else ''
+    sql = f"INSERT INTO {table.name} ({', '.join(names)}) VALUES "
+    
+    results: List[tuple] = []
+    for start in range(0, len(rows), per_statement):
+        batch = rows[start:start + per_statement]
+        params = []
+        for row in batch:
+            values = values_of(row)
+            if processors:
+                values = list(values)
+                for index, process in processors:
+                    values[index] = process(values[index])
+            params.extend(values)
+        result = connection.exec_driver_sql(sql + ', '.join([placeholders] * len(batch)) + suffix, tuple(params))
+        if suffix:
+            results.extend(result.all())
+    return results
+
+class EmailQueue:
+    """Database-backed outbound email queue drained by a pool of worker threads.
+    
+    Messages are written to the ``outbound_emails`` table in the caller's
+    transaction, so they survive restarts and are only visible to workers
+    once the surrounding request commits.
+    """
+    
+    def __init__(self, app=None, db=None, email_service: EmailService = None):
+        self.app = app
+        self.db = db
+        self.email_service = email_service
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._latencies = deque(maxlen=1000)  # seconds from enqueue to delivery
+        self._send_times = deque(maxlen=1000)  # seconds spent talking to SMTP
+        self._sent_count = 0
+        self._failed_count = 0
+        self._retry_count = 0
+        if app is not None:
+            self.init_app(app, db, email_service)
+    
+    def init_app(self, app, db, email_service: EmailService):
+        """Initialize email queue with app configuration"""
+        self.app = app
+        self.db = db
+        self.email_service = email_service
+        self.num_workers = app.config.get('EMAIL_QUEUE_WORKERS', 2)
+        self.max_attempts = app.config.get('EMAIL_QUEUE_MAX_ATTEMPTS', 5)
+        self.backoff_seconds = app.config.get('EMAIL_QUEUE_BACKOFF_SECONDS', 30)
+        self.max_backoff_seconds = app.config.get('EMAIL_QUEUE_MAX_BACKOFF_SECONDS', 3600)
+        self.poll_interval = app.config.get('EMAIL_QUEUE_POLL_INTERVAL', 5)
+        self.batch_size = app.config.get('EMAIL_QUEUE_BATCH_SIZE', 50)
+        self.lock_timeout = app.config.get('EMAIL_QUEUE_LOCK_TIMEOUT', 300)
+    
+    def enqueue(self, to_email: str, subject: str, body: str, is_html: bool = False):
+        """Add an email to the current session; it is delivered after the caller commits"""
+        from models import OutboundEmail
+        
+        email = OutboundEmail(to_email=to_email, subject=subject, body=body, is_html=is_html)
+        self.db.session.add(email)
+        return email
+    
+    def enqueue_many(self, emails: List[Dict[str, Any]]):
+        """Bulk-insert emails (dicts of to_email, subject, body[, is_html]) in the current session"""
+        import uuid
+        from models import OutboundEmail
+        
+        if emails:
+            # Core insert on the table (not the ORM bulk path) with every default
+            # filled in, so the rows go straight to the driver
+            now = datetime.utcnow()
+            _insert_rows(self.db.session.connection(), OutboundEmail.__table__, [{
+                'email_id': str(uuid.uuid4()), 'is_html': False, 'status': 'queued', 'attempts': 0,
+                'next_attempt_at': now, 'created_at': now, 'updated_at': now, **email
+            } for email in emails])
+    
+    def notify(self):
+        """Wake the workers after queued emails have been committed"""
+        self.start()
+        self._wakeup.set()
+    
+    def start(self):
+        """Start the worker pool (idempotent; a no-op with no workers configured)"""
+        with self._lock:
+            if self._threads or not self.num_workers:
+                return
+            self._stop.clear()
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Email queue started with {self.num_workers} workers")
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker pool"""
+        # Join outside the lock: workers take it to record delivery metrics
+        with self._lock:
+            self._stop.set()
+            self._wakeup.set()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+        if self.email_service.pool is not None:
+            self.email_service.pool.close_all()
+    
+    def recover_stale(self) -> int:
+        """Requeue emails left in 'sending' past the lock timeout by a worker that died mid-delivery"""
+        from models import OutboundEmail
+        
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        recovered = OutboundEmail.query.filter(
+            OutboundEmail.status == 'sending',
+            OutboundEmail.locked_at < cutoff
+        ).update({'status': 'queued', 'locked_at': None}, synchronize_session=False)
+        self.db.session.commit()
+        if recovered:
+            logger.info(f"Requeued {recovered} stale outbound emails")
+        return recovered
+    
+    def _worker_loop(self):
+        """Drain the queue until stopped, sleeping when there is nothing due"""
+        with self.app.app_context():
+            while not self._stop.is_set():
+                processed = False
+                try:
+                    if self.email_service.is_configured:
+                        processed = self.process_batch() > 0
+                except Exception as e:
+                    logger.error(f"Email queue worker error: {str(e)}")
+                    self.db.session.rollback()
+                finally:
+                    self.db.session.remove()
+                
+                if not processed and self._wakeup.wait(self.poll_interval):
+                    self._wakeup.clear()
+    
+    def _backoff(self, attempts: int) -> float:
+        """Exponential backoff with jitter for the given attempt count"""
+        delay = min(self.backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+        return delay + random.uniform(0, self.backoff_seconds)
+    
+    def process_batch(self) -> int:
+        """Claim due emails and deliver them on a shared SMTP session. Returns the number claimed."""
+        from models import OutboundEmail
+        
+        # Leases of crashed workers expire while this process keeps running, not only at startup
+        self.recover_stale()
+        now = datetime.utcnow()
+        candidate_ids = [row[0] for row in self.db.session.query(OutboundEmail.id).filter(
+            OutboundEmail.status == 'queued',
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(self.batch_size)]
+        if not candidate_ids:
+            return 0
+        
+        # Claim with conditional updates so concurrent workers never double-send
+        claimed_ids = [
+            email_id for email_id in candidate_ids
+            if OutboundEmail.query.filter(
+                OutboundEmail.id == email_id,
+                OutboundEmail.status == 'queued'
+            ).update({'status': 'sending', 'locked_at': now}, synchronize_session=False)
+        ]
+        self.db.session.commit()
+        if not claimed_ids:
+            return 0
+        
+        emails = OutboundEmail.query.filter(OutboundEmail.id.in_(claimed_ids)).all()
+        started = time.monotonic()
+        errors = self.email_service.send_bulk(
+            [(email.to_email, email.subject, email.body, email.is_html) for email in emails]
+        )
+        per_message = (time.monotonic() - started) / len(emails)
+        
+        for email, error in zip(emails, errors):
+            email.attempts += 1
+            email.locked_at = None
+            if error is not None:
+                email.last_error = error
+                if email.attempts >= self.max_attempts:
+                    email.status = 'failed'
+                    with self._lock:
+                        self._failed_count += 1
+                    logger.error(f"Giving up on email {email.email_id} after {email.attempts} attempts: {error}")
+                else:
+                    email.status = 'queued'
+                    email.next_attempt_at = datetime.utcnow() + timedelta(seconds=self._backoff(email.attempts))
+                    with self._lock:
+                        self._retry_count += 1
+                    logger.warning(f"Email {email.email_id} attempt {email.attempts} failed, retrying: {error}")
+            else:
+                email.status = 'sent'
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+                with self._lock:
+                    self._sent_count += 1
+                    self._send_times.append(per_message)
+                    self._latencies.append((email.sent_at - email.created_at).total_seconds())
+        self.db.session.commit()
+        logger.info(f"Email queue delivered batch of {len(emails)} ({errors.count(None)} sent)")
+        return len(emails)
+    
+    def drain(self) -> int:
+        """Synchronously deliver every due email. Returns the number processed."""
+        processed = 0
+        while True:
+            claimed = self.process_batch()
+            if not claimed:
+                return processed
+            processed += claimed
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Queue depth and delivery latency statistics"""
+        from models import OutboundEmail
+        
+        counts = dict(
+            self.db.session.query(OutboundEmail.status, self.db.func.count(OutboundEmail.id))
+            .group_by(OutboundEmail.status).all()
+        )
+        oldest_queued = self.db.session.query(self.db.func.min(OutboundEmail.created_at)).filter(
+            OutboundEmail.status == 'queued'
+        ).scalar()
+        
+        with self._lock:
+            latencies = sorted(self._latencies)
+            send_times = sorted(self._send_times)
+            sent, failed, retries = self._sent_count, self._failed_count, self._retry_count
+        
+        pool = self.email_service.pool
+        return {
+            'queue_depth': counts.get('queued', 0) + counts.get('sending', 0),
+            'by_status': counts,
+            'oldest_queued_age_seconds': (datetime.utcnow() - oldest_queued).total_seconds() if oldest_queued else 0,
+            'workers': len(self._threads),
+            'smtp_configured': self.email_service.is_configured,
+            'delivered': sent,
+            'failed': failed,
+            'retries': retries,
+            'delivery_latency_seconds': _summarize(latencies),
+            'smtp_send_seconds': _summarize(send_times),
+            'smtp_connections_opened': pool.connections_opened if pool else 0,
+            'smtp_connections_reused': pool.connections_reused if pool else 0
+        }
+
+class NewsletterSender:
+    """Streams active subscribers in keyset-paginated batches and fans messages out concurrently.
+    
+    Progress is checkpointed on the campaign row after every batch, so a
+    crashed run resumes from ``last_subscriber_id``. Messages in the batch
+    that was in flight when the process died may be sent twice.
+    """
+    
+    def __init__(self, app=None, db=None, email_service: EmailService = None):
+        self.app = app
+        self.db = db
+        self.email_service = email_service
+        self._running = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, email_service)
+    
+    def init_app(self, app, db, email_service: EmailService):
+        """Initialize newsletter sender with app configuration"""
+        self.app = app
+        self.db = db
+        self.email_service = email_service
+        self.batch_size = app.config.get('NEWSLETTER_BATCH_SIZE', 500)
+        self.concurrency = app.config.get('NEWSLETTER_CONCURRENCY', app.config.get('MAIL_POOL_SIZE', 4))
+        self.base_url = app.config.get('PUBLIC_BASE_URL', 'http://localhost:5000').rstrip('/')
+    
+    def start(self, campaign_id: str) -> bool:
+        """Run a campaign on a background thread. Returns False if it is already running."""
+        with self._lock:
+            if campaign_id in self._running:
+                return False
+            self._running.add(campaign_id)
+        
+        def target():
+            try:
+                with self.app.app_context():
+                    self.run(campaign_id)
+            finally:
+                with self._lock:
+                    self._running.discard(campaign_id)
+        
+        threading.Thread(target=target, name=f"newsletter-{campaign_id[:8]}", daemon=True).start()
+        return True
+    
+    @staticmethod
+    def compile(body_template: str, is_html: bool = False):
+        """Compile a campaign body in a sandbox; raises jinja2.TemplateSyntaxError.
+        
+        Campaign bodies come from API callers, so they must not reach Python
+        internals (``cycler.__init__.__globals__`` and the like).
+        """
+        return SandboxedEnvironment(autoescape=is_html).from_string(body_template)
+    
+    def run(self, campaign_id: str):
+        """Send a campaign to its failed subscribers, then every active subscriber after its cursor
+        
+        Subscribers whose send fails are kept in ``retry_subscriber_ids`` and
+        the campaign ends ``partial``; running it again retries them.
+        """
+        from models import NewsletterCampaign, NewsletterSubscription
+        
+        campaign = NewsletterCampaign.query.filter_by(campaign_id=campaign_id).first()
+        if campaign is None:
+            raise ValueError(f"Unknown campaign {campaign_id}")
+        if campaign.status == 'completed':
+            return campaign
+        if not self.email_service.is_configured:
+            raise RuntimeError("Email delivery is not configured")
+        
+        # Compile the template once for the whole run
+        template = self.compile(campaign.body_template, campaign.is_html)
+        
+        campaign.status = 'sending'
+        campaign.started_at = campaign.started_at or datetime.utcnow()
+        self.db.session.commit()
+        logger.info(f"Newsletter campaign {campaign_id} sending from subscriber {campaign.last_subscriber_id}")
+        
+        columns = (
+            NewsletterSubscription.id,
+            NewsletterSubscription.email,
+            NewsletterSubscription.name,
+            NewsletterSubscription.unsubscribe_token
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                # Earlier failures first; anyone who has since unsubscribed is dropped
+                retry_ids = list(campaign.retry_subscriber_ids or [])
+                failed_ids: List[int] = []
+                for start in range(0, len(retry_ids), self.batch_size):
+                    rows = self.db.session.query(*columns).filter(
+                        NewsletterSubscription.is_active.is_(True),
+                        NewsletterSubscription.id.in_(retry_ids[start:start + self.batch_size])
+                    ).order_by(NewsletterSubscription.id).all()
+                    campaign.retry_subscriber_ids = failed_ids
+                    self._send_batch(executor, campaign, template, rows)
+                    failed_ids = list(campaign.retry_subscriber_ids)
+                    # Checkpoint the IDs not yet retried too, so a crash here loses none of them
+                    campaign.retry_subscriber_ids = failed_ids + retry_ids[start + self.batch_size:]
+                    campaign.failed_count = len(campaign.retry_subscriber_ids)
+                    self.db.session.commit()
+                campaign.retry_subscriber_ids = failed_ids
+                
+                while True:
+                    # Keyset pagination over plain tuples keeps memory flat regardless of list size
+                    rows = self.db.session.query(*columns).filter(
+                        NewsletterSubscription.is_active.is_(True),
+                        NewsletterSubscription.id > campaign.last_subscriber_id
+                    ).order_by(NewsletterSubscription.id).limit(self.batch_size).all()
+                    if not rows:
+                        break
+                    
+                    self._send_batch(executor, campaign, template, rows)
+                    campaign.last_subscriber_id = rows[-1][0]
+                    campaign.failed_count = len(campaign.retry_subscriber_ids)
+                    self.db.session.commit()
+            
+            campaign.failed_count = len(campaign.retry_subscriber_ids)
+            campaign.status = 'partial' if campaign.retry_subscriber_ids else 'completed'
+            campaign.completed_at = datetime.utcnow()
+            self.db.session.commit()
+            logger.info(f"Newsletter campaign {campaign_id} {campaign.status}: {campaign.sent_count} sent, {campaign.failed_count} failed")
+        except Exception as e:
+            logger.error(f"Newsletter campaign {campaign_id} stopped: {str(e)}")
+            self.db.session.rollback()
+            campaign.status = 'failed'
+            campaign.last_error = str(e)
+            self.db.session.commit()
+        return campaign
+    
+    def _send_batch(self, executor: ThreadPoolExecutor, campaign, template, rows):
+        """Send one batch of (id, email, name, token) rows, recording successes and failures on the campaign"""
+        from models import NewsletterSubscription
+        
+        messages = [
+            (email, campaign.subject, template.render(
+                email=email,
+                name=name or '',
+                unsubscribe_url=f"{self.base_url}/api/newsletter/unsubscribe/{token}"
+            ), campaign.is_html)
+            for _, email, name, token in rows
+        ]
+        errors = self._send_concurrently(executor, messages)
+        
+        sent_ids = [row[0] for row, error in zip(rows, errors) if error is None]
+        if sent_ids:
+            NewsletterSubscription.query.filter(
+                NewsletterSubscription.id.in_(sent_ids)
+            ).update({'last_email_sent': datetime.utcnow()}, synchronize_session=False)
+        campaign.sent_count += len(sent_ids)
+        
+        failed_ids = [row[0] for row, error in zip(rows, errors) if error is not None]
+        if failed_ids:
+            # Reassign so the JSON column change is detected
+            campaign.retry_subscriber_ids = list(campaign.retry_subscriber_ids or []) + failed_ids
+            campaign.last_error = [error for error in errors if error is not None][-1]
+    
+    def _send_concurrently(self, executor: ThreadPoolExecutor, messages: List[Tuple[str, str, str, bool]]) -> List[Optional[str]]:
+        """Split a batch across the executor, one pooled SMTP session per chunk"""
+        chunk_size = max(1, -(-len(messages) // self.concurrency))
+        chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+        errors: List[Optional[str]] = []
+        for result in executor.map(self.email_service.send_bulk, chunks):
+            errors.extend(result)
+        return errors
+
+def _summarize(sorted_values: List[float]) -> Dict[str, Optional[float]]:
+    """Mean and percentiles of an already sorted sample"""
+    if not sorted_values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+    
+    def percentile(p: float) -> float:
+        return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+    
+    return {
+        'count': len(sorted_values),
+        'mean': round(sum(sorted_values) / len(sorted_values), 4),
+        'p50': round(percentile(0.50), 4),
+        'p95': round(percentile(0.95), 4),
+        'max': round(sorted_values[-1], 4)
+    }
+
+class RateLimitExceeded(Exception):
+    """Raised when an upstream API quota would be exceeded"""
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by all threads calling one upstream API"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, timeout: float = 0) -> bool:
+        """Take one token, waiting up to ``timeout`` seconds for a refill"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class SingleFlightCache:
+    """TTL cache that serves stale entries while revalidating and coalesces concurrent loads.
+    
+    Fresh entries are returned directly. Entries past ``ttl`` but within
+    ``stale_ttl`` are returned immediately while one background refresh runs.
+    On a miss, concurrent callers for the same key share a single load.
+    """
+    
+    def __init__(self, ttl: float, stale_ttl: float = 0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Any, Tuple[Any, float]]' = OrderedDict()
+        self._inflight: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'refresh_errors': 0}
+    
+    def get(self, key: Any, loader, timeout: Optional[float] = None) -> Any:
+        """Return the cached value for ``key``, calling ``loader()`` at most once per key at a time"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[1]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry[0]
+                if age < self.ttl + self.stale_ttl:
+                    self.stats['stale_hits'] += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        threading.Thread(target=self._load, args=(key, loader), daemon=True).start()
+                    return entry[0]
+            
+            call = self._inflight.get(key)
+            if call is None:
+                self.stats['misses'] += 1
+                self._inflight[key] = Future()
+            else:
+                self.stats['coalesced'] += 1
+        
+        if call is not None:
+            return call.result(timeout)
+        return self._load(key, loader, raise_errors=True)
+    
+    def _load(self, key: Any, loader, raise_errors: bool = False) -> Any:
+        with self._lock:
+            call = self._inflight[key]
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.stats['refresh_errors'] += 1
+            call.set_exception(e)
+            if raise_errors:
+                raise
+            logger.warning(f"Background refresh failed for {key}: {str(e)}")
+            return None
+        
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        call.set_result(value)
+        return value
+
 class WeatherService:
     """Weather service for fetching alerts and forecasts"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None, calls_per_minute: int = 60,
+                 cache_ttl: float = 600, stale_ttl: float = 3600, tile_deg: float = 0.1):
         self.api_key = api_key
-        self.base_url = "https://api.openweathermap.org/data/2.5"
+        self.base_url = (base_url or "https://api.openweathermap.org/data/3.0").rstrip('/')
+        self.tile_deg = tile_deg
+        self.rate_limit_wait = 2.0
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=16))
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=16))
+        self.cache = SingleFlightCache(ttl=cache_ttl, stale_ttl=stale_ttl)
+        self.limiter = TokenBucket(rate=calls_per_minute / 60.0, capacity=max(1, calls_per_minute // 6))
+    
+    def _tile(self, lat: float, lon: float) -> Tuple[float, float]:
+        """Snap coordinates to the centre of their cache tile"""
+        return (round(round(lat / self.tile_deg) * self.tile_deg, 4),
+                round(round(lon / self.tile_deg) * self.tile_deg, 4))
     
     def get_weather_alerts(self, lat: float, lon: float) -> List[Dict[str, Any]]:
         """Get weather alerts for a location"""
@@ -75,13 +932,39 @@ class WeatherService:
                 logger.warning("Weather API key not configured")
                 return self._get_mock_alerts()
             
-            # This would integrate with OpenWeatherMap API
-            # For now, return mock data
-            return self._get_mock_alerts()
+            tile_lat, tile_lon = self._tile(lat, lon)
+            return self.cache.get(('alerts', tile_lat, tile_lon), lambda: self._fetch_alerts(tile_lat, tile_lon))
         except Exception as e:
             logger.error(f"Error fetching weather alerts: {str(e)}")
             return []
     
+    def _fetch_alerts(self, lat: float, lon: float) -> List[Dict[str, Any]]:
+        """Call the OpenWeatherMap One Call API for alerts at a tile centre"""
+        if not self.limiter.acquire(timeout=self.rate_limit_wait):
+            raise RateLimitExceeded("OpenWeatherMap quota exhausted")
+        
+        response = self.session.get(f"{self.base_url}/onecall", params={
+            'lat': lat,
+            'lon': lon,
+            'exclude': 'current,minutely,hourly,daily',
+            'appid': self.api_key
+        }, timeout=10)
+        response.raise_for_status()
+        
+        alerts = []
+        for i, alert in enumerate(response.json().get('alerts', []), start=1):
+            alerts.append({
+                'id': i,
+                'type': alert.get('event', '').lower().replace(' ', '_'),
+                'severity': (alert.get('tags') or ['moderate'])[0].lower(),
+                'title': alert.get('event', ''),
+                'message': alert.get('description', ''),
+                'source': alert.get('sender_name'),
+                'valid_from': datetime.utcfromtimestamp(alert['start']).isoformat() if alert.get('start') else None,
+                'valid_until': datetime.utcfromtimestamp(alert['end']).isoformat() if alert.get('end') else None
+            })
+        return alerts
+    
     def _get_mock_alerts(self) -> List[Dict[str, Any]]:
         """Return mock weather alerts"""
         return [
@@ -96,209 +979,3606 @@ class WeatherService:
             }
         ]
 
+# Overpass tag filters per disaster type: (key, value, spot_type)
+OVERPASS_AMENITY_SETS = {
+    'earthquake': [  # Open spaces
+        ('leisure', 'park', 'open_space'),
+        ('leisure', 'pitch', 'open_space'),
+        ('landuse', 'meadow', 'open_space'),
+        ('landuse', 'grass', 'open_space')
+    ],
+    'flood': [  # High ground and sturdy buildings
+        ('natural', 'hill', 'high_ground'),
+        ('natural', 'peak', 'high_ground'),
+        ('natural', 'ridge', 'high_ground'),
+        ('amenity', 'shelter', 'shelter'),
+        ('building', 'hospital', 'hospital'),
+        ('building', 'school', 'school')
+    ],
+    'cyclone': [  # Robust shelters
+        ('amenity', 'community_centre', 'shelter'),
+        ('amenity', 'school', 'school'),
+        ('building', 'public', 'public_building'),
+        ('building', 'hospital', 'hospital')
+    ],
+    'landslide': [  # Flat, stable ground
+        ('landuse', 'residential', 'flat_ground'),
+        ('landuse', 'farmland', 'flat_ground'),
+        ('natural', 'plateau', 'flat_ground')
+    ]
+}
+
+class OverpassTileCache:
+    """Server-side Overpass client that fetches safe-spot POIs per map tile.
+    
+    Tiles are cached in an in-memory LRU backed by JSON files on disk, so
+    every user searching the same district shares one upstream fetch.
+    Missing tiles for a search are fetched together in a single query, and
+    fetched POIs are upserted into the SafeSpot table so searches keep
+    working from the database when Overpass is slow or down.
+    """
+    
+    def __init__(self, db=None, overpass_url: str = "https://overpass-api.de/api/interpreter",
+                 cache_dir: str = None, zoom: int = 12, ttl: float = 7 * 24 * 3600,
+                 max_memory_tiles: int = 5000, requests_per_minute: int = 60):
+        self.db = db
+        self.overpass_url = overpass_url
+        self.cache_dir = cache_dir
+        self.zoom = zoom
+        self.ttl = ttl
+        self.max_memory_tiles = max_memory_tiles
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max(1, requests_per_minute // 10))
+        self._memory: 'OrderedDict[Tuple[str, int, int], Tuple[float, List[Dict[str, Any]]]]' = OrderedDict()
+        self._inflight: Dict[Tuple[str, int, int], Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'upstream_fetches': 0, 'upstream_errors': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    def ensure_area(self, lat: float, lon: float, radius_km: float, disaster_type: str) -> int:
+        """Make sure every tile around the search is cached. Returns the number of tiles fetched upstream."""
+        disaster_type = disaster_type.lower()
+        if disaster_type not in OVERPASS_AMENITY_SETS:
+            return 0
+        
+        keys = [(disaster_type, x, y) for x, y in tiles_covering(lat, lon, radius_km, self.zoom)]
+        missing, waiting = [], []
+        with self._lock:
+            for key in keys:
+                if self._fresh_in_memory(key):
+                    self.stats['memory_hits'] += 1
+                elif key in self._inflight:
+                    waiting.append(self._inflight[key])
+                else:
+                    missing.append(key)
+                    self._inflight[key] = Future()
+        
+        # Disk lookups happen outside the lock; only truly missing tiles go upstream
+        to_fetch = []
+        for key in missing:
+            entry = self._read_disk(key)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self.stats['disk_hits'] += 1
+                self._resolve(key, entry)
+            else:
+                to_fetch.append(key)
+        
+        try:
+            if to_fetch:
+                self._fetch_tiles(disaster_type, to_fetch)
+        finally:
+            # Never leave waiters hanging, even if the fetch failed
+            with self._lock:
+                leftovers = [key for key in to_fetch if key in self._inflight]
+            for key in leftovers:
+                self._resolve(key, None)
+        
+        for call in waiting:
+            call.result(timeout=60)
+        return len(to_fetch)
+    
+    def _fresh_in_memory(self, key) -> bool:
+        entry = self._memory.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return False
+        self._memory.move_to_end(key)
+        return True
+    
+    def _resolve(self, key, entry: Optional[Tuple[float, List[Dict[str, Any]]]]):
+        """Store a tile (if any) and release callers waiting on it"""
+        with self._lock:
+            if entry is not None:
+                self._memory[key] = entry
+                self._memory.move_to_end(key)
+                while len(self._memory) > self.max_memory_tiles:
+                    self._memory.popitem(last=False)
+            call = self._inflight.pop(key, None)
+        if call is not None:
+            call.set_result(entry)
+    
+    def _disk_path(self, key) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        disaster_type, x, y = key
+        return os.path.join(self.cache_dir, disaster_type, str(self.zoom), str(x), f"{y}.json")
+    
+    def _read_disk(self, key) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        path = self._disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return data['fetched_at'], data['elements']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable Overpass tile cache {path}: {str(e)}")
+            return None
+    
+    def _write_disk(self, key, entry: Tuple[float, List[Dict[str, Any]]]):
+        path = self._disk_path(key)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'fetched_at': entry[0], 'elements': entry[1]}, f)
+        os.replace(tmp_path, path)
+    
+    def _build_query(self, disaster_type: str, bbox: Tuple[float, float, float, float]) -> str:
+        south, west, north, east = bbox
+        clauses = ''.join(
+            f'node["{key}"="{value}"]({south},{west},{north},{east});'
+            for key, value, _ in OVERPASS_AMENITY_SETS[disaster_type]
+        )
+        return f"[out:json][timeout:25];({clauses});out center;"
+    
+    def _fetch_tiles(self, disaster_type: str, keys: List[Tuple[str, int, int]]):
+        """Fetch all missing tiles with one bounding-box query and bucket the results per tile"""
+        bounds = [tile_bounds(x, y, self.zoom) for _, x, y in keys]
+        bbox = (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds))
+        
+        if not self.limiter.acquire(timeout=5):
+            raise RateLimitExceeded("Overpass request budget exhausted")
+        try:
+            response = self.session.post(self.overpass_url, data={'data': self._build_query(disaster_type, bbox)}, timeout=30)
+            response.raise_for_status()
+            elements = response.json().get('elements', [])
+        except Exception:
+            with self._lock:
+                self.stats['upstream_errors'] += 1
+            raise
+        
+        spot_types = {(key, value): spot_type for key, value, spot_type in OVERPASS_AMENITY_SETS[disaster_type]}
+        wanted = set(keys)
+        fetched_at = time.time()
+        per_tile: Dict[Tuple[str, int, int], List[Dict[str, Any]]] = {key: [] for key in keys}
+        for element in elements:
+            lat = element.get('lat', element.get('center', {}).get('lat'))
+            lon = element.get('lon', element.get('center', {}).get('lon'))
+            if lat is None or lon is None:
+                continue
+            key = (disaster_type, *tile_xy(lat, lon, self.zoom))
+            if key not in wanted:
+                continue
+            tags = element.get('tags', {})
+            spot_type = next((spot_type for (k, v), spot_type in spot_types.items() if tags.get(k) == v), 'other')
+            per_tile[key].append({
+                'osm_id': f"{element.get('type', 'node')}:{element['id']}",
+                'name': tags.get('name') or tags.get('amenity') or spot_type.replace('_', ' ').title(),
+                'spot_type': spot_type,
+                'latitude': lat,
+                'longitude': lon,
+                'address': tags.get('addr:full') or tags.get('addr:street'),
+                'contact_number': tags.get('phone')
+            })
+        
+        with self._lock:
+            self.stats['upstream_fetches'] += 1
+        self._upsert_spots(disaster_type, [poi for pois in per_tile.values() for poi in pois])
+        for key, pois in per_tile.items():
+            entry = (fetched_at, pois)
+            self._write_disk(key, entry)
+            self._resolve(key, entry)
+        logger.info(f"Fetched {len(elements)} Overpass POIs for {len(keys)} {disaster_type} tiles")
+    
+    def _upsert_spots(self, disaster_type: str, pois: List[Dict[str, Any]]):
+        """Insert or refresh fetched POIs in the SafeSpot table"""
+        from models import SafeSpot
+        
+        for start in range(0, len(pois), 500):
+            chunk = pois[start:start + 500]
+            spot_ids = [f"osm:{poi['osm_id']}" for poi in chunk]
+            existing = {spot.spot_id: spot for spot in SafeSpot.query.filter(SafeSpot.spot_id.in_(spot_ids))}
+            for spot_id, poi in zip(spot_ids, chunk):
+                spot = existing.get(spot_id)
+                if spot is None:
+                    spot = SafeSpot(spot_id=spot_id, disaster_types=[])
+                    self.db.session.add(spot)
+                    existing[spot_id] = spot
+                spot.name = poi['name'][:200]
+                spot.spot_type = poi['spot_type']
+                spot.latitude = poi['latitude']
+                spot.longitude = poi['longitude']
+                spot.address = poi['address']
+                spot.contact_number = (poi['contact_number'] or '')[:20] or None
+                if disaster_type not in (spot.disaster_types or []):
+                    spot.disaster_types = (spot.disaster_types or []) + [disaster_type]
+            self.db.session.commit()
+
 class SafeSpotService:
     """Service for finding safe evacuation spots"""
     
-    def __init__(self):
-        self.overpass_url = "https://overpass-api.de/api/interpreter"
+    def __init__(self, index=None, overpass: OverpassTileCache = None):
+        self.overpass_url = overpass.overpass_url if overpass else "https://overpass-api.de/api/interpreter"
+        self.index = index
+        self.overpass = overpass
     
-    def find_safe_spots(self, lat: float, lon: float, disaster_type: str, radius_km: int = 5) -> List[Dict[str, Any]]:
-        """Find safe spots for evacuation based on disaster type"""
+    def find_safe_spots(self, lat: float, lon: float, disaster_type: str, radius_km: float = 5, 
+                        limit: int = 20, spot_type: str = None) -> List[Dict[str, Any]]:
+        """Find safe spots for evacuation based on disaster type, nearest first"""
+        from models import SafeSpot
+        
+        if self.overpass is not None and disaster_type:
+            try:
+                self.overpass.ensure_area(lat, lon, radius_km, disaster_type)
+            except Exception as e:
+                logger.warning(f"Overpass unavailable, serving stored safe spots: {str(e)}")
+                self.overpass.db.session.rollback()
+        
         try:
-            # This would integrate with OpenStreetMap Overpass API
-            # For now, return mock data
-            return self._get_mock_safe_spots(lat, lon, disaster_type)
+            nearest = self.index.query(lat, lon, radius_km=radius_km, k=limit, 
+                                       spot_type=spot_type, disaster_type=disaster_type)
+            if not nearest:
+                return []
+            
+            serializer = ModelSerializer.for_model(SafeSpot, empty_lists=('facilities', 'disaster_types'))
+            rows = SafeSpot.query.with_entities(*serializer.columns).filter(
+                SafeSpot.id.in_([spot_id for spot_id, _ in nearest])
+            )
+            spots = {spot['id']: spot for spot in serializer.rows(rows)}
+            results = []
+            for spot_id, distance in nearest:
+                if spot_id in spots:
+                    spot = spots[spot_id]
+                    spot['distance_km'] = round(distance, 2)
+                    results.append(spot)
+            return results
         except Exception as e:
             logger.error(f"Error finding safe spots: {str(e)}")
             return []
-    
-    def _get_mock_safe_spots(self, lat: float, lon: float, disaster_type: str) -> List[Dict[str, Any]]:
-        """Return mock safe spots"""
-        base_spots = [
-            {
-                'id': 1,
-                'name': 'Local Park',
-                'type': 'open_space',
-                'latitude': lat + 0.01,
-                'longitude': lon + 0.01,
-                'distance_km': 1.2,
-                'capacity': 100,
-                'facilities': ['shelter', 'water', 'toilets']
-            },
-            {
-                'id': 2,
-                'name': 'Community Center',
-                'type': 'shelter',
-                'latitude': lat - 0.01,
-                'longitude': lon + 0.02,
-                'distance_km': 2.1,
-                'capacity': 200,
-                'facilities': ['shelter', 'medical', 'food']
-            }
-        ]
-        
-        # Filter spots based on disaster type
-        if disaster_type == 'earthquake':
-            return [spot for spot in base_spots if spot['type'] == 'open_space']
-        elif disaster_type == 'flood':
-            return [spot for spot in base_spots if spot['type'] in ['shelter', 'open_space']]
-        else:
-            return base_spots
 
-class FileService:
-    """Service for handling file uploads and management"""
+class ElevationService:
+    """Elevation lookups with a persistent grid-quantized cache.
     
-    def __init__(self, upload_folder: str, allowed_extensions: set):
-        self.upload_folder = upload_folder
-        self.allowed_extensions = allowed_extensions
-        os.makedirs(upload_folder, exist_ok=True)
+    Points are snapped to a grid (``grid_deg``, ~110 m by default) and each
+    cell is fetched from the elevation API at most once: later lookups are
+    served from an in-memory LRU or the ``elevation_samples`` table. All
+    uncached cells of a request go upstream in one batched call.
+    """
     
-    def allowed_file(self, filename: str) -> bool:
-        """Check if file extension is allowed"""
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+    def __init__(self, db=None, api_url: str = "https://api.open-elevation.com/api/v1/lookup",
+                 grid_deg: float = 0.001, max_batch: int = 500, requests_per_minute: int = 60,
+                 max_memory_cells: int = 200000):
+        self.db = db
+        self.api_url = api_url
+        self.grid_deg = grid_deg
+        self.max_batch = max_batch
+        self.max_memory_cells = max_memory_cells
+        self._columns = int(round(360 / grid_deg)) + 1
+        self._memory: 'OrderedDict[int, Optional[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        self.limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max(1, requests_per_minute // 10))
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'upstream_cells': 0, 'upstream_calls': 0}
     
-    def save_uploaded_files(self, files) -> List[str]:
-        """Save uploaded files and return list of file paths"""
-        saved_files = []
-        for file in files:
-            if file and self.allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Add timestamp to avoid conflicts
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                filepath = os.path.join(self.upload_folder, filename)
-                file.save(filepath)
-                saved_files.append(filename)
-                logger.info(f"File saved: {filename}")
-        return saved_files
+    def _cell(self, lat: float, lon: float) -> Tuple[int, float, float]:
+        """Packed cell key and cell-centre coordinates for a point"""
+        row = int(round((lat + 90) / self.grid_deg))
+        col = int(round((lon + 180) / self.grid_deg))
+        return row * self._columns + col, round(row * self.grid_deg - 90, 6), round(col * self.grid_deg - 180, 6)
     
-    def delete_file(self, filename: str) -> bool:
-        """Delete a file from the upload folder"""
-        try:
-            filepath = os.path.join(self.upload_folder, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                logger.info(f"File deleted: {filename}")
-                return True
-            return False
-        except Exception as e:
-            logger.error(f"Error deleting file {filename}: {str(e)}")
-            return False
-
-class EmergencyKitGenerator:
-    """Service for generating emergency kit configurations"""
+    def lookup(self, points: List[Tuple[float, float]]) -> List[Optional[float]]:
+        """Elevations in meters for (lat, lon) points; None where unknown"""
+        from models import ElevationSample
+        
+        cells = [self._cell(lat, lon) for lat, lon in points]
+        found: Dict[int, Optional[float]] = {}
+        
+        with self._lock:
+            for key, _, _ in cells:
+                if key in self._memory and key not in found:
+                    found[key] = self._memory[key]
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+        
+        pending = {key: (lat, lon) for key, lat, lon in cells if key not in found}
+        keys = list(pending)
+        for start in range(0, len(keys), 900):
+            for key, elevation in self.db.session.query(ElevationSample.cell_key, ElevationSample.elevation).filter(
+                ElevationSample.cell_key.in_(keys[start:start + 900])
+            ):
+                found[key] = elevation
+                self.stats['db_hits'] += 1
+        
+        missing = [(key, lat, lon) for key, (lat, lon) in pending.items() if key not in found]
+        for start in range(0, len(missing), self.max_batch):
+            batch = missing[start:start + self.max_batch]
+            try:
+                elevations = self._fetch(batch)
+            except Exception as e:
+                logger.error(f"Error fetching elevations: {str(e)}")
+                break
+            self._store(batch, elevations)
+            found.update({key: elevation for (key, _, _), elevation in zip(batch, elevations)})
+        
+        with self._lock:
+            for key in pending:
+                if key in found:
+                    self._memory[key] = found[key]
+            while len(self._memory) > self.max_memory_cells:
+                self._memory.popitem(last=False)
+        
+        return [found.get(key) for key, _, _ in cells]
     
-    def __init__(self):
-        self.base_items = {
-            'water': {'quantity_per_person_per_day': 4, 'unit': 'liters', 'priority': 'high'},
-            'food': {'quantity_per_person_per_day': 3, 'unit': 'meals', 'priority': 'high'},
-            'first_aid_kit': {'quantity': 1, 'unit': 'kit', 'priority': 'high'},
-            'flashlight': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'high'},
-            'batteries': {'quantity': 20, 'unit': 'pieces', 'priority': 'high'},
-            'radio': {'quantity': 1, 'unit': 'piece', 'priority': 'medium'},
-            'whistle': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'medium'},
-            'blankets': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'medium'},
-            'important_documents': {'quantity': 1, 'unit': 'set', 'priority': 'high'},
-            'cash': {'quantity': 5000, 'unit': 'rupees', 'priority': 'high'}
-        }
+    def _fetch(self, batch: List[Tuple[int, float, float]]) -> List[Optional[float]]:
+        """One upstream call for a batch of cell centres"""
+        if not self.limiter.acquire(timeout=5):
+            raise RateLimitExceeded("Elevation API request budget exhausted")
         
-        self.disaster_specific_items = {
-            'Flood': {
-                'water_purification_tablets': {'quantity': 50, 'unit': 'tablets', 'priority': 'high'},
-                'waterproof_bags': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'high'},
-                'life_jackets': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'high'},
-                'sandbags': {'quantity': 20, 'unit': 'bags', 'priority': 'medium'}
-            },
-            'Earthquake': {
-                'hard_hats': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'high'},
-                'work_gloves': {'quantity_per_person': 2, 'unit': 'pairs', 'priority': 'medium'},
-                'crowbar': {'quantity': 1, 'unit': 'piece', 'priority': 'medium'},
-                'dust_masks': {'quantity_per_person': 5, 'unit': 'pieces', 'priority': 'high'}
-            },
-            'Cyclone': {
-                'tarps': {'quantity': 2, 'unit': 'pieces', 'priority': 'high'},
-                'rope': {'quantity': 50, 'unit': 'meters', 'priority': 'medium'},
-                'duct_tape': {'quantity': 5, 'unit': 'rolls', 'priority': 'medium'},
-                'emergency_shelter': {'quantity': 1, 'unit': 'piece', 'priority': 'high'}
-            },
-            'Landslide': {
-                'emergency_shovel': {'quantity': 1, 'unit': 'piece', 'priority': 'high'},
-                'walkie_talkies': {'quantity': 2, 'unit': 'pairs', 'priority': 'medium'},
-                'emergency_blanket': {'quantity_per_person': 1, 'unit': 'piece', 'priority': 'high'}
-            }
-        }
+        response = self.session.post(self.api_url, json={
+            'locations': [{'latitude': lat, 'longitude': lon} for _, lat, lon in batch]
+        }, timeout=30)
+        response.raise_for_status()
+        results = response.json().get('results', [])
+        if len(results) != len(batch):
+            raise ValueError(f"Expected {len(batch)} elevations, got {len(results)}")
+        
+        self.stats['upstream_calls'] += 1
+        self.stats['upstream_cells'] += len(batch)
+        return [result.get('elevation') for result in results]
     
-    def generate_kit(self, disaster_type: str, family_size: int, adults: int, 
-                    children: int, seniors: int, has_medical: bool, 
-                    has_disabilities: bool, has_pets: bool, duration: int, 
-                    budget: str) -> Dict[str, Any]:
-        """Generate emergency kit configuration"""
-        
-        # Calculate quantities for base items
-        kit_items = {}
-        for item_name, item_config in self.base_items.items():
-            if 'quantity_per_person_per_day' in item_config:
-                quantity = item_config['quantity_per_person_per_day'] * family_size * duration
-            elif 'quantity_per_person' in item_config:
-                quantity = item_config['quantity_per_person'] * family_size
-            else:
-                quantity = item_config['quantity']
-            
-            kit_items[item_name] = {
-                'quantity': f"{quantity} {item_config['unit']}",
-                'priority': item_config['priority']
-            }
+    def _store(self, batch: List[Tuple[int, float, float]], elevations: List[Optional[float]]):
+        """Persist fetched cells, ignoring cells another request stored first"""
+        from models import ElevationSample
         
-        # Add disaster-specific items
-        if disaster_type in self.disaster_specific_items:
-            for item_name, item_config in self.disaster_specific_items[disaster_type].items():
-                if 'quantity_per_person' in item_config:
-                    quantity = item_config['quantity_per_person'] * family_size
+        rows = [
+            {'cell_key': key, 'latitude': lat, 'longitude': lon, 'elevation': elevation, 
+             'source': 'open-elevation', 'fetched_at': datetime.utcnow()}
+            for (key, lat, lon), elevation in zip(batch, elevations)
+        ]
+        dialect = self.db.engine.dialect.name
+        try:
+            if dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
                 else:
-                    quantity = item_config['quantity']
-                
-                kit_items[item_name] = {
-                    'quantity': f"{quantity} {item_config['unit']}",
-                    'priority': item_config['priority']
-                }
-        
-        # Add special needs items
-        if has_medical:
-            kit_items.update({
-                'prescription_medications': {'quantity': f"{duration + 3} days supply", 'priority': 'high'},
-                'medical_equipment': {'quantity': 'As needed', 'priority': 'high'},
-                'medical_records': {'quantity': '1 copy', 'priority': 'high'}
-            })
-        
-        if has_disabilities:
-            kit_items.update({
-                'assistive_devices': {'quantity': 'As needed', 'priority': 'high'},
-                'communication_aids': {'quantity': 'As needed', 'priority': 'high'}
-            })
+                    from sqlalchemy.dialects.postgresql import insert
+                self.db.session.execute(insert(ElevationSample).values(rows).on_conflict_do_nothing(index_elements=['cell_key']))
+            else:
+                for row in rows:
+                    self.db.session.merge(ElevationSample(**row))
+            self.db.session.commit()
+        except Exception as e:
+            logger.error(f"Error caching elevations: {str(e)}")
+            self.db.session.rollback()
+
+def incident_confirmation_email(report_id: str, incident_type: str, location: str, 
+                                description: str, status: str = 'pending') -> str:
+    """Body of the confirmation email sent to incident reporters"""
+    return f"""
+        Thank you for reporting the incident. Your report has been received and assigned ID: {report_id}
         
-        if has_pets:
-            kit_items.update({
-                'pet_food': {'quantity': f"{duration * 2} days", 'priority': 'medium'},
-                'pet_carrier': {'quantity': '1+', 'priority': 'medium'},
-                'pet_medications': {'quantity': 'As needed', 'priority': 'medium'}
-            })
+        Incident Details:
+        - Type: {incident_type}
+        - Location: {location}
+        - Description: {description}
+        - Status: {status}
         
-        # Calculate estimated cost
-        cost_multipliers = {'basic': 1.0, 'standard': 1.5, 'premium': 2.0}
-        multiplier = cost_multipliers.get(budget, 1.0)
-        base_cost = family_size * duration * 500  # Base cost per person per day
-        estimated_cost = int(base_cost * multiplier)
+        We will review your report and contact you if additional information is needed.
         
-        return {
-            'items': kit_items,
-            'estimated_cost': estimated_cost,
-            'total_items': len(kit_items),
-            'high_priority_items': len([item for item in kit_items.values() if item['priority'] == 'high']),
-            'disaster_type': disaster_type,
-            'family_size': family_size,
+        Stay safe,
+        DisasterSense Team
+        """
+
+class IncidentStatsRollup:
+    """Incrementally maintained incident counts for the dashboards.
+    
+    Every ORM insert, update or delete of an IncidentReport adjusts the
+    matching ``incident_stats`` rows on the same connection, so the rollup
+    commits or rolls back with the report itself. Core bulk inserts, which
+    bypass ORM events, call ``record_rows``. Readers sum rollup rows instead
+    of grouping the raw table.
+    """
+    
+    DIMENSIONS = ('hour', 'incident_type', 'status', 'priority', 'geo_cell')
+    KEY_FIELDS = ('created_at', 'incident_type', 'status', 'priority', 'latitude', 'longitude')
+    
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.cell_deg = 1.0
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize the rollup and subscribe to IncidentReport changes"""
+        from models import IncidentReport
+        from sqlalchemy import event
+        
+        self.app = app
+        self.db = db
+        self.cell_deg = app.config.get('INCIDENT_STATS_CELL_DEG', 1.0)
+        event.listen(IncidentReport, 'after_insert', self._after_insert)
+        event.listen(IncidentReport, 'after_update', self._after_update)
+        event.listen(IncidentReport, 'after_delete', self._after_delete)
+    
+    def key(self, created_at: datetime, incident_type: str, status: Optional[str], priority: Optional[str],
+            latitude: Optional[float], longitude: Optional[float]) -> Tuple[datetime, str, str, str, str]:
+        """Rollup key for one report's field values"""
+        if latitude is None or longitude is None:
+            geo_cell = 'unknown'
+        else:
+            row, col = cell_of(latitude, longitude, self.cell_deg)
+            geo_cell = f"{row}:{col}"
+        return (created_at.replace(minute=0, second=0, microsecond=0), incident_type, 
+                status or 'pending', priority or 'medium', geo_cell)
+    
+    def _after_insert(self, mapper, connection, target):
+        self._apply(connection, {self.key(*(getattr(target, field) for field in self.KEY_FIELDS)): 1})
+    
+    def _after_update(self, mapper, connection, target):
+        from sqlalchemy import inspect
+        
+        state = inspect(target)
+        old_values = []
+        for field in self.KEY_FIELDS:
+            history = state.attrs[field].history
+            old_values.append(history.deleted[0] if history.deleted else getattr(target, field))
+        old_key = self.key(*old_values)
+        new_key = self.key(*(getattr(target, field) for field in self.KEY_FIELDS))
+        if old_key != new_key:
+            self._apply(connection, {old_key: -1, new_key: 1})
+    
+    def _after_delete(self, mapper, connection, target):
+        self._apply(connection, {self.key(*(getattr(target, field) for field in self.KEY_FIELDS)): -1})
+    
+    def record_rows(self, rows: List[Dict[str, Any]]):
+        """Count rows inserted outside the ORM (dicts with the KEY_FIELDS) in the current session"""
+        deltas: Dict[tuple, int] = {}
+        for row in rows:
+            key = self.key(*(row.get(field) for field in self.KEY_FIELDS))
+            deltas[key] = deltas.get(key, 0) + 1
+        self._apply(self.db.session.connection(), deltas)
+    
+    def _apply(self, connection, deltas: Dict[tuple, int]):
+        """Add count deltas to the rollup rows, creating missing rows"""
+        from models import IncidentStat
+        
+        table = IncidentStat.__table__
+        params = [
+            {'hour_bucket': key[0], 'incident_type': key[1], 'status': key[2], 'priority': key[3],
+             'geo_cell': key[4], 'count': delta}
+            for key, delta in deltas.items() if delta
+        ]
+        if not params:
+            return
+        
+        key_columns = ['hour_bucket', 'incident_type', 'status', 'priority', 'geo_cell']
+        dialect = connection.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=key_columns, set_={'count': table.c['count'] + stmt.excluded['count']}
+            ), params)
+        else:
+            from sqlalchemy import and_, bindparam
+            
+            update = table.update().where(and_(*(table.c[column] == bindparam(f'k_{column}') for column in key_columns)))
+            for param in params:
+                result = connection.execute(
+                    update.values(count=table.c['count'] + param['count']),
+                    {f'k_{column}': param[column] for column in key_columns}
+                )
+                if result.rowcount == 0:
+                    connection.execute(table.insert(), param)
+    
+    def query(self, group_by: List[str], since: Optional[datetime] = None, until: Optional[datetime] = None,
+              filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Summed counts grouped by the given DIMENSIONS, largest first
+        
+        Whole hours between ``since`` and ``until`` are read from the rollup.
+        The partial hours at either end are counted exactly from
+        incident_reports, so bounds need not fall on the hour.
+        """
+        from models import IncidentStat
+        
+        start = until_hour = None
+        if since:
+            start = since.replace(minute=0, second=0, microsecond=0)
+            if start < since:
+                start += timedelta(hours=1)
+        if until:
+            until_hour = until.replace(minute=0, second=0, microsecond=0)
+        whole_hours = start is None or until_hour is None or start < until_hour
+        if whole_hours:
+            partial = [(low, high) for low, high in ((since, start), (until_hour, until)) if low and low < high]
+        else:
+            partial = [(since, until)]  # No whole hour between the bounds
+        
+        counts: Dict[tuple, int] = {}
+        if whole_hours:
+            columns = [(IncidentStat.hour_bucket if dimension == 'hour' else getattr(IncidentStat, dimension)).label(dimension)
+                       for dimension in group_by]
+            total = self.db.func.sum(IncidentStat.count).label('count')
+            query = self.db.session.query(*columns, total)
+            if start is not None:
+                query = query.filter(IncidentStat.hour_bucket >= start)
+            if until_hour is not None:
+                query = query.filter(IncidentStat.hour_bucket < until_hour)
+            for field, value in (filters or {}).items():
+                query = query.filter(getattr(IncidentStat, field) == value)
+            if columns:
+                query = query.group_by(*columns)
+            for row in query:
+                counts[tuple(row)[:-1]] = row.count or 0
+        for low, high in partial:
+            for group, count in self._count_reports(group_by, low, high, filters).items():
+                counts[group] = counts.get(group, 0) + count
+        
+        results = []
+        for group, count in sorted(counts.items(), key=lambda item: -item[1]):
+            if not count:
+                continue
+            result = dict(zip(group_by, group), count=count)
+            if 'hour' in result:
+                result['hour'] = result['hour'].isoformat()
+            results.append(result)
+        return results
+    
+    def _count_reports(self, group_by: List[str], since: datetime, until: datetime,
+                       filters: Optional[Dict[str, str]] = None) -> Dict[tuple, int]:
+        """Counts grouped like the rollup, from the reports created in [since, until)"""
+        from models import IncidentReport
+        
+        positions = {'hour': 0, 'incident_type': 1, 'status': 2, 'priority': 3, 'geo_cell': 4}
+        rows = self.db.session.query(*(getattr(IncidentReport, field) for field in self.KEY_FIELDS)).filter(
+            IncidentReport.created_at >= since, IncidentReport.created_at < until
+        )
+        counts: Dict[tuple, int] = {}
+        for row in rows:
+            key = self.key(*row)
+            if all(key[positions[field]] == value for field, value in (filters or {}).items()):
+                group = tuple(key[positions[dimension]] for dimension in group_by)
+                counts[group] = counts.get(group, 0) + 1
+        return counts
+    
+    def summary(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Total plus counts by type, status and priority, from one grouped query"""
+        summary = {'total': 0, 'by_type': {}, 'by_status': {}, 'by_priority': {}}
+        for row in self.query(['incident_type', 'status', 'priority'], since, until, filters):
+            summary['total'] += row['count']
+            for field, bucket in (('incident_type', 'by_type'), ('status', 'by_status'), ('priority', 'by_priority')):
+                summary[bucket][row[field]] = summary[bucket].get(row[field], 0) + row['count']
+        return summary
+    
+    def rebuild(self, chunk_size: int = 5000) -> int:
+        """Recompute the rollup from incident_reports; returns the number of rollup rows"""
+        from models import IncidentReport, IncidentStat
+        from sqlalchemy import select
+        
+        deltas: Dict[tuple, int] = {}
+        stmt = select(*(getattr(IncidentReport, field) for field in self.KEY_FIELDS))
+        for rows in self.db.session.execute(stmt.execution_options(yield_per=chunk_size)).partitions():
+            for row in rows:
+                key = self.key(*row)
+                deltas[key] = deltas.get(key, 0) + 1
+        
+        try:
+            self.db.session.query(IncidentStat).delete()
+            self._apply(self.db.session.connection(), deltas)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        logger.info(f"Incident stats rebuilt: {len(deltas)} rollup rows")
+        return len(deltas)
+
+class IncidentSearchIndex:
+    """Full-text search over incident report descriptions and locations.
+    
+    On SQLite builds with FTS5 the index is an external-content FTS5 table,
+    ``incident_search``, kept in sync by triggers on ``incident_reports``
+    (so core bulk inserts are covered too) and ranked by bm25. Elsewhere it
+    is ``incident_search_terms``, a plain inverted index maintained from ORM
+    events and ``record_rows`` in the same transaction as the report, and
+    ranked by tf-idf. Either way every query term must match, and a term
+    written ``term*`` (or the last one, as typed) matches as a prefix.
+    Scoring costs a pass over every match, so a query matching more than
+    ``max_ranked`` reports ranks only the newest ``max_ranked`` of them.
+    """
+    
+    TABLE = 'incident_search'
+    FIELDS = ('description', 'location')
+    FIELD_WEIGHTS = (1.0, 2.0)  # A locality named in the location outranks a passing mention
+    MAX_TERM_LENGTH = 64
+    
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.configured_backend = 'auto'
+        self.max_ranked = 10000
+        self._backend = None
+        self._ready = False
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize the index and follow IncidentReport changes"""
+        from models import IncidentReport
+        from sqlalchemy import event
+        
+        self.app = app
+        self.db = db
+        self.configured_backend = app.config.get('INCIDENT_SEARCH_BACKEND', 'auto')
+        self.max_ranked = app.config.get('INCIDENT_SEARCH_MAX_RANKED', 10000)
+        event.listen(IncidentReport.__table__, 'after_create', self._after_create)
+        event.listen(IncidentReport, 'after_insert', self._after_insert)
+        event.listen(IncidentReport, 'after_update', self._after_update)
+        event.listen(IncidentReport, 'after_delete', self._after_delete)
+    
+    def backend_for(self, connection) -> str:
+        """'fts5' or 'terms', decided once from the configuration and the database"""
+        if self._backend is None:
+            backend = self.configured_backend
+            if backend == 'auto':
+                backend = 'terms'
+                if connection.dialect.name == 'sqlite':
+                    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+                    if 'ENABLE_FTS5' in options:
+                        backend = 'fts5'
+            self._backend = backend
+        return self._backend
+    
+    @property
+    def backend(self) -> str:
+        if self._backend is None:
+            with self.db.engine.connect() as connection:
+                self.backend_for(connection)
+        return self._backend
+    
+    @classmethod
+    def tokenize(cls, text: Optional[str]) -> List[str]:
+        """Lowercased words with accents stripped, as FTS5's unicode61 tokenizer sees them"""
+        import re
+        import unicodedata
+        
+        if not text:
+            return []
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+        return [word[:cls.MAX_TERM_LENGTH] for word in re.findall(r'\w+', text.lower())]
+    
+    @classmethod
+    def parse_query(cls, query: str, prefix: bool = True) -> List[Tuple[str, bool]]:
+        """Query terms as (term, is_prefix); the last term is a prefix when ``prefix`` is set"""
+        import re
+        
+        terms = []
+        for word, star in re.findall(r'(\w+)(\*?)', query):
+            for term in cls.tokenize(word):
+                terms.append((term, bool(star)))
+        if terms and prefix:
+            terms[-1] = (terms[-1][0], True)
+        return terms
+    
+    def postings(self, description: Optional[str], location: Optional[str]) -> Dict[str, float]:
+        """Field-weighted term counts of one report"""
+        weights: Dict[str, float] = {}
+        for text, field_weight in zip((description, location), self.FIELD_WEIGHTS):
+            for term in self.tokenize(text):
+                weights[term] = weights.get(term, 0.0) + field_weight
+        return weights
+    
+    def _create_fts(self, connection) -> bool:
+        """Create the FTS5 table and its sync triggers; False if they already exist"""
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.TABLE,)
+        ).first()
+        if exists:
+            return False
+        table = self.TABLE
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {table} USING fts5(description, location, content='incident_reports', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        delete = (f"INSERT INTO {table}({table}, rowid, description, location) "
+                  f"VALUES ('delete', old.id, old.description, old.location);")
+        insert = f"INSERT INTO {table}(rowid, description, location) VALUES (new.id, new.description, new.location);"
+        connection.exec_driver_sql(f"CREATE TRIGGER {table}_ai AFTER INSERT ON incident_reports BEGIN {insert} END")
+        connection.exec_driver_sql(f"CREATE TRIGGER {table}_ad AFTER DELETE ON incident_reports BEGIN {delete} END")
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER {table}_au AFTER UPDATE OF description, location ON incident_reports BEGIN {delete} {insert} END"
+        )
+        return True
+    
+    def _after_create(self, target, connection, **kw):
+        if self.backend_for(connection) == 'fts5':
+            self._create_fts(connection)
+    
+    def ensure(self):
+        """Create the FTS5 index on a database that predates it, filling it from the reports"""
+        if self._ready:
+            return
+        with self.db.engine.begin() as connection:
+            if self.backend_for(connection) == 'fts5' and self._create_fts(connection):
+                connection.exec_driver_sql(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES ('rebuild')")
+                logger.info("Created the incident search index")
+        self._ready = True
+    
+    def _after_insert(self, mapper, connection, target):
+        if self.backend_for(connection) == 'terms':
+            self._write(connection, {target.id: self.postings(target.description, target.location)})
+    
+    def _after_update(self, mapper, connection, target):
+        from sqlalchemy import inspect
+        
+        if self.backend_for(connection) != 'terms':
+            return
+        state = inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in self.FIELDS):
+            self._write(connection, {target.id: self.postings(target.description, target.location)})
+    
+    def _after_delete(self, mapper, connection, target):
+        if self.backend_for(connection) == 'terms':
+            self._write(connection, {target.id: {}})
+    
+    def record_rows(self, rows: List[Dict[str, Any]]):
+        """Index rows just inserted outside the ORM (dicts with report_id, description and location)"""
+        from models import IncidentReport
+        
+        session = self.db.session
+        if self.backend_for(session.connection()) != 'terms' or not rows:
+            return
+        ids = {row['report_id']: row['id'] for row in rows if row.get('id') is not None}
+        if len(ids) < len(rows):
+            ids = dict(session.query(IncidentReport.report_id, IncidentReport.id).filter(
+                IncidentReport.report_id.in_([row['report_id'] for row in rows])
+            ))
+        self._write(session.connection(), {
+            ids[row['report_id']]: self.postings(row.get('description'), row.get('location')) for row in rows
+        })
+    
+    def _write(self, connection, postings: Dict[int, Dict[str, float]]):
+        """Replace the postings of the given incident ids"""
+        from models import IncidentSearchTerm
+        
+        table = IncidentSearchTerm.__table__
+        connection.execute(table.delete().where(table.c.incident_id.in_(list(postings))))
+        params = [
+            {'term': term, 'incident_id': incident_id, 'weight': weight}
+            for incident_id, weights in postings.items() for term, weight in weights.items()
+        ]
+        if params:
+            connection.execute(table.insert(), params)
+    
+    def search(self, query: str, filters: Optional[Dict[str, str]] = None, since: Optional[datetime] = None,
+               until: Optional[datetime] = None, limit: int = 20, offset: int = 0,
+               prefix: bool = True) -> List[Tuple[int, float]]:
+        """(incident id, score) of the best matches, highest score first
+        
+        ``filters`` holds exact IncidentReport column values (status,
+        incident_type); ``since``/``until`` bound created_at.
+        """
+        terms = self.parse_query(query, prefix)
+        if not terms:
+            return []
+        self.ensure()
+        if self.backend == 'fts5':
+            return self._search_fts(terms, filters or {}, since, until, limit, offset)
+        return self._search_terms(terms, filters or {}, since, until, limit, offset)
+    
+    def _search_fts(self, terms, filters, since, until, limit, offset) -> List[Tuple[int, float]]:
+        from sqlalchemy import text
+        
+        params = {
+            'match': ' '.join(f'"{term}"*' if is_prefix else f'"{term}"' for term, is_prefix in terms),
+            'limit': limit, 'offset': offset
+        }
+        conditions = [f"{self.TABLE} MATCH :match"]
+        for field, value in filters.items():
+            conditions.append(f"r.{field} = :{field}")
+            params[field] = value
+        if since:
+            conditions.append("r.created_at >= :since")
+            params['since'] = since
+        if until:
+            conditions.append("r.created_at < :until")
+            params['until'] = until
+        source = f"FROM {self.TABLE} JOIN incident_reports r ON r.id = {self.TABLE}.rowid"
+        
+        # Walking matches in rowid order is cheap; the oldest of the newest max_ranked bounds the scored set
+        floor = self.db.session.execute(text(
+            f"SELECT r.id {source} WHERE {' AND '.join(conditions)} ORDER BY {self.TABLE}.rowid DESC LIMIT 1 OFFSET :window"
+        ), dict(params, window=self.max_ranked - 1)).scalar()
+        if floor is not None:
+            conditions.append(f"{self.TABLE}.rowid >= :floor")
+            params['floor'] = floor
+        
+        weights = ', '.join(str(weight) for weight in self.FIELD_WEIGHTS)
+        # bm25() is lower for better matches
+        rows = self.db.session.execute(text(
+            f"SELECT r.id, -bm25({self.TABLE}, {weights}) AS score {source} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY score DESC, r.id DESC LIMIT :limit OFFSET :offset"
+        ), params)
+        return [(row_id, score) for row_id, score in rows]
+    
+    def _search_terms(self, terms, filters, since, until, limit, offset) -> List[Tuple[int, float]]:
+        import math
+        from models import IncidentReport, IncidentSearchTerm
+        
+        session = self.db.session
+        documents = session.query(self.db.func.max(IncidentReport.id)).scalar() or 0  # Row count bound, from the index
+        counted = []
+        for term, is_prefix in terms:
+            if is_prefix:
+                # Every term starting with ``term`` sorts in [term, term with its last character incremented)
+                condition = (IncidentSearchTerm.term >= term) & (IncidentSearchTerm.term < term[:-1] + chr(ord(term[-1]) + 1))
+            else:
+                condition = IncidentSearchTerm.term == term
+            # Counting stops at a cap: past it the idf barely changes
+            matches = session.query(self.db.func.count()).select_from(
+                session.query(IncidentSearchTerm.id).filter(condition).limit(self.max_ranked * 10).subquery()
+            ).scalar()
+            if not matches:
+                return []
+            counted.append((matches, condition))
+        counted.sort(key=lambda item: item[0])
+        
+        # Only the newest max_ranked reports holding the rarest term can rank
+        matches, rarest = counted[0]
+        if matches > self.max_ranked:
+            floor = session.query(IncidentSearchTerm.incident_id).filter(rarest).order_by(
+                IncidentSearchTerm.incident_id.desc()
+            ).offset(self.max_ranked - 1).limit(1).scalar()
+            rarest = rarest & (IncidentSearchTerm.incident_id >= floor)
+        candidates = session.query(IncidentSearchTerm.incident_id).filter(rarest)
+        
+        query = session.query(IncidentReport.id)
+        score = None
+        for position, (matches, condition) in enumerate(counted):
+            idf = math.log(1 + (documents - matches + 0.5) / (matches + 0.5))
+            # The other terms are only looked up in the rarest term's reports
+            condition = rarest if position == 0 else condition & IncidentSearchTerm.incident_id.in_(candidates)
+            hits = session.query(
+                IncidentSearchTerm.incident_id, self.db.func.sum(IncidentSearchTerm.weight).label('weight')
+            ).filter(condition).group_by(IncidentSearchTerm.incident_id).subquery()
+            query = query.join(hits, hits.c.incident_id == IncidentReport.id)
+            score = hits.c.weight * idf if score is None else score + hits.c.weight * idf
+        
+        for field, value in filters.items():
+            query = query.filter(getattr(IncidentReport, field) == value)
+        if since:
+            query = query.filter(IncidentReport.created_at >= since)
+        if until:
+            query = query.filter(IncidentReport.created_at < until)
+        rows = query.add_columns(score.label('score')).order_by(
+            score.desc(), IncidentReport.id.desc()
+        ).offset(offset).limit(limit)
+        return [(row_id, float(row_score)) for row_id, row_score in rows]
+    
+    def rebuild(self, chunk_size: int = 5000) -> int:
+        """Rebuild the index from incident_reports; returns the number of reports indexed"""
+        from models import IncidentReport, IncidentSearchTerm
+        from sqlalchemy import select
+        
+        self._ready = False
+        self.ensure()
+        session = self.db.session
+        try:
+            if self.backend == 'fts5':
+                session.connection().exec_driver_sql(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES ('rebuild')")
+            else:
+                session.query(IncidentSearchTerm).delete()
+                stmt = select(IncidentReport.id, IncidentReport.description, IncidentReport.location)
+                for rows in session.execute(stmt.execution_options(yield_per=chunk_size)).partitions():
+                    self._write(session.connection(), {
+                        row_id: self.postings(description, location) for row_id, description, location in rows
+                    })
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        count = session.query(self.db.func.count(IncidentReport.id)).scalar()
+        logger.info(f"Incident search index rebuilt: {count} reports ({self.backend})")
+        return count
+
+class IncidentClusterer:
+    """Incremental spatio-temporal clustering of incident reports into DisasterEvents.
+    
+    A grid-hashed DBSCAN in which every report is a core point: reports of
+    the same type within ``radius_km`` and ``window`` of each other belong to
+    one event, and events are the connected groups. Reports are hashed into
+    grid cells one radius wide and one window long, and the cell key is kept
+    on the report, so placing a new report reads only the reports in the
+    neighbouring cells and nothing is reclustered. A report that links two
+    events merges them into the larger. Reports are placed as they are
+    flushed, in the same transaction. Reports inserted outside the ORM (the
+    bulk ingestor) are left unplaced and a background worker places them
+    after they commit, ``PLACEMENT_BATCH_SIZE`` at a time; ``notify`` wakes
+    it. Moving or deleting a report updates its event's count and centroid
+    but never splits the event; ``recluster`` rebuilds everything.
+    """
+    
+    PRIORITIES = ('low', 'medium', 'high', 'critical')
+    POSITION_FIELDS = ('latitude', 'longitude', 'datetime_occurred', 'incident_type')
+    EPOCH = datetime(1970, 1, 1)
+    PLACEMENT_BATCH_SIZE = 1000  # Small enough that a batch holds SQLite's write lock only briefly
+    
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.enabled = True
+        self.radius_km = 2.0
+        self.window = timedelta(hours=24)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize the clusterer and place reports as they are flushed"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+        
+        self.app = app
+        self.db = db
+        self.enabled = app.config.get('EVENT_CLUSTERING_ENABLED', True)
+        self.radius_km = app.config.get('EVENT_RADIUS_KM', 2.0)
+        self.window = timedelta(hours=app.config.get('EVENT_WINDOW_HOURS', 24))
+        event.listen(Session, 'before_flush', self._before_flush)
+    
+    @property
+    def cell_deg(self) -> float:
+        return self.radius_km / KM_PER_DEGREE_LAT
+    
+    def _bucket(self, when: datetime) -> int:
+        return int((when - self.EPOCH).total_seconds() // self.window.total_seconds())
+    
+    def cell_key(self, incident_type: str, latitude: float, longitude: float, when: datetime) -> str:
+        """Grid cell of a report: type, latitude row, longitude column and time bucket"""
+        row, col = cell_of(latitude, longitude, self.cell_deg)
+        return f"{incident_type}|{row}:{col}:{self._bucket(when)}"
+    
+    def neighbour_keys(self, incident_type: str, latitude: float, longitude: float, when: datetime) -> List[str]:
+        """Keys of every cell that can hold a report within the radius and window"""
+        row_min, col_min, row_max, col_max = cell_range(latitude, longitude, self.radius_km, self.cell_deg)
+        bucket = self._bucket(when)
+        return [
+            f"{incident_type}|{row}:{col}:{time_bucket}"
+            for row in range(row_min, row_max + 1)
+            for col in range(col_min, col_max + 1)
+            for time_bucket in (bucket - 1, bucket, bucket + 1)
+        ]
+    
+    def assign(self, session, reports: List[Dict[str, Any]]) -> List[Optional[Tuple[str, str]]]:
+        """Place reports (dicts of IncidentReport fields) in events; (event_id, cluster_cell) per report
+        
+        Reports without coordinates or a type get None. New, grown and merged
+        events are left in ``session`` for the caller to commit. The database
+        is read and written a constant number of times per call, not per
+        report, so placing a whole chunk at once is cheap.
+        """
+        from sqlalchemy import inspect
+        from models import IncidentReport, DisasterEvent
+        
+        points = []
+        for report in reports:
+            if report.get('latitude') is None or report.get('longitude') is None or not report.get('incident_type'):
+                points.append(None)
+                continue
+            when = report.get('datetime_occurred') or report.get('created_at') or datetime.utcnow()
+            if when.tzinfo is not None:
+                # Stored times are naive UTC, as the bulk ingestor writes them
+                when = when.astimezone(timezone.utc).replace(tzinfo=None)
+            latitude, longitude = float(report['latitude']), float(report['longitude'])
+            points.append((
+                report, latitude, longitude, when, self.cell_key(report['incident_type'], latitude, longitude, when),
+                self.neighbour_keys(report['incident_type'], latitude, longitude, when)
+            ))
+        if not any(points):
+            return [None] * len(reports)
+        
+        # Stored reports in every cell a new one could link to; the reports being placed are not counted
+        keys = sorted({key for point in points if point for key in point[5]})
+        moving = {point[0]['id'] for point in points if point and point[0].get('id') is not None}
+        when_column = self.db.func.coalesce(IncidentReport.datetime_occurred, IncidentReport.created_at)
+        grid: Dict[str, List[Tuple[float, float, datetime, str]]] = {}
+        events: Dict[str, Any] = {}
+        unsaved = set()  # Merged-away events that were never flushed, so no stored report points at them
+        merged: Dict[str, str] = {}  # merged-away event_id -> the event that absorbed it
+        
+        def find(event_id: str) -> str:
+            while event_id in merged:
+                event_id = merged[event_id]
+            return event_id
+        
+        with session.no_autoflush:
+            for start in range(0, len(keys), 500):
+                query = session.query(
+                    IncidentReport.id, IncidentReport.cluster_cell, IncidentReport.latitude, IncidentReport.longitude,
+                    when_column, IncidentReport.event_id
+                ).filter(IncidentReport.cluster_cell.in_(keys[start:start + 500]), IncidentReport.event_id.isnot(None))
+                for report_id, cell, latitude, longitude, when, event_id in query:
+                    if report_id not in moving:
+                        grid.setdefault(cell, []).append((latitude, longitude, when, event_id))
+            
+            # Every stored event the new reports can reach, in one pass
+            event_ids = sorted({neighbour[3] for cell in grid.values() for neighbour in cell})
+            for start in range(0, len(event_ids), 500):
+                for event in session.query(DisasterEvent).filter(DisasterEvent.event_id.in_(event_ids[start:start + 500])):
+                    events[event.event_id] = event
+            
+            placed = []
+            for point in points:
+                if point is None:
+                    placed.append(None)
+                    continue
+                report, latitude, longitude, when, cell, neighbour_keys = point
+                candidates = [
+                    neighbour for key in neighbour_keys
+                    for neighbour in grid.get(key, ()) if abs(neighbour[2] - when) <= self.window
+                ]
+                near = set()
+                if candidates:
+                    distances = haversine_km(latitude, longitude, [c[0] for c in candidates], [c[1] for c in candidates])
+                    near = {find(c[3]) for c, distance in zip(candidates, distances) if distance <= self.radius_km}
+                found = [event for event in (self._event(session, events, event_id) for event_id in near) if event is not None]
+                
+                if found:
+                    target = max(found, key=lambda event: event.report_count)
+                    for other in found:
+                        if other is not target:
+                            self._merge(target, other)
+                            if inspect(other).pending:
+                                session.expunge(other)
+                                unsaved.add(other.event_id)
+                            else:
+                                session.delete(other)
+                            merged[other.event_id] = target.event_id
+                else:
+                    target = self._new_event(session, report, latitude, longitude, when)
+                    events[target.event_id] = target
+                self._add(target, latitude, longitude, when, report.get('priority'))
+                grid.setdefault(cell, []).append((latitude, longitude, when, target.event_id))
+                placed.append((target.event_id, cell))
+            
+            # Re-point stored reports of merged-away events at the survivors, one statement per survivor
+            absorbed: Dict[str, List[str]] = {}
+            for event_id in merged:
+                if event_id not in unsaved:
+                    absorbed.setdefault(find(event_id), []).append(event_id)
+            for target_id, event_ids in absorbed.items():
+                session.query(IncidentReport).filter(IncidentReport.event_id.in_(event_ids)).update(
+                    {'event_id': target_id}, synchronize_session=False
+                )
+        
+        # A report placed before its event was merged belongs to the survivor
+        return [None if result is None else (find(result[0]), result[1]) for result in placed]
+    
+    def place_pending(self) -> int:
+        """Place one batch of reports that were inserted without an event; returns how many were read"""
+        from sqlalchemy import bindparam
+        from models import IncidentReport
+        
+        if not self.enabled:
+            return 0
+        session = self.db.session
+        fields = ('id', 'incident_type', 'location', 'latitude', 'longitude', 'datetime_occurred', 'created_at', 'priority')
+        rows = [dict(zip(fields, row)) for row in session.query(*[getattr(IncidentReport, field) for field in fields]).filter(
+            IncidentReport.cluster_cell.is_(None), IncidentReport.event_id.is_(None),
+            IncidentReport.latitude.isnot(None), IncidentReport.longitude.isnot(None), IncidentReport.incident_type != ''
+        ).order_by(IncidentReport.id).limit(self.PLACEMENT_BATCH_SIZE)]
+        if not rows:
+            return 0
+        
+        table = IncidentReport.__table__
+        try:
+            placed = [(row, result) for row, result in zip(rows, self.assign(session, rows)) if result]
+            if placed:
+                session.execute(table.update().where(table.c.id == bindparam('row_id')).values(
+                    event_id=bindparam('new_event_id'), cluster_cell=bindparam('new_cluster_cell')
+                ), [{'row_id': row['id'], 'new_event_id': event_id, 'new_cluster_cell': cell}
+                    for row, (event_id, cell) in placed])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return len(rows)
+    
+    def notify(self):
+        """Wake the placement worker after reports were committed without an event"""
+        if self.enabled:
+            self.start()
+            self._wakeup.set()
+    
+    def start(self):
+        """Start the placement worker (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._worker_loop, name='event-placement', daemon=True)
+            self._thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the placement worker"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+            self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout)
+    
+    def _worker_loop(self):
+        """Place unplaced reports until none are left, then wait to be notified"""
+        with self.app.app_context():
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                try:
+                    while not self._stop.is_set() and self.place_pending():
+                        pass
+                except Exception as e:
+                    logger.error(f"Event placement error: {str(e)}")
+                finally:
+                    self.db.session.remove()
+                self._wakeup.wait(60)
+    
+    def _event(self, session, events: Dict[str, Any], event_id: str):
+        from models import DisasterEvent
+        
+        if event_id not in events:
+            events[event_id] = session.query(DisasterEvent).filter_by(event_id=event_id).first()
+        return events[event_id]
+    
+    def _new_event(self, session, report: Dict[str, Any], latitude: float, longitude: float, when: datetime):
+        import uuid
+        from models import DisasterEvent
+        
+        event = DisasterEvent(
+            event_id=str(uuid.uuid4()), incident_type=report['incident_type'], location=report.get('location'),
+            latitude=latitude, longitude=longitude, report_count=0, priority=report.get('priority') or 'medium',
+            first_reported_at=when, last_reported_at=when
+        )
+        session.add(event)
+        return event
+    
+    def _higher_priority(self, a: Optional[str], b: Optional[str]) -> str:
+        ranks = [self.PRIORITIES.index(p) if p in self.PRIORITIES else 1 for p in (a, b)]
+        return self.PRIORITIES[max(ranks)]
+    
+    def _add(self, event, latitude: float, longitude: float, when: datetime, priority: Optional[str]):
+        """Grow an event by one report, moving its centroid"""
+        count = event.report_count or 0
+        event.latitude = (event.latitude * count + latitude) / (count + 1)
+        event.longitude = (event.longitude * count + longitude) / (count + 1)
+        event.report_count = count + 1
+        event.first_reported_at = min(event.first_reported_at, when)
+        event.last_reported_at = max(event.last_reported_at, when)
+        event.priority = self._higher_priority(event.priority, priority)
+    
+    def _merge(self, target, other):
+        """Fold ``other``'s counts, centroid and span into ``target``; the caller re-points its reports"""
+        total = target.report_count + other.report_count
+        if total:
+            target.latitude = (target.latitude * target.report_count + other.latitude * other.report_count) / total
+            target.longitude = (target.longitude * target.report_count + other.longitude * other.report_count) / total
+        target.report_count = total
+        target.first_reported_at = min(target.first_reported_at, other.first_reported_at)
+        target.last_reported_at = max(target.last_reported_at, other.last_reported_at)
+        target.priority = self._higher_priority(target.priority, other.priority)
+    
+    def _remove(self, session, event_id: str, latitude: float, longitude: float):
+        """Take one report out of an event, deleting the event with its last report"""
+        from models import DisasterEvent
+        
+        event = session.query(DisasterEvent).filter_by(event_id=event_id).first()
+        if event is None:
+            return
+        count = event.report_count or 0
+        if count <= 1:
+            session.delete(event)
+            return
+        event.latitude = (event.latitude * count - latitude) / (count - 1)
+        event.longitude = (event.longitude * count - longitude) / (count - 1)
+        event.report_count = count - 1
+    
+    def _before_flush(self, session, flush_context, instances):
+        from sqlalchemy import inspect
+        from models import IncidentReport
+        
+        if not self.enabled:
+            return
+        pending = [obj for obj in session.new if isinstance(obj, IncidentReport) and obj.event_id is None]
+        with session.no_autoflush:
+            for obj in session.dirty:
+                if not isinstance(obj, IncidentReport):
+                    continue
+                state = inspect(obj)
+                if any(state.attrs[field].history.has_changes() for field in self.POSITION_FIELDS):
+                    if obj.event_id:
+                        old = [state.attrs[field].history for field in ('latitude', 'longitude')]
+                        latitude, longitude = (h.deleted[0] if h.deleted else h.unchanged[0] for h in old)
+                        if latitude is not None and longitude is not None:
+                            self._remove(session, obj.event_id, latitude, longitude)
+                    pending.append(obj)
+                elif obj.event_id and state.attrs['priority'].history.has_changes():
+                    event = self._event(session, {}, obj.event_id)
+                    if event is not None:
+                        event.priority = self._higher_priority(event.priority, obj.priority)
+            for obj in session.deleted:
+                if isinstance(obj, IncidentReport) and obj.event_id and obj.latitude is not None:
+                    self._remove(session, obj.event_id, obj.latitude, obj.longitude)
+        if not pending:
+            return
+        
+        fields = ('id', 'incident_type', 'location', 'latitude', 'longitude', 'datetime_occurred', 'created_at', 'priority')
+        placed = self.assign(session, [{field: getattr(obj, field) for field in fields} for obj in pending])
+        for obj, result in zip(pending, placed):
+            obj.event_id, obj.cluster_cell = result or (None, None)
+    
+    def recluster(self, chunk_size: int = 5000) -> int:
+        """Rebuild every event from the reports, oldest first; returns the number of events"""
+        from sqlalchemy import update
+        from models import IncidentReport, DisasterEvent
+        
+        session = self.db.session
+        try:
+            session.query(DisasterEvent).delete()
+            session.query(IncidentReport).update({'event_id': None, 'cluster_cell': None}, synchronize_session=False)
+            session.expunge_all()  # Rebuilt events may reuse the deleted rows' ids
+            when_column = self.db.func.coalesce(IncidentReport.datetime_occurred, IncidentReport.created_at)
+            ids = [row_id for (row_id,) in session.query(IncidentReport.id).filter(
+                IncidentReport.latitude.isnot(None), IncidentReport.longitude.isnot(None)
+            ).order_by(when_column, IncidentReport.id)]
+            fields = ('id', 'incident_type', 'location', 'latitude', 'longitude', 'datetime_occurred', 'created_at', 'priority')
+            for start in range(0, len(ids), chunk_size):
+                rows = [dict(row._mapping) for row in session.query(
+                    *(getattr(IncidentReport, field) for field in fields)
+                ).filter(IncidentReport.id.in_(ids[start:start + chunk_size]))]
+                rows.sort(key=lambda row: (row['datetime_occurred'] or row['created_at'], row['id']))
+                row_ids = [row.pop('id') for row in rows]  # None of them is stored in an event yet, so none to exclude
+                updates = [
+                    {'id': row_id, 'event_id': result[0], 'cluster_cell': result[1]}
+                    for row_id, result in zip(row_ids, self.assign(session, rows)) if result
+                ]
+                if updates:
+                    session.execute(update(IncidentReport), updates)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        count = session.query(self.db.func.count(DisasterEvent.id)).scalar()
+        logger.info(f"Incidents reclustered into {count} events")
+        return count
+
+class IncidentEventBroker:
+    """In-process pub/sub for live incident events, delivered over Server-Sent Events.
+    
+    Publishers hand over already-committed incident snapshots; every
+    subscriber reads them from one shared ring buffer, so watchers add no
+    database reads. Event ids start from the boot time in milliseconds, so ids
+    from an earlier process are always older than the buffer and a resuming
+    client is told to resynchronise.
+    """
+    
+    # Incident fields carried by events (reporter contact details stay out)
+    FIELDS = (
+        'report_id', 'incident_type', 'location', 'latitude', 'longitude', 'datetime_occurred',
+        'description', 'media_files', 'status', 'priority', 'event_id', 'created_at', 'updated_at'
+    )
+    
+    def __init__(self, buffer_size: int = 1000, heartbeat: float = 15):
+        self.heartbeat = heartbeat
+        self._events = deque(maxlen=buffer_size)  # (event_id, event_type, payload, serialized payload)
+        self._condition = threading.Condition()
+        self._next_id = int(time.time() * 1000)
+        self.subscribers = 0
+    
+    @classmethod
+    def snapshot(cls, incident) -> Dict[str, Any]:
+        """Event payload for an IncidentReport or a dict of its column values"""
+        payload = {}
+        for field in cls.FIELDS:
+            value = incident.get(field) if isinstance(incident, dict) else getattr(incident, field)
+            payload[field] = value.isoformat() if isinstance(value, datetime) else value
+        return payload
+    
+    def publish(self, event_type: str, payload: Dict[str, Any]) -> int:
+        """Append one event and wake all subscribers; returns its id"""
+        return self.publish_many(event_type, [payload])
+    
+    def publish_many(self, event_type: str, items: List[Any], snapshot=None) -> int:
+        """Append events of one type in order; returns the last id
+        
+        Each item is a payload, or is turned into one by ``snapshot``. Only the
+        newest ``buffer_size`` events can ever be read, so older items in a
+        large batch just take an id and are never built or serialized.
+        """
+        with self._condition:
+            skipped = max(0, len(items) - self._events.maxlen)
+            self._next_id += skipped
+            for item in items[skipped:]:
+                payload = snapshot(item) if snapshot else item
+                self._next_id += 1
+                self._events.append((self._next_id, event_type, payload, json.dumps(payload)))
+            self._condition.notify_all()
+            return self._next_id
+    
+    def _since(self, last_id: int) -> List[Tuple[int, str, Dict[str, Any], str]]:
+        """Buffered events newer than last_id (caller holds the condition)"""
+        if not self._events or self._events[-1][0] <= last_id:
+            return []
+        # Ids are consecutive, so the offset into the buffer is arithmetic
+        start = max(0, last_id - self._events[0][0] + 1)
+        return [self._events[i] for i in range(start, len(self._events))]
+    
+    def subscribe(self, last_event_id: Optional[int] = None, matches=None):
+        """Yield SSE-formatted text for events after last_event_id that pass ``matches``"""
+        reset = False
+        with self._condition:
+            self.subscribers += 1
+            last_id = self._next_id if last_event_id is None else last_event_id
+            oldest = self._events[0][0] if self._events else self._next_id + 1
+            if last_id < oldest - 1 or last_id > self._next_id:
+                # Missed events fell out of the buffer, or the id came from another
+                # process (a restart, or a sibling worker) that had run further ahead
+                reset = True
+                last_id = self._next_id
+        
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+            while True:
+                with self._condition:
+                    events = self._since(last_id)
+                    if not events:
+                        self._condition.wait(self.heartbeat)
+                        events = self._since(last_id)
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                for event_id, event_type, payload, data in events:
+                    last_id = event_id
+                    if matches is None or matches(payload):
+                        yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+class MemoryCacheStore:
+    """Process-local LRU store with per-key expiry"""
+    
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[Any, Optional[float]]]' = OrderedDict()
+        self._counters: Dict[str, int] = {}  # Never evicted, so generations only move forward
+        self._lock = threading.Lock()
+    
+    def get_many(self, keys: List[str]) -> List[Any]:
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                if key in self._counters:
+                    values.append(self._counters[key])
+                    continue
+                entry = self._entries.get(key)
+                if entry is None or (entry[1] is not None and entry[1] <= now):
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[0])
+        return values
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+class RedisCacheStore:
+    """Shared store on Redis, so cached responses and invalidations span processes"""
+    
+    def __init__(self, url: str, prefix: str = 'disastersense:'):
+        import redis  # Optional dependency, only needed for the shared backend
+        
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+    
+    def get_many(self, keys: List[str]) -> List[Any]:
+        return [json.loads(value) if value is not None else None 
+                for value in self.client.mget([self.prefix + key for key in keys])]
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+    
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+class ResponseCache:
+    """Caches GET JSON responses per route and normalized query string.
+    
+    Each cached body records the write generation of the tables it was built
+    from. Committed ORM changes and DML run through the session bump those
+    generations, so stale entries are rebuilt on their next request; ``ttl``
+    bounds entries that also depend on the clock or external APIs. Responses
+    carry a strong ETag (a hash of the body) and the time the body was built
+    as Last-Modified, and conditional requests that still match get 304.
+    """
+    
+    def __init__(self, app=None, store=None):
+        self.store = store or MemoryCacheStore()
+        self.enabled = True
+        self.max_age = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        self._changes_key = f"response_cache_{id(self)}_tables"
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize the cache with app configuration and watch session writes"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+        
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.max_age = app.config.get('RESPONSE_CACHE_MAX_AGE', 0)
+        if app.config.get('RESPONSE_CACHE_BACKEND', 'memory') == 'redis':
+            self.store = RedisCacheStore(app.config['RESPONSE_CACHE_REDIS_URL'])
+        else:
+            self.store = MemoryCacheStore(app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+        event.listen(Session, 'after_flush', self._record_flush)
+        event.listen(Session, 'do_orm_execute', self._record_execute)
+        event.listen(Session, 'after_commit', self._bump_generations)
+        event.listen(Session, 'after_rollback', self._discard_changes)
+    
+    def _record_flush(self, session, flush_context):
+        tables = session.info.setdefault(self._changes_key, set())
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(type(instance), '__tablename__', None)
+            if table:
+                tables.add(table)
+    
+    def _record_execute(self, orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None:
+                orm_execute_state.session.info.setdefault(self._changes_key, set()).add(table.name)
+    
+    def _bump_generations(self, session):
+        for table in session.info.pop(self._changes_key, ()):
+            self.invalidate(table)
+    
+    def _discard_changes(self, session):
+        session.info.pop(self._changes_key, None)
+    
+    def invalidate(self, table: str):
+        """Mark every cached response built from ``table`` as stale"""
+        try:
+            self.store.incr(f"generation:{table}")
+        except Exception as e:
+            logger.error(f"Error invalidating response cache for {table}: {str(e)}")
+    
+    def _count(self, endpoint: str, outcome: str):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'stale': 0, 'not_modified': 0})
+            stats[outcome] += 1
+    
+    def cached(self, *models, ttl: Optional[float] = None):
+        """Decorator caching a GET JSON view that reads from the given models"""
+        from functools import wraps
+        from urllib.parse import quote, urlencode
+        from flask import request, make_response
+        
+        tables = [model.__tablename__ for model in models]
+        
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != 'GET':
+                    return view(*args, **kwargs)
+                
+                endpoint = request.endpoint
+                # Re-encoded, so an escaped '&' or '=' inside a value cannot pose as another parameter
+                query = urlencode(sorted((key, value) for key, value in request.args.items(multi=True) if value != ''))
+                key = f"response:{quote(request.path)}?{query}"
+                
+                try:
+                    values = self.store.get_many([key] + [f"generation:{table}" for table in tables])
+                except Exception as e:
+                    logger.error(f"Error reading response cache: {str(e)}")
+                    return view(*args, **kwargs)
+                entry = values[0]
+                generations = [value or 0 for value in values[1:]]
+                
+                if entry is not None and entry['generations'] == generations:
+                    self._count(endpoint, 'hits')
+                else:
+                    self._count(endpoint, 'stale' if entry is not None else 'misses')
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.mimetype != 'application/json':
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body.decode('utf-8'),
+                        'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+                        'last_modified': int(time.time()),
+                        'generations': generations
+                    }
+                    try:
+                        self.store.set(key, entry, ttl)
+                    except Exception as e:
+                        logger.error(f"Error writing response cache: {str(e)}")
+                
+                response = make_response(entry['body'])
+                response.mimetype = 'application/json'
+                response.set_etag(entry['etag'])
+                response.last_modified = datetime.utcfromtimestamp(entry['last_modified'])
+                response.cache_control.max_age = self.max_age
+                response.cache_control.must_revalidate = True
+                response.make_conditional(request)
+                if response.status_code == 304:
+                    self._count(endpoint, 'not_modified')
+                return response
+            
+            return wrapper
+        return decorator
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Per-endpoint hit ratio for tuning"""
+        with self._stats_lock:
+            endpoints = {}
+            for endpoint, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses'] + stats['stale']
+                endpoints[endpoint] = dict(stats, hit_ratio=round(stats['hits'] / lookups, 4) if lookups else None)
+        return {'backend': type(self.store).__name__, 'endpoints': endpoints}
+
+class IncidentBulkIngestor:
+    """Validates and inserts batches of incident reports from partner feeds.
+    
+    Validation runs column-wise over a DataFrame of the whole batch; valid rows
+    are written with multi-row inserts in chunked transactions, each chunk
+    carrying its reporters' confirmation emails into the outbound queue. The
+    clusterer's background worker places the reports in events once they
+    commit, keeping that work out of the request.
+    """
+    
+    REQUIRED_FIELDS = ('email', 'incident_type', 'location', 'description')
+    MAX_LENGTHS = {'email': 120, 'incident_type': 50, 'location': 200}
+    TRUE_VALUES = ('true', '1', 'yes', 'y', 't')
+    
+    def __init__(self, db=None, email_queue: EmailQueue = None, chunk_size: int = 5000,
+                 stats: Optional[IncidentStatsRollup] = None, events: Optional[IncidentEventBroker] = None,
+                 clusterer: Optional[IncidentClusterer] = None, search: Optional[IncidentSearchIndex] = None):
+        self.db = db
+        self.email_queue = email_queue
+        self.chunk_size = chunk_size
+        self.stats = stats
+        self.events = events
+        self.clusterer = clusterer
+        self.search = search
+    
+    def validate(self, records: List[Any]) -> Tuple[List[Dict[str, Any]], Dict[int, str]]:
+        """Split records into insertable rows (with ``_index``) and {index: error}"""
+        import numpy as np
+        import pandas as pd
+        
+        errors = {i: 'Record must be a JSON object' for i, record in enumerate(records) if not isinstance(record, dict)}
+        indexes = [i for i in range(len(records)) if i not in errors]
+        if not indexes:
+            return [], errors
+        
+        df = pd.DataFrame.from_records([records[i] for i in indexes], index=indexes)
+        for column in ('latitude', 'longitude', 'datetime', 'consent') + self.REQUIRED_FIELDS:
+            if column not in df:
+                df[column] = None
+        
+        text = {field: df[field].where(df[field].notna(), '').astype(str) for field in self.REQUIRED_FIELDS}
+        latitude = pd.to_numeric(df['latitude'], errors='coerce')
+        longitude = pd.to_numeric(df['longitude'], errors='coerce')
+        occurred = pd.to_datetime(df['datetime'], errors='coerce', utc=True, format='ISO8601').dt.tz_convert(None)
+        # Partner feeds send consent as JSON booleans, numbers or strings such as "false"
+        consent = (df['consent'].astype(str).str.strip().str.lower().isin(self.TRUE_VALUES)
+                   | (pd.to_numeric(df['consent'], errors='coerce') == 1))
+        
+        # First failing check wins, in the same order as the single-report endpoint
+        checks = [(text[field] == '', f'{field} is required') for field in self.REQUIRED_FIELDS]
+        checks.append((~text['email'].str.contains('@', regex=False), 'Invalid email format'))
+        checks += [(text[field].str.len() > limit, f'{field} is too long') for field, limit in self.MAX_LENGTHS.items()]
+        checks.append(((df['latitude'].notna() & latitude.isna()) | ~latitude.between(-90, 90) & latitude.notna(), 'Invalid latitude'))
+        checks.append(((df['longitude'].notna() & longitude.isna()) | ~longitude.between(-180, 180) & longitude.notna(), 'Invalid longitude'))
+        checks.append((df['datetime'].notna() & (df['datetime'] != '') & occurred.isna(), 'Invalid datetime'))
+        
+        messages = np.select([mask.to_numpy() for mask, _ in checks], [message for _, message in checks], default='')
+        errors.update({index: message for index, message in zip(indexes, messages) if message})
+        
+        valid = messages == ''
+        columns = {
+            '_index': df.index[valid],
+            'email': text['email'][valid],
+            'incident_type': text['incident_type'][valid],
+            'location': text['location'][valid],
+            'latitude': latitude[valid],
+            'longitude': longitude[valid],
+            'description': text['description'][valid],
+            'consent': consent[valid],
+        }
+        values = {name: column.astype(object).where(column.notna(), None).tolist() if name in ('latitude', 'longitude')
+                  else column.tolist() for name, column in columns.items()}
+        # Microsecond datetime64 converts to datetime (NaT to None) in C, unlike iterating Timestamps
+        values['datetime_occurred'] = occurred[valid].to_numpy(dtype='datetime64[us]').tolist()
+        names = list(values)
+        rows = [dict(zip(names, row)) for row in zip(*values.values())]
+        return rows, errors
+    
+    def ingest(self, records: List[Any]) -> List[Dict[str, Any]]:
+        """Validate and insert records; returns one result per input record, in order"""
+        import uuid
+        from models import IncidentReport
+        
+        rows, errors = self.validate(records)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        for index, message in errors.items():
+            results[index] = {'index': index, 'success': False, 'error': message}
+        
+        queued = False
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            now = datetime.utcnow()
+            for row in chunk:
+                row['report_id'] = str(uuid.uuid4())
+                row['status'] = 'pending'
+                row['priority'] = 'medium'
+                row['created_at'] = row['updated_at'] = now
+            try:
+                self._insert(chunk)
+                if self.stats is not None:
+                    self.stats.record_rows(chunk)
+                if self.search is not None:
+                    self.search.record_rows(chunk)
+                self.email_queue.enqueue_many([{
+                    'to_email': row['email'],
+                    'subject': "Incident Report Confirmation",
+                    'body': incident_confirmation_email(
+                        row['report_id'], row['incident_type'], row['location'], row['description']
+                    )
+                } for row in chunk])
+                self.db.session.commit()
+                queued = True
+                if self.events is not None:
+                    self.events.publish_many('incident.created', chunk, self.events.snapshot)
+                for row in chunk:
+                    results[row['_index']] = {'index': row['_index'], 'success': True, 'report_id': row['report_id']}
+            except Exception as e:
+                logger.error(f"Error inserting incident report chunk at row {chunk[0]['_index']}: {str(e)}")
+                self.db.session.rollback()
+                for row in chunk:
+                    results[row['_index']] = {'index': row['_index'], 'success': False, 'error': 'Failed to store report'}
+        
+        if queued:
+            self.email_queue.notify()
+            if self.clusterer is not None:
+                self.clusterer.notify()
+        return results
+    
+    def _insert(self, chunk: List[Dict[str, Any]]):
+        """Insert a chunk of rows, setting each row's ``id`` where the database returns it"""
+        from models import IncidentReport
+        
+        names = [key for key in chunk[0] if key not in ('_index', 'id')]
+        ids = dict(_insert_rows(self.db.session.connection(), IncidentReport.__table__, chunk, ('report_id', 'id'), names))
+        if ids:
+            for row in chunk:
+                row['id'] = ids[row['report_id']]
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes can be taken as they are produced.
+    
+    ``tell()`` keeps counting across drains, so writers that record offsets
+    (the Parquet footer) still see a continuous file.
+    """
+    
+    closed = False
+    
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+    
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def writable(self) -> bool:
+        return True
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+class IncidentExporter:
+    """Streams incident reports out as CSV or Parquet in constant memory.
+    
+    Rows are read through a server-side cursor (``yield_per``) and written one
+    chunk at a time: CSV chunks are rendered by pandas, Parquet chunks become
+    row groups. pyarrow is only needed for Parquet.
+    """
+    
+    CONTENT_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+    
+    def __init__(self, db=None, chunk_size: int = 5000):
+        self.db = db
+        self.chunk_size = chunk_size
+    
+    @staticmethod
+    def schema():
+        """Arrow schema of an exported chunk (fixed, so every row group matches).
+        
+        Built from ``IncidentReport.API_FIELDS`` and the column types, so it
+        always has the same columns as the CSV export.
+        """
+        import pyarrow as pa
+        from sqlalchemy import Boolean, DateTime, Float, Integer
+        from models import IncidentReport
+        
+        # JSON and text columns are exported as strings
+        types = ((Boolean, pa.bool_()), (DateTime, pa.timestamp('us')), (Float, pa.float64()), (Integer, pa.int64()))
+        fields = []
+        for name in IncidentReport.API_FIELDS:
+            column_type = IncidentReport.__table__.columns[name].type
+            fields.append((name, next((arrow for sql, arrow in types if isinstance(column_type, sql)), pa.string())))
+        return pa.schema(fields)
+    
+    def iter_chunks(self, since: Optional[datetime] = None, status: Optional[str] = None):
+        """Yield {column: [values]} chunks of at most ``chunk_size`` rows, oldest first"""
+        from models import IncidentReport
+        from sqlalchemy import select
+        
+        columns = [getattr(IncidentReport, field) for field in IncidentReport.API_FIELDS]
+        stmt = select(*columns).order_by(IncidentReport.id)
+        if since:
+            stmt = stmt.where(IncidentReport.created_at >= since)
+        if status:
+            stmt = stmt.where(IncidentReport.status == status)
+        
+        result = self.db.session.execute(stmt.execution_options(yield_per=self.chunk_size))
+        try:
+            for rows in result.partitions():
+                chunk = dict(zip(IncidentReport.API_FIELDS, map(list, zip(*rows))))
+                # JSON column is flattened to text for tabular formats
+                chunk['media_files'] = [json.dumps(value) if value else None for value in chunk['media_files']]
+                yield chunk
+        finally:
+            result.close()
+    
+    def iter_csv(self, since: Optional[datetime] = None, status: Optional[str] = None):
+        """Yield CSV text, header first, one piece per chunk"""
+        import pandas as pd
+        from models import IncidentReport
+        
+        yield ','.join(IncidentReport.API_FIELDS) + '\n'
+        for chunk in self.iter_chunks(since, status):
+            yield pd.DataFrame(chunk, columns=IncidentReport.API_FIELDS).to_csv(index=False, header=False)
+    
+    def iter_parquet(self, since: Optional[datetime] = None, status: Optional[str] = None):
+        """Yield the bytes of a Parquet file, one row group per chunk"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        schema = self.schema()
+        sink = _DrainableSink()
+        with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='snappy') as writer:
+            for chunk in self.iter_chunks(since, status):
+                writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+                yield sink.drain()
+        yield sink.drain()
+    
+    def write_csv(self, path: str, since: Optional[datetime] = None, status: Optional[str] = None) -> int:
+        """Write a CSV file chunk by chunk; returns the row count"""
+        import pandas as pd
+        from models import IncidentReport
+        
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write(','.join(IncidentReport.API_FIELDS) + '\n')
+            for chunk in self.iter_chunks(since, status):
+                pd.DataFrame(chunk, columns=IncidentReport.API_FIELDS).to_csv(f, index=False, header=False)
+                count += len(chunk['id'])
+        return count
+    
+    def write_parquet(self, path: str, since: Optional[datetime] = None, status: Optional[str] = None) -> int:
+        """Write a Parquet file with one row group per chunk; returns the row count"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        schema = self.schema()
+        count = 0
+        with pq.ParquetWriter(path, schema, compression='snappy') as writer:
+            for chunk in self.iter_chunks(since, status):
+                writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+                count += len(chunk['id'])
+        return count
+
+class FileService:
+    """Service for handling file uploads and management"""
+    
+    def __init__(self, upload_folder: str, allowed_extensions: set):
+        self.upload_folder = upload_folder
+        self.allowed_extensions = allowed_extensions
+        os.makedirs(upload_folder, exist_ok=True)
+    
+    def allowed_file(self, filename: str) -> bool:
+        """Check if file extension is allowed"""
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
+    
+    def save_uploaded_files(self, files) -> List[str]:
+        """Save uploaded files and return list of file paths"""
+        saved_files = []
+        for file in files:
+            if file and self.allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                # Add timestamp to avoid conflicts
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                filename = f"{timestamp}_{filename}"
+                filepath = os.path.join(self.upload_folder, filename)
+                file.save(filepath)
+                saved_files.append(filename)
+                logger.info(f"File saved: {filename}")
+        return saved_files
+    
+    def delete_file(self, filename: str) -> bool:
+        """Delete a file from the upload folder"""
+        try:
+            filepath = os.path.join(self.upload_folder, filename)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                logger.info(f"File deleted: {filename}")
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"Error deleting file {filename}: {str(e)}")
+            return False
+
+class UploadConflict(Exception):
+    """The upload is not at the state the client assumed; ``offset`` is where it really is"""
+    
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+class HammingIndex:
+    """Multi-index hash table for Hamming-radius search over 64-bit hashes
+    
+    Every hash is split into four 16-bit chunks and each chunk position keeps
+    a sorted array of its chunk values. Two hashes within distance ``r`` must
+    be within ``r // 4`` bits of each other on at least one chunk, so a query
+    binary-searches only the chunk values that close and checks the few
+    candidates with a popcount, instead of comparing against every hash.
+    Added hashes wait in a small buffer that is scanned directly until it is
+    merged into the sorted arrays.
+    """
+    
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    
+    def __init__(self, buffer_size: int = 4096):
+        import numpy as np
+        
+        self.buffer_size = buffer_size
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._values = np.empty(0, dtype=np.int64)
+        self._keys = [np.empty(0, dtype=np.uint16) for _ in range(self.CHUNKS)]
+        self._order = [np.empty(0, dtype=np.int64) for _ in range(self.CHUNKS)]
+        self._pending: List[Tuple[int, int]] = []
+        self._masks: Dict[int, Any] = {}
+    
+    def __len__(self) -> int:
+        return len(self._hashes) + len(self._pending)
+    
+    def add(self, value: int, hash_value: int):
+        """Index one hash under ``value`` (e.g. a row id)"""
+        self._pending.append((hash_value, value))
+        if len(self._pending) >= self.buffer_size:
+            self._merge()
+    
+    def add_many(self, values, hashes):
+        """Index arrays of values and unsigned 64-bit hashes in one go"""
+        import numpy as np
+        
+        self._merge(np.asarray(hashes, dtype=np.uint64), np.asarray(values, dtype=np.int64))
+    
+    def _merge(self, hashes=None, values=None):
+        """Fold the buffer (and any given arrays) into the sorted chunk arrays"""
+        import numpy as np
+        
+        parts_h, parts_v = [self._hashes], [self._values]
+        if self._pending:
+            parts_h.append(np.array([h for h, _ in self._pending], dtype=np.uint64))
+            parts_v.append(np.array([v for _, v in self._pending], dtype=np.int64))
+            self._pending = []
+        if hashes is not None:
+            parts_h.append(hashes)
+            parts_v.append(values)
+        self._hashes = np.concatenate(parts_h)
+        self._values = np.concatenate(parts_v)
+        for chunk in range(self.CHUNKS):
+            keys = ((self._hashes >> np.uint64(chunk * self.CHUNK_BITS)) & np.uint64(0xFFFF)).astype(np.uint16)
+            order = np.argsort(keys, kind='stable')
+            self._keys[chunk] = keys[order]
+            self._order[chunk] = order
+    
+    def _probe_masks(self, bits: int):
+        """All 16-bit XOR masks with at most ``bits`` bits set"""
+        import numpy as np
+        
+        if bits not in self._masks:
+            masks = np.arange(1 << self.CHUNK_BITS, dtype=np.uint16)
+            self._masks[bits] = masks[np.bitwise_count(masks) <= bits]
+        return self._masks[bits]
+    
+    def search(self, hash_value: int, radius: int) -> List[Tuple[int, int]]:
+        """(distance, value) for every indexed hash within ``radius`` bits, nearest first"""
+        import numpy as np
+        
+        query = np.uint64(hash_value)
+        found = []
+        if len(self._hashes):
+            masks = self._probe_masks(radius // self.CHUNKS)
+            candidates = []
+            for chunk in range(self.CHUNKS):
+                probes = np.uint16((hash_value >> (chunk * self.CHUNK_BITS)) & 0xFFFF) ^ masks
+                lo = np.searchsorted(self._keys[chunk], probes, 'left')
+                counts = np.searchsorted(self._keys[chunk], probes, 'right') - lo
+                # Concatenate the matching ranges [lo, lo + count) without a Python loop
+                total = int(counts.sum())
+                if total:
+                    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                    candidates.append(self._order[chunk][np.repeat(lo, counts) + offsets])
+            if candidates:
+                rows = np.concatenate(candidates)
+                # Filter before deduplicating: a hit found through several chunks appears several times
+                rows = np.unique(rows[np.bitwise_count(self._hashes[rows] ^ query) <= radius])
+                distances = np.bitwise_count(self._hashes[rows] ^ query)
+                found.extend(zip(distances.tolist(), self._values[rows].tolist()))
+        for pending_hash, value in self._pending:
+            distance = (pending_hash ^ hash_value).bit_count()
+            if distance <= radius:
+                found.append((distance, value))
+        return sorted(found)
+
+class MediaStore:
+    """Content-addressed storage and near-duplicate detection for incident media
+    
+    Location and device metadata is stripped from a completed upload first
+    (its GPS position is kept on the blob), then the file is stored once under
+    the SHA-256 of the stripped bytes
+    (``<upload folder>/<sha256[:2]>/<sha256>.<ext>``); a later upload of the
+    same picture is dropped and simply references the existing ``MediaBlob``.
+    Images also get a 64-bit DCT perceptual hash, and a new image within
+    ``radius`` bits of one already stored is linked to the first-seen copy,
+    so reposted photos can be skipped in triage even when re-encoded or
+    resized. Hashes are searched in a process-local HammingIndex that picks up
+    blobs added by other processes on each lookup.
+    """
+    
+    IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    BLOCK_SIZE = 1024 * 1024
+    _dct = None
+    
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self._index = None
+        self._indexed_id = 0
+        self._lock = threading.Lock()
+        self.stats = {'stored': 0, 'deduplicated': 0, 'bytes_saved': 0, 'near_duplicates': 0, 'stripped': 0}
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize store with app configuration"""
+        self.app = app
+        self.db = db
+        self.upload_folder = app.config.get('UPLOAD_FOLDER')
+        self.radius = app.config.get('MEDIA_DUPLICATE_RADIUS', 8)
+        self.ffmpeg = shutil.which(app.config.get('FFMPEG_BINARY', 'ffmpeg'))
+        self.ffprobe = shutil.which(app.config.get('FFPROBE_BINARY', 'ffprobe'))
+    
+    @staticmethod
+    def stored_name(sha256: str, filename: str) -> str:
+        """Content address, relative to the upload folder, for bytes with this hash"""
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+        return f"{sha256[:2]}/{sha256}.{ext}"
+    
+    @classmethod
+    def perceptual_hash(cls, image) -> int:
+        """64-bit pHash: sign of the low 8x8 DCT coefficients of a 32x32 grayscale image against their median"""
+        import numpy as np
+        from PIL import Image, ImageOps
+        
+        if cls._dct is None:
+            n = np.arange(32)
+            cls._dct = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+        with Image.open(image) as img:
+            img.draft('L', (64, 64))  # JPEGs decode straight at 1/8 scale
+            img = ImageOps.exif_transpose(img).convert('L').resize((32, 32), Image.LANCZOS)
+        pixels = np.asarray(img, dtype=np.float64)
+        low = (cls._dct @ pixels @ cls._dct.T)[:8, :8].ravel()
+        bits = low > np.median(low[1:])  # the DC term only says how bright the image is
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    
+    @staticmethod
+    def _to_signed(hash_value: int) -> int:
+        return hash_value - (1 << 64) if hash_value >= 1 << 63 else hash_value
+    
+    def get(self, sha256: str):
+        from models import MediaBlob
+        
+        return MediaBlob.query.filter_by(sha256=sha256).first()
+    
+    def get_stored(self, stored_filename: Optional[str]):
+        """The blob behind a stored file name; an upload's own checksum is of the bytes before stripping"""
+        from models import MediaBlob
+        
+        return MediaBlob.query.filter_by(stored_filename=stored_filename).first() if stored_filename else None
+    
+    def store(self, source_path: str, sha256: str, filename: str):
+        """Strip a fully received file and move it into the store; returns (MediaBlob, created)
+        
+        ``sha256`` is the hash of the file as received. Images and videos are
+        hashed again after stripping, so the stored name, the blob's hash and
+        its perceptual hash all describe the bytes that are served. If those
+        bytes are already stored the source file is deleted instead. The blob
+        row is written in its own transaction so it always matches what is on
+        disk; counting the upload is left to the caller's session.
+        """
+        # Part files have no extension; the file type decides how it is stripped
+        ext = self.stored_name(sha256, filename).rsplit('.', 1)[1]
+        staged = f"{source_path}.{ext}"
+        os.replace(source_path, staged)
+        source_path = staged
+        location = {'latitude': None, 'longitude': None, 'stripped': False}
+        try:
+            location = strip_media_metadata(source_path, self.ffmpeg, self.ffprobe)
+        except Exception as e:
+            logger.warning(f"Could not strip metadata from {filename}: {str(e)}")
+        self.stats['stripped'] += location['stripped']
+        # Media is hashed again even when nothing was stripped: a retried upload
+        # may hand back bytes that were already stripped, under the received hash
+        if ext in MediaPipeline.IMAGE_EXTENSIONS or ext in MediaPipeline.VIDEO_EXTENSIONS:
+            sha256 = self.file_sha256(source_path)
+        
+        blob = self.get(sha256)
+        if blob is not None and os.path.exists(os.path.join(self.upload_folder, blob.stored_filename)):
+            length = os.path.getsize(source_path)
+            os.remove(source_path)
+            self.stats['deduplicated'] += 1
+            self.stats['bytes_saved'] += length
+            return blob, False
+        
+        stored_filename = self.stored_name(sha256, filename)
+        target = os.path.join(self.upload_folder, stored_filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+        if blob is not None:  # Row survived but the file was lost; put it back
+            return blob, False
+        
+        phash = None
+        if stored_filename.rsplit('.', 1)[1] in self.IMAGE_EXTENSIONS:
+            try:
+                phash = self.perceptual_hash(target)
+            except Exception as e:
+                logger.warning(f"Could not hash image {stored_filename}: {str(e)}")
+        nearest = self.similar(phash)[:1] if phash is not None else []
+        near_duplicate_of = distance = None
+        if nearest:
+            distance, match = nearest[0]
+            near_duplicate_of = match.near_duplicate_of or match.sha256
+            self.stats['near_duplicates'] += 1
+        
+        now = datetime.utcnow()
+        self._insert({
+            'sha256': sha256, 'stored_filename': stored_filename, 'length': os.path.getsize(target),
+            'phash': None if phash is None else self._to_signed(phash),
+            'near_duplicate_of': near_duplicate_of, 'near_duplicate_distance': distance,
+            'latitude': location['latitude'], 'longitude': location['longitude'],
+            'upload_count': 0, 'created_at': now, 'last_seen_at': now
+        })
+        self.stats['stored'] += 1
+        return self.get(sha256), True
+    
+    def record_upload(self, blob):
+        """Count one more upload of ``blob`` in the caller's transaction"""
+        from models import MediaBlob
+        
+        MediaBlob.query.filter_by(id=blob.id).update(
+            {'upload_count': MediaBlob.upload_count + 1, 'last_seen_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+    
+    def _insert(self, row: Dict[str, Any]):
+        """Write the blob row in its own short transaction; a concurrent writer of the same bytes wins quietly"""
+        from models import MediaBlob
+        
+        table = MediaBlob.__table__
+        dialect = self.db.engine.dialect.name
+        with self.db.engine.begin() as conn:
+            if dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                conn.execute(insert(table).values(row).on_conflict_do_nothing(index_elements=['sha256']))
+            elif conn.execute(table.select().where(table.c.sha256 == row['sha256'])).first() is None:
+                conn.execute(table.insert().values(row))
+    
+    def similar(self, phash: int, radius: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """(distance, MediaBlob) for stored images within ``radius`` bits of ``phash``, nearest first"""
+        from models import MediaBlob
+        
+        with self._lock:
+            self._refresh_index()
+            matches = self._index.search(phash, self.radius if radius is None else radius)
+        if not matches:
+            return []
+        blobs = {blob.id: blob for blob in MediaBlob.query.filter(MediaBlob.id.in_([value for _, value in matches]))}
+        return [(distance, blobs[blob_id]) for distance, blob_id in matches if blob_id in blobs]
+    
+    def _refresh_index(self, batch_size: int = 100000):
+        """Load hashes of blobs added since the last lookup (all of them the first time)"""
+        import numpy as np
+        from models import MediaBlob
+        
+        if self._index is None:
+            self._index = HammingIndex()
+        while True:
+            rows = self.db.session.query(MediaBlob.id, MediaBlob.phash).filter(
+                MediaBlob.id > self._indexed_id, MediaBlob.phash.isnot(None)
+            ).order_by(MediaBlob.id).limit(batch_size).all()
+            if not rows:
+                return
+            if len(rows) < 64:
+                for blob_id, phash in rows:
+                    self._index.add(blob_id, phash & 0xFFFFFFFFFFFFFFFF)
+            else:
+                ids, hashes = zip(*rows)
+                self._index.add_many(ids, np.array(hashes, dtype=np.int64).view(np.uint64))
+            self._indexed_id = rows[-1][0]
+    
+    def duplicates(self, sha256: str, radius: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """A blob with the reports that uploaded it and its near-duplicate images"""
+        from models import MediaUpload
+        
+        blob = self.get(sha256)
+        if blob is None:
+            return None
+        reports = [report_id for (report_id,) in self.db.session.query(MediaUpload.report_id).filter(
+            MediaUpload.stored_filename == blob.stored_filename, MediaUpload.report_id.isnot(None)
+        ).distinct()]
+        near = []
+        if blob.phash is not None:
+            near = [
+                {'distance': distance, **match.to_dict()}
+                for distance, match in self.similar(blob.phash & 0xFFFFFFFFFFFFFFFF, radius) if match.id != blob.id
+            ]
+        return {'media': blob.to_dict(), 'reports': reports, 'near_duplicates': near}
+    
+    def file_sha256(self, path: str) -> str:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.BLOCK_SIZE), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+    
+    def adopt_legacy(self, batch_size: int = 500) -> Dict[str, int]:
+        """Move media attached before the store existed into it and point reports at the shared copies"""
+        from models import IncidentReport, MediaUpload, MediaClassification
+        
+        counts = {'files': 0, 'deduplicated': 0, 'missing': 0}
+        report_ids = [row_id for (row_id,) in self.db.session.query(IncidentReport.id).filter(
+            IncidentReport.media_files.isnot(None)
+        ).order_by(IncidentReport.id)]
+        for start in range(0, len(report_ids), batch_size):
+            reports = IncidentReport.query.filter(IncidentReport.id.in_(report_ids[start:start + batch_size])).all()
+            # Store every file first: the blob rows are written on their own connection,
+            # which SQLite would block while this session holds uncommitted updates
+            moved: Dict[str, Any] = {}  # old name -> MediaBlob, or None if the file is gone
+            for report in reports:
+                for item in report.media_files or []:
+                    name = item.get('file') if isinstance(item, dict) else item
+                    if not name or '/' in name or name in moved:  # '/' means already content-addressed
+                        continue
+                    path = os.path.join(self.upload_folder, name)
+                    if not os.path.isfile(path):
+                        counts['missing'] += 1
+                        moved[name] = None
+                        continue
+                    blob, created = self.store(path, self.file_sha256(path), name)
+                    moved[name] = blob
+                    counts['files'] += 1
+                    counts['deduplicated'] += 0 if created else 1
+            
+            for report in reports:
+                entries = []
+                for item in report.media_files or []:
+                    name = item.get('file') if isinstance(item, dict) else item
+                    blob = moved.get(name)
+                    if blob is None:
+                        entries.append(item)
+                        continue
+                    entries.append({**item, 'file': blob.stored_filename} if isinstance(item, dict) else blob.stored_filename)
+                    if blob.latitude is not None and report.latitude is None and report.longitude is None:
+                        report.latitude, report.longitude = blob.latitude, blob.longitude
+                if entries != report.media_files:
+                    report.media_files = entries
+            for name, blob in moved.items():
+                if blob is not None:
+                    self.record_upload(blob)
+                    MediaUpload.query.filter_by(stored_filename=name).update(
+                        {'stored_filename': blob.stored_filename}, synchronize_session=False
+                    )
+                    MediaClassification.query.filter_by(filename=name).update(
+                        {'filename': blob.stored_filename}, synchronize_session=False
+                    )
+            self.db.session.commit()
+        return counts
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Storage and duplicate counters for this process"""
+        return {'indexed_hashes': len(self._index) if self._index is not None else 0, 'radius': self.radius, **self.stats}
+
+class ResumableUploadService:
+    """Resumable chunked media uploads (tus-style create, PATCH at offset, complete)
+    
+    Chunks are streamed from the request straight into a part file under
+    ``<upload folder>/.partial`` and the SHA-256 is updated as bytes arrive, so
+    neither a chunk nor the file is ever held in memory. The hasher lives in
+    process memory; after a restart it is rebuilt from the part file once. The
+    stored offset only moves forward with a compare-and-set, so two writers
+    racing on one upload cannot both succeed.
+    """
+    
+    BLOCK_SIZE = 1024 * 1024
+    
+    def __init__(self, db, file_service: FileService, max_length: int = 2 * 1024 ** 3,
+                 events: Optional['IncidentEventBroker'] = None, store: Optional[MediaStore] = None):
+        self.db = db
+        self.file_service = file_service
+        self.max_length = max_length
+        self.events = events
+        self.store = store
+        self.part_folder = os.path.join(file_service.upload_folder, '.partial')
+        self._hashers: Dict[str, Tuple[int, Any]] = {}  # upload_id -> (offset, sha256 state)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.part_folder, exist_ok=True)
+    
+    def create(self, filename: str, length: int, report_id: Optional[str] = None):
+        """Start an upload; raises ValueError for a bad name, size or report"""
+        from models import IncidentReport, MediaUpload
+        
+        if not filename or not self.file_service.allowed_file(filename):
+            raise ValueError('File type not allowed')
+        if isinstance(length, bool) or not isinstance(length, int) or length < 1:
+            raise ValueError('length must be a positive integer')
+        if length > self.max_length:
+            raise ValueError(f'Files are limited to {self.max_length} bytes')
+        if report_id and not self.db.session.query(IncidentReport.id).filter_by(report_id=report_id).first():
+            raise ValueError('Incident report not found')
+        
+        upload = MediaUpload(filename=secure_filename(filename), length=length, report_id=report_id)
+        self.db.session.add(upload)
+        self.db.session.flush()
+        open(self._part_path(upload.upload_id), 'wb').close()
+        self.db.session.commit()
+        logger.info(f"Upload created: {upload.upload_id} ({length} bytes)")
+        return upload
+    
+    def get(self, upload_id: str):
+        """Upload by id with its offset checked against the part file, or None"""
+        from models import MediaUpload
+        
+        upload = MediaUpload.query.filter_by(upload_id=upload_id).first()
+        if upload is not None and upload.status == 'uploading':
+            # Bytes recorded but lost from disk (e.g. a crash before the OS wrote them) are re-requested
+            size = os.path.getsize(self._part_path(upload_id)) if os.path.exists(self._part_path(upload_id)) else 0
+            if size < upload.offset:
+                upload.offset = size
+                self.db.session.commit()
+        return upload
+    
+    def append(self, upload_id: str, offset: int, stream) -> int:
+        """Write ``stream`` at ``offset``; returns the new offset
+        
+        Raises UploadConflict if ``offset`` is not the current one or the
+        upload is already complete, and ValueError if the data would run past
+        the declared length. Bytes received before a dropped connection are
+        kept and counted, so the client resumes from where it actually got to.
+        """
+        with self._upload_lock(upload_id):
+            upload = self.get(upload_id)
+            if upload is None:
+                raise LookupError('Upload not found')
+            if upload.status != 'uploading':
+                raise UploadConflict('Upload is already complete', upload.offset)
+            if offset != upload.offset:
+                raise UploadConflict('Upload-Offset does not match', upload.offset)
+            
+            hasher = self._hasher(upload_id, offset)
+            written = 0
+            remaining = upload.length - offset
+            try:
+                with open(self._part_path(upload_id), 'r+b') as f:
+                    f.seek(offset)
+                    f.truncate()  # Drop any unrecorded tail from an interrupted request
+                    while True:
+                        block = stream.read(min(self.BLOCK_SIZE, remaining - written + 1))
+                        if not block:
+                            break
+                        if written + len(block) > remaining:
+                            raise ValueError('Chunk runs past the declared upload length')
+                        f.write(block)
+                        hasher.update(block)
+                        written += len(block)
+            finally:
+                self._advance(upload_id, offset, offset + written, hasher)
+            return offset + written
+    
+    def complete(self, upload_id: str, report_id: Optional[str] = None, sha256: Optional[str] = None):
+        """Verify a fully received upload, move it into the upload folder and attach it to its report
+        
+        With a MediaStore the file is stripped and stored under its content
+        hash, and bytes that are already stored are not kept twice. A report
+        without coordinates takes them from the file's GPS tags.
+        """
+        from models import IncidentReport
+        
+        with self._upload_lock(upload_id):
+            upload = self.get(upload_id)
+            if upload is None:
+                raise LookupError('Upload not found')
+            if upload.status == 'complete':
+                return upload
+            if upload.offset < upload.length:
+                raise UploadConflict('Upload is incomplete', upload.offset)
+            
+            digest = self._hasher(upload_id, upload.offset).hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise ValueError('Checksum mismatch')
+            
+            report_id = report_id or upload.report_id
+            report = IncidentReport.query.filter_by(report_id=report_id).first() if report_id else None
+            if report_id and report is None:
+                raise ValueError('Incident report not found')
+            
+            blob = None
+            entry = None
+            if self.store is not None:
+                blob, created = self.store.store(self._part_path(upload_id), digest, upload.filename)
+                self.store.record_upload(blob)
+                stored_filename = blob.stored_filename
+                if not created and blob.variants:
+                    entry = {'file': stored_filename, **blob.variants}
+            else:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                stored_filename = f"{timestamp}_{upload_id[:8]}_{upload.filename}"
+                os.replace(self._part_path(upload_id), os.path.join(self.file_service.upload_folder, stored_filename))
+            final_path = os.path.join(self.file_service.upload_folder, stored_filename)
+            
+            upload.status = 'complete'
+            upload.sha256 = digest
+            upload.stored_filename = stored_filename
+            upload.report_id = report_id
+            upload.completed_at = datetime.utcnow()
+            event = None
+            attached = [item.get('file') if isinstance(item, dict) else item for item in (report.media_files or [])] if report else []
+            if report is not None and stored_filename not in attached:
+                # Reassign so the JSON column is seen as changed
+                report.media_files = (report.media_files or []) + [entry or stored_filename]
+                if blob is not None and blob.latitude is not None and report.latitude is None and report.longitude is None:
+                    report.latitude, report.longitude = blob.latitude, blob.longitude
+                if self.events:
+                    event = self.events.snapshot(report)
+            try:
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                if blob is None:
+                    os.replace(final_path, self._part_path(upload_id))
+                else:
+                    # The stored copy may be shared, so give the upload its own link for a retry
+                    try:
+                        os.link(final_path, self._part_path(upload_id))
+                    except OSError:
+                        shutil.copyfile(final_path, self._part_path(upload_id))
+                raise
+            
+            with self._lock:
+                self._hashers.pop(upload_id, None)
+                self._locks.pop(upload_id, None)
+            if event is not None:
+                self.events.publish('incident.updated', event)
+            logger.info(f"Upload complete: {stored_filename} ({upload.length} bytes)")
+            return upload
+    
+    def purge_stale(self, older_than: timedelta) -> int:
+        """Delete unfinished uploads untouched for ``older_than``, with their part files"""
+        from models import MediaUpload
+        
+        cutoff = datetime.utcnow() - older_than
+        stale = MediaUpload.query.filter(MediaUpload.status == 'uploading', MediaUpload.updated_at < cutoff).all()
+        for upload in stale:
+            with self._lock:
+                self._hashers.pop(upload.upload_id, None)
+                self._locks.pop(upload.upload_id, None)
+            if os.path.exists(self._part_path(upload.upload_id)):
+                os.remove(self._part_path(upload.upload_id))
+            self.db.session.delete(upload)
+        self.db.session.commit()
+        return len(stale)
+    
+    def _advance(self, upload_id: str, offset: int, new_offset: int, hasher):
+        """Record progress with a compare-and-set on the stored offset"""
+        from models import MediaUpload
+        
+        with self._lock:
+            self._hashers[upload_id] = (new_offset, hasher)
+        if new_offset == offset:
+            return
+        updated = MediaUpload.query.filter_by(upload_id=upload_id, offset=offset).update(
+            {'offset': new_offset, 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        self.db.session.commit()
+        if not updated:
+            with self._lock:
+                self._hashers.pop(upload_id, None)
+            raise UploadConflict('Upload was advanced by another request', offset)
+    
+    def _hasher(self, upload_id: str, offset: int):
+        """SHA-256 state covering the first ``offset`` bytes, rebuilt from disk if not in memory"""
+        with self._lock:
+            entry = self._hashers.get(upload_id)
+        if entry is not None and entry[0] == offset:
+            return entry[1]
+        hasher = hashlib.sha256()
+        with open(self._part_path(upload_id), 'rb') as f:
+            remaining = offset
+            while remaining:
+                block = f.read(min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+    
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+    
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.part_folder, upload_id)
+
+class ImageClassifier:
+    """Disaster image classifier (the ResNet-50 from training.ipynb) with dynamic micro-batching
+    
+    Every image gets a Future. Decoding and the 224x224 transform run on a
+    pool of preprocessing workers; one dispatcher thread gathers the ready
+    tensors into batches of up to ``max_batch``, waiting at most ``max_wait``
+    after the first arrives, and runs each batch on a fixed number of torch
+    CPU threads. While a batch runs the queue refills, so batches grow with
+    load and a lone request waits no longer than ``max_wait``. torch and
+    torchvision are imported on first use and are only needed to classify.
+    """
+    
+    IMAGE_SIZE = 224
+    MEAN = (0.485, 0.456, 0.406)
+    STD = (0.229, 0.224, 0.225)
+    IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    
+    def __init__(self, app=None, db=None):
+        self.app = app
+        self.db = db
+        self.model = None
+        self.classes: List[str] = []
+        self._queue = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._latencies = deque(maxlen=1000)  # seconds from submit to result
+        self._batch_sizes = deque(maxlen=1000)
+        self._images = 0
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize classifier with app configuration"""
+        self.app = app
+        self.db = db
+        self.model_path = app.config.get('CLASSIFIER_MODEL_PATH')
+        self.classes_path = app.config.get('CLASSIFIER_CLASSES_PATH')
+        self.upload_folder = app.config.get('UPLOAD_FOLDER')
+        self.max_batch = app.config.get('CLASSIFIER_MAX_BATCH', 16)
+        self.max_wait = app.config.get('CLASSIFIER_MAX_WAIT_MS', 10) / 1000.0
+        self.num_threads = app.config.get('CLASSIFIER_THREADS', 4)
+        self.preprocess_workers = app.config.get('CLASSIFIER_PREPROCESS_WORKERS', 4)
+        self.top_k = app.config.get('CLASSIFIER_TOP_K', 3)
+    
+    @property
+    def is_configured(self) -> bool:
+        """Whether the trained model files and torch are available"""
+        import importlib.util
+        
+        return bool(
+            self.model_path and os.path.exists(self.model_path) and
+            self.classes_path and os.path.exists(self.classes_path) and
+            importlib.util.find_spec('torch') and importlib.util.find_spec('torchvision')
+        )
+    
+    def is_image(self, filename: str) -> bool:
+        """Whether a stored media file is something the model can classify"""
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.IMAGE_EXTENSIONS
+    
+    def start(self, model=None, classes: Optional[List[str]] = None):
+        """Load the trained model (or use ``model``/``classes``) and start the workers (idempotent)"""
+        import queue
+        import torch
+        
+        with self._lock:
+            if self._dispatcher is not None:
+                return
+            torch.set_num_threads(self.num_threads)
+            if model is None:
+                model, classes = self._load_trained()
+            self.model = model.eval()
+            self.classes = list(classes)
+            self._queue = queue.Queue()
+            self._preprocess_pool = ThreadPoolExecutor(self.preprocess_workers, thread_name_prefix='classifier-preprocess')
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix='classifier-writer')
+            self._stop.clear()
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='classifier-dispatcher', daemon=True)
+            self._dispatcher.start()
+            logger.info(f"Image classifier started: {len(self.classes)} classes, batches of up to {self.max_batch}")
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop the dispatcher and worker pools"""
+        with self._lock:
+            if self._dispatcher is None:
+                return
+            self._stop.set()
+            self._dispatcher.join(timeout)
+            self._preprocess_pool.shutdown(wait=False)
+            self._writer.shutdown(wait=True)
+            self._dispatcher = None
+    
+    def _load_trained(self):
+        """The notebook's ResNet-50 with its classifier head sized to classes.pkl"""
+        import pickle
+        import torch
+        from torch import nn
+        from torchvision import models
+        
+        with open(self.classes_path, 'rb') as f:
+            classes = pickle.load(f)
+        model = models.resnet50(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, len(classes))
+        model.load_state_dict(torch.load(self.model_path, map_location='cpu', weights_only=True))
+        return model, classes
+    
+    @staticmethod
+    def stand_in_model(num_classes: int = 4):
+        """Small randomly initialized CNN with the same input and output shapes, for benchmarks"""
+        import torch
+        from torch import nn
+        
+        torch.manual_seed(0)
+        return nn.Sequential(
+            nn.Conv2d(3, 16, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(16, 32, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(32, 64, 3, stride=2, padding=1), nn.ReLU(),
+            nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(64, num_classes)
+        )
+    
+    def preprocess(self, image) -> 'np.ndarray':
+        """Decode and normalize one image (path, file object or bytes) to a 3x224x224 float32 array
+        
+        Same as the notebook's Resize((224, 224)) + ToTensor + Normalize,
+        done with PIL and NumPy so it needs no torch.
+        """
+        import io
+        import numpy as np
+        from PIL import Image
+        
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        with Image.open(image) as img:
+            img = img.convert('RGB').resize((self.IMAGE_SIZE, self.IMAGE_SIZE), Image.BILINEAR)
+        array = np.asarray(img, dtype=np.float32) / 255.0
+        array = (array - np.asarray(self.MEAN, dtype=np.float32)) / np.asarray(self.STD, dtype=np.float32)
+        return array.transpose(2, 0, 1)
+    
+    def submit(self, image) -> Future:
+        """Queue one image; the Future resolves to {label, confidence, top}"""
+        self.start()
+        result = Future()
+        submitted = time.monotonic()
+        
+        def ready(preprocessed: Future):
+            try:
+                tensor = preprocessed.result()
+            except Exception as e:
+                result.set_exception(ValueError(f'Could not read image: {str(e)}'))
+                return
+            self._queue.put((tensor, result, submitted))
+        
+        self._preprocess_pool.submit(self.preprocess, image).add_done_callback(ready)
+        return result
+    
+    def classify(self, images: List[Any], timeout: float = 30) -> List[Dict[str, Any]]:
+        """Classify several images together; one {success, ...} result per image"""
+        futures = [self.submit(image) for image in images]
+        results = []
+        for future in futures:
+            try:
+                results.append({'success': True, **future.result(timeout)})
+            except ValueError as e:
+                results.append({'success': False, 'error': str(e)})
+        return results
+    
+    def classify_media(self, report_id: str, filename: str):
+        """Classify an incident's stored media file in the background and save the result"""
+        future = self.submit(os.path.join(self.upload_folder, filename))
+        future.add_done_callback(lambda done: self._writer.submit(self._save, report_id, filename, done))
+    
+    def copy_classification(self, report_id: str, filename: str) -> bool:
+        """Give a report the saved prediction for a file another report already uploaded; False if there is none"""
+        from models import MediaClassification
+        
+        existing = MediaClassification.query.filter_by(filename=filename).order_by(MediaClassification.id).first()
+        if existing is None:
+            return False
+        if not MediaClassification.query.filter_by(report_id=report_id, filename=filename).first():
+            self.db.session.add(MediaClassification(
+                report_id=report_id,
+                filename=filename,
+                label=existing.label,
+                confidence=existing.confidence,
+                top_labels=existing.top_labels
+            ))
+            self.db.session.commit()
+        return True
+    
+    def _save(self, report_id: str, filename: str, done: Future):
+        from models import MediaClassification
+        
+        with self.app.app_context():
+            try:
+                prediction = done.result()
+                self.db.session.add(MediaClassification(
+                    report_id=report_id,
+                    filename=filename,
+                    label=prediction['label'],
+                    confidence=prediction['confidence'],
+                    top_labels=prediction['top']
+                ))
+                self.db.session.commit()
+                logger.info(f"Classified {filename} as {prediction['label']} ({prediction['confidence']:.2f})")
+            except Exception as e:
+                logger.error(f"Error classifying {filename}: {str(e)}")
+                self.db.session.rollback()
+            finally:
+                self.db.session.remove()
+    
+    def _dispatch_loop(self):
+        """Form micro-batches: the first waiting image opens a window of ``max_wait``"""
+        import queue
+        
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._run(batch)
+    
+    def _run(self, batch: List[Tuple[Any, Future, float]]):
+        """Run one batch through the model and resolve its Futures"""
+        import numpy as np
+        import torch
+        
+        try:
+            with torch.inference_mode():
+                logits = self.model(torch.from_numpy(np.stack([tensor for tensor, _, _ in batch])))
+                top = torch.softmax(logits, dim=1).topk(min(self.top_k, logits.shape[1]), dim=1)
+            scores, indexes = top.values.tolist(), top.indices.tolist()
+        except Exception as e:
+            logger.error(f"Classifier batch failed: {str(e)}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        
+        finished = time.monotonic()
+        for (_, future, submitted), row_scores, row_indexes in zip(batch, scores, indexes):
+            labels = [{'label': self.classes[i], 'confidence': round(score, 4)} for score, i in zip(row_scores, row_indexes)]
+            future.set_result({'label': labels[0]['label'], 'confidence': labels[0]['confidence'], 'top': labels})
+            self._latencies.append(finished - submitted)
+        self._batch_sizes.append(len(batch))
+        self._images += len(batch)
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Batching and latency figures over the recent window"""
+        latencies = sorted(self._latencies)
+        sizes = list(self._batch_sizes)
+        
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+        
+        return {
+            'running': self._dispatcher is not None,
+            'images_classified': self._images,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'mean_batch_size': round(sum(sizes) / len(sizes), 2) if sizes else None,
+            'latency_ms_p50': percentile(0.5),
+            'latency_ms_p95': percentile(0.95),
+            'latency_ms_p99': percentile(0.99)
+        }
+
+def _gps_degrees(values, ref) -> float:
+    """EXIF (degrees, minutes, seconds) rationals and N/S/E/W ref to signed decimal degrees"""
+    degrees, minutes, seconds = (float(value) for value in values)
+    value = degrees + minutes / 60 + seconds / 3600
+    if isinstance(ref, bytes):
+        ref = ref.decode('ascii', 'ignore')
+    return -value if str(ref).strip().upper() in ('S', 'W') else value
+
+def exif_coordinates(exif) -> Tuple[Optional[float], Optional[float]]:
+    """Latitude and longitude from an image's EXIF GPS block, or (None, None)"""
+    try:
+        gps = exif.get_ifd(0x8825)  # GPSInfo
+        latitude = _gps_degrees(gps[2], gps.get(1, 'N'))
+        longitude = _gps_degrees(gps[4], gps.get(3, 'E'))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError, AttributeError):
+        return None, None
+    if not validate_coordinates(latitude, longitude) or (latitude == 0 and longitude == 0):
+        return None, None
+    return round(latitude, 6), round(longitude, 6)
+
+def iso6709_coordinates(location: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Latitude and longitude from a video location tag such as ``+37.7858-122.4064/``"""
+    import re
+    
+    match = re.match(r'\s*([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)', location or '')
+    if not match:
+        return None, None
+    latitude, longitude = float(match.group(1)), float(match.group(2))
+    if not validate_coordinates(latitude, longitude):
+        return None, None
+    return round(latitude, 6), round(longitude, 6)
+
+def _replace_atomically(path: str, write):
+    """Call ``write(temp_path)`` and move the result over ``path``"""
+    base, ext = os.path.splitext(path)
+    temp_path = f"{base}.tmp{os.getpid()}{ext}"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _strip_jpeg_metadata(source: str, target: str):
+    """Copy a JPEG without its EXIF/XMP (APP1), IPTC (APP13) and comment segments, losslessly"""
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        if src.read(2) != b'\xff\xd8':
+            raise ValueError('Not a JPEG file')
+        dst.write(b'\xff\xd8')
+        while True:
+            marker = src.read(2)
+            while marker[1:] == b'\xff':  # fill bytes
+                marker = marker[1:] + src.read(1)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError('Corrupt JPEG segment')
+            if marker[1] == 0xDA:  # start of scan: the rest is image data
+                dst.write(marker)
+                shutil.copyfileobj(src, dst)
+                return
+            header = src.read(2)
+            body = src.read(int.from_bytes(header, 'big') - 2)
+            if marker[1] not in (0xE1, 0xED, 0xFE):
+                dst.write(marker + header + body)
+
+def _save_variants(image, output_dir: str, stem: str, thumbnail_size: int, web_size: int,
+                   quality: int) -> Dict[str, str]:
+    """Write the fixed-size square thumbnail and the downscaled web JPEG for an RGB image"""
+    from PIL import Image, ImageOps
+    
+    variants = {}
+    thumbnail = ImageOps.fit(image, (thumbnail_size, thumbnail_size), Image.LANCZOS)
+    variants['thumbnail'] = f"{stem}.thumb.jpg"
+    _replace_atomically(os.path.join(output_dir, variants['thumbnail']),
+                        lambda path: thumbnail.save(path, 'JPEG', quality=quality, optimize=True))
+    
+    web = image.copy()
+    web.thumbnail((web_size, web_size), Image.LANCZOS)  # only ever shrinks
+    variants['web'] = f"{stem}.web.jpg"
+    _replace_atomically(os.path.join(output_dir, variants['web']),
+                        lambda path: web.save(path, 'JPEG', quality=quality, optimize=True, progressive=True))
+    return variants
+
+def _strip_image(path: str) -> Dict[str, Any]:
+    from PIL import Image, ImageOps
+    
+    result = {'latitude': None, 'longitude': None, 'stripped': False}
+    with Image.open(path) as img:
+        exif = img.getexif()
+        result['latitude'], result['longitude'] = exif_coordinates(exif)
+        has_metadata = bool(exif) or any(key in img.info for key in ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment'))
+        if not has_metadata or getattr(img, 'is_animated', False):
+            return result
+        rotated = exif.get(0x0112, 1) not in (1, None)  # Orientation
+        if img.format == 'JPEG' and not rotated:
+            _replace_atomically(path, lambda temp_path: _strip_jpeg_metadata(path, temp_path))
+        else:
+            upright = ImageOps.exif_transpose(img)  # a copy, rotated per the Orientation tag
+            upright.info = {key: img.info[key] for key in ('icc_profile', 'transparency', 'dpi') if key in img.info}
+            options = {'quality': 95} if img.format == 'JPEG' else {}
+            _replace_atomically(path, lambda temp_path: upright.save(temp_path, img.format, exif=b'', **options))
+        result['stripped'] = True
+    return result
+
+def _strip_video(path: str, ffmpeg: str, ffprobe: Optional[str]) -> Dict[str, Any]:
+    import subprocess
+    
+    result = {'latitude': None, 'longitude': None, 'stripped': False}
+    if ffprobe:
+        probe = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_entries', 'format_tags', '-of', 'json', path],
+            capture_output=True, text=True, timeout=60
+        )
+        if probe.returncode == 0:
+            tags = {key.lower(): value for key, value in
+                    (json.loads(probe.stdout or '{}').get('format', {}).get('tags') or {}).items()}
+            result['latitude'], result['longitude'] = iso6709_coordinates(
+                tags.get('location') or tags.get('com.apple.quicktime.location.iso6709')
+            )
+    
+    # Drop container metadata (GPS, device, owner) without re-encoding; faststart lets browsers play while loading
+    def remux(temp_path):
+        command = [ffmpeg, '-v', 'error', '-y', '-i', path, '-map', '0', '-map_metadata', '-1', '-c', 'copy']
+        if path.lower().endswith(('.mp4', '.mov')):
+            command += ['-movflags', '+faststart']
+        subprocess.run(command + [temp_path], capture_output=True, timeout=600, check=True)
+    
+    try:
+        _replace_atomically(path, remux)
+        result['stripped'] = True
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Could not strip metadata from {path}: {e.stderr.decode('utf-8', 'ignore')[:200]}")
+    return result
+
+def strip_media_metadata(path: str, ffmpeg: Optional[str] = None, ffprobe: Optional[str] = None) -> Dict[str, Any]:
+    """Remove location and device metadata from an image or video in place
+    
+    The GPS position (or a video's location tag) is read first. Videos need
+    ``ffmpeg``, and ``ffprobe`` for the location; other files are left as
+    they are. Returns ``{latitude, longitude, stripped}``.
+    """
+    ext = path.rsplit('.', 1)[-1].lower()
+    if ext in MediaPipeline.VIDEO_EXTENSIONS and ffmpeg:
+        return _strip_video(path, ffmpeg, ffprobe)
+    if ext in MediaPipeline.IMAGE_EXTENSIONS:
+        return _strip_image(path)
+    return {'latitude': None, 'longitude': None, 'stripped': False}
+
+def _process_image(path: str, output_dir: str, stem: str, thumbnail_size: int, web_size: int,
+                   quality: int) -> Dict[str, Any]:
+    from PIL import Image, ImageOps
+    
+    result = {'variants': {}}
+    with Image.open(path) as img:
+        upright = ImageOps.exif_transpose(img)  # a copy, rotated per the Orientation tag
+        result['width'], result['height'] = upright.size
+        rgb = upright.convert('RGB') if upright.mode != 'RGB' else upright
+        result['variants'] = _save_variants(rgb, output_dir, stem, thumbnail_size, web_size, quality)
+    return result
+
+def _process_video(path: str, output_dir: str, stem: str, thumbnail_size: int, web_size: int,
+                   quality: int, ffmpeg: str) -> Dict[str, Any]:
+    import subprocess
+    from PIL import Image
+    
+    result = {'variants': {}}
+    # Poster frame one second in, or the first frame for clips shorter than that
+    poster = os.path.join(output_dir, f"{stem}.poster.jpg")
+    for seek in ('1', '0'):
+        subprocess.run(
+            [ffmpeg, '-v', 'error', '-y', '-ss', seek, '-i', path, '-frames:v', '1', '-q:v', '3', poster],
+            capture_output=True, timeout=120
+        )
+        if os.path.exists(poster) and os.path.getsize(poster):
+            break
+    if os.path.exists(poster) and os.path.getsize(poster):
+        with Image.open(poster) as frame:
+            frame = frame.convert('RGB')
+            result['width'], result['height'] = frame.size
+            result['variants'] = _save_variants(frame, output_dir, stem, thumbnail_size, web_size, quality)
+        result['variants']['poster'] = os.path.basename(poster)
+    return result
+
+def process_media_file(path: str, output_dir: str, thumbnail_size: int = 320, web_size: int = 1600,
+                       quality: int = 82, ffmpeg: Optional[str] = None,
+                       ffprobe: Optional[str] = None, strip: bool = True) -> Dict[str, Any]:
+    """Make the preview variants of one stored media file and strip its metadata
+    
+    Runs in a MediaPipeline worker process. Images get a square thumbnail and
+    a web JPEG no larger than ``web_size``; their GPS position is read before
+    the EXIF block is removed from the original. Videos get a poster frame
+    (and the same variants of it) when ``ffmpeg`` is given. Files in the
+    MediaStore were stripped before they were hashed and must be processed
+    with ``strip=False``, or their bytes would no longer match their name.
+    Returns ``{variants, latitude, longitude, stripped, width, height}``.
+    """
+    result = {'variants': {}, 'latitude': None, 'longitude': None, 'stripped': False}
+    if strip:
+        result.update(strip_media_metadata(path, ffmpeg, ffprobe))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    ext = path.rsplit('.', 1)[-1].lower()
+    if ext in MediaPipeline.VIDEO_EXTENSIONS:
+        if ffmpeg:
+            result.update(_process_video(path, output_dir, stem, thumbnail_size, web_size, quality, ffmpeg))
+        return result
+    result.update(_process_image(path, output_dir, stem, thumbnail_size, web_size, quality))
+    return result
+
+class MediaPipeline:
+    """Background thumbnails, web variants and metadata stripping for incident media
+    
+    Decoding and resizing are CPU bound, so files are processed in a pool of
+    worker processes rather than threads. When a file is done, a single
+    writer thread replaces its ``media_files`` entry with
+    ``{file, thumbnail, web[, poster]}`` so list views can load the small
+    variants, fills in the report's coordinates from the photo's GPS tags if
+    the reporter gave none, and publishes ``incident.updated``. Files from
+    the MediaStore were stripped before they were stored and are processed
+    with ``strip=False``. Video poster frames need ffmpeg on the PATH; without
+    it videos are left as uploaded.
+    """
+    
+    IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi'}
+    
+    def __init__(self, app=None, db=None, events: Optional['IncidentEventBroker'] = None,
+                 classifier: Optional['ImageClassifier'] = None):
+        self.app = app
+        self.db = db
+        self.events = events
+        self.classifier = classifier
+        self._pool = None
+        self._writer = None
+        self._lock = threading.Lock()
+        self.stats = {'processed': 0, 'failed': 0, 'located': 0}
+        if app is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        """Initialize pipeline with app configuration"""
+        self.app = app
+        self.db = db
+        self.enabled = app.config.get('MEDIA_PIPELINE_ENABLED', True)
+        self.workers = app.config.get('MEDIA_PIPELINE_WORKERS', 2)
+        self.upload_folder = app.config.get('UPLOAD_FOLDER')
+        self.thumbnail_size = app.config.get('MEDIA_THUMBNAIL_SIZE', 320)
+        self.web_size = app.config.get('MEDIA_WEB_MAX_SIZE', 1600)
+        self.quality = app.config.get('MEDIA_JPEG_QUALITY', 82)
+        self.ffmpeg = shutil.which(app.config.get('FFMPEG_BINARY', 'ffmpeg'))
+        self.ffprobe = shutil.which(app.config.get('FFPROBE_BINARY', 'ffprobe'))
+    
+    def handles(self, filename: str) -> bool:
+        """Whether the pipeline has anything to do for a stored file"""
+        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        return ext in self.IMAGE_EXTENSIONS or (ext in self.VIDEO_EXTENSIONS and self.ffmpeg is not None)
+    
+    def start(self):
+        """Start the worker processes and the writer thread (idempotent)"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        
+        with self._lock:
+            if self._pool is not None:
+                return
+            # spawn: forking a process that holds database connections and threads is unsafe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix='media-writer')
+            logger.info(f"Media pipeline started with {self.workers} worker processes")
+    
+    def stop(self, wait: bool = True):
+        """Shut down the worker processes, finishing queued files if ``wait``"""
+        with self._lock:
+            if self._pool is None:
+                return
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._writer.shutdown(wait=wait)
+            self._pool = self._writer = None
+    
+    def process(self, filename: str, strip: bool = True) -> Future:
+        """Queue one stored file; the Future resolves to process_media_file's result"""
+        self.start()
+        path = os.path.join(self.upload_folder, filename)
+        return self._pool.submit(
+            process_media_file, path, os.path.dirname(path),
+            self.thumbnail_size, self.web_size, self.quality, self.ffmpeg, self.ffprobe, strip
+        )
+    
+    def submit(self, report_id: str, filename: str, strip: bool = True) -> Optional[Future]:
+        """Process an incident's stored media file in the background and record the variants"""
+        if not self.enabled or not self.handles(filename):
+            return None
+        future = self.process(filename, strip)
+        future.add_done_callback(lambda done: self._writer.submit(self._save, report_id, filename, done))
+        return future
+    
+    def _save(self, report_id: str, filename: str, done: Future):
+        from models import IncidentReport, MediaBlob
+        
+        with self.app.app_context():
+            try:
+                result = done.result()
+                folder = os.path.dirname(filename)  # variants sit next to the file
+                variants = {kind: f"{folder}/{name}" if folder else name for kind, name in result['variants'].items()}
+                if variants:
+                    # Later uploads of the same bytes reuse these instead of being processed again
+                    MediaBlob.query.filter_by(stored_filename=filename).update({'variants': variants}, synchronize_session=False)
+                report = IncidentReport.query.filter_by(report_id=report_id).first()
+                if report is None:
+                    self.db.session.commit()
+                    return
+                entry = {'file': filename, **variants}
+                # Reassign so the JSON column is seen as changed
+                report.media_files = [
+                    entry if (item == filename or (isinstance(item, dict) and item.get('file') == filename)) else item
+                    for item in (report.media_files or [])
+                ]
+                if report.latitude is None and report.longitude is None and result['latitude'] is not None:
+                    report.latitude, report.longitude = result['latitude'], result['longitude']
+                    self.stats['located'] += 1
+                event = self.events.snapshot(report) if self.events else None
+                self.db.session.commit()
+                self.stats['processed'] += 1
+                if event is not None:
+                    self.events.publish('incident.updated', event)
+                if 'poster' in entry and self.classifier is not None and self.classifier.is_configured:
+                    self.classifier.classify_media(report_id, entry['poster'])
+                logger.info(f"Processed media {filename}: {', '.join(sorted(result['variants'])) or 'no variants'}")
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Error processing media {filename}: {str(e)}")
+                self.db.session.rollback()
+            finally:
+                self.db.session.remove()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Pipeline counters"""
+        return {
+            'running': self._pool is not None,
+            'workers': self.workers,
+            'video_posters': self.ffmpeg is not None,
+            **self.stats
+        }
+
+class EmergencyKitGenerator:
+    """Emergency kit engine behind the single and batch kit endpoints
+    
+    A kit's item list depends only on the disaster type and the three
+    special-needs flags, so those lists are compiled once into templates and a
+    kit is a template filled in for one family size and duration. Finished kits
+    are memoized in an LRU keyed on every parameter that changes the result.
+    Kits are shared between callers and must be treated as read-only.
+    """
+    
+    # (item, priority, scales with family size, scales with duration, amount, quantity format)
+    BASE_ITEMS = (
+        ('water', 'high', True, True, 4, '{} liters'),
+        ('food', 'high', True, True, 3, '{} meals'),
+        ('first_aid_kit', 'high', False, False, None, '1'),
+        ('flashlight', 'high', True, False, 1, '{}'),
+        ('batteries', 'high', False, False, None, '20+'),
+        ('radio', 'medium', False, False, None, '1'),
+        ('whistle', 'medium', True, False, 1, '{}'),
+        ('blankets', 'medium', True, False, 1, '{}'),
+        ('important_documents', 'high', False, False, None, '1 set'),
+        ('cash', 'high', False, False, None, '₹5000+')
+    )
+    
+    DISASTER_ITEMS = {
+        'Flood': (
+            ('water_purification_tablets', 'high', False, False, None, '50+'),
+            ('waterproof_bags', 'high', True, False, 1, '{}'),
+            ('life_jackets', 'high', True, False, 1, '{}'),
+            ('sandbags', 'medium', False, False, None, '20+')
+        ),
+        'Earthquake': (
+            ('hard_hats', 'high', True, False, 1, '{}'),
+            ('work_gloves', 'medium', True, False, 2, '{}'),
+            ('crowbar', 'medium', False, False, None, '1'),
+            ('dust_masks', 'high', True, False, 5, '{}')
+        ),
+        'Cyclone': (
+            ('tarps', 'high', False, False, None, '2+'),
+            ('rope', 'medium', False, False, None, '50+ meters'),
+            ('duct_tape', 'medium', False, False, None, '5+ rolls'),
+            ('emergency_shelter', 'high', False, False, None, '1')
+        ),
+        'Landslide': (
+            ('emergency_shovel', 'high', False, False, None, '1'),
+            ('walkie_talkies', 'medium', False, False, None, '2+'),
+            ('emergency_blanket', 'high', True, False, 1, '{}')
+        )
+    }
+    
+    MEDICAL_ITEMS = (
+        ('prescription_medications', 'high', False, False, None, '7+ days supply'),
+        ('medical_equipment', 'high', False, False, None, 'As needed'),
+        ('medical_records', 'high', False, False, None, '1 copy')
+    )
+    
+    DISABILITY_ITEMS = (
+        ('assistive_devices', 'high', False, False, None, 'As needed'),
+        ('communication_aids', 'high', False, False, None, 'As needed')
+    )
+    
+    PET_ITEMS = (
+        ('pet_food', 'medium', False, True, 2, '{} days'),
+        ('pet_carrier', 'medium', False, False, None, '1+'),
+        ('pet_medications', 'medium', False, False, None, 'As needed')
+    )
+    
+    BUDGET_MULTIPLIERS = {'basic': 1.0, 'standard': 1.5, 'premium': 2.0}
+    COST_PER_PERSON_DAY = 500
+    
+    REQUIRED_FIELDS = ('family_size', 'adults', 'children', 'seniors', 'kit_duration', 'budget_range', 'disaster_type')
+    
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._kits: 'OrderedDict[Tuple[Any, ...], Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+        # Changes whenever the item rules do, so stored kits from older rules are never reused
+        self.rules_version = hashlib.sha256(repr((
+            self.BASE_ITEMS, self.DISASTER_ITEMS, self.MEDICAL_ITEMS, self.DISABILITY_ITEMS,
+            self.PET_ITEMS, self.BUDGET_MULTIPLIERS, self.COST_PER_PERSON_DAY
+        )).encode()).hexdigest()[:16]
+        
+        # One template per (disaster type, medical, disabilities, pets); None covers unknown disaster types
+        self._templates = {}
+        for disaster_type in (None, *self.DISASTER_ITEMS):
+            for has_medical in (False, True):
+                for has_disabilities in (False, True):
+                    for has_pets in (False, True):
+                        specs = self.BASE_ITEMS + self.DISASTER_ITEMS.get(disaster_type, ())
+                        specs += (self.MEDICAL_ITEMS if has_medical else ()) + \
+                            (self.DISABILITY_ITEMS if has_disabilities else ()) + \
+                            (self.PET_ITEMS if has_pets else ())
+                        self._templates[(disaster_type, has_medical, has_disabilities, has_pets)] = self._compile(specs)
+    
+    @staticmethod
+    def _compile(specs) -> Dict[str, Any]:
+        """Split item specs into prebuilt fixed items and the few that scale"""
+        items = {}
+        scaled = []
+        for name, priority, per_person, per_day, amount, quantity in specs:
+            if amount is None:
+                items[name] = {'quantity': quantity, 'priority': priority}
+            else:
+                # Placeholder keeps the item order; filled in per kit
+                items[name] = None
+                scaled.append((name, priority, per_person, per_day, amount, quantity))
+        return {
+            'items': items,
+            'scaled': tuple(scaled),
+            'total_items': len(items),
+            'high_priority_items': sum(1 for spec in specs if spec[1] == 'high')
+        }
+    
+    def parse_household(self, data: Any) -> Dict[str, Any]:
+        """Validate one kit request and return ``generate_kit`` arguments; raises ValueError"""
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        for field in self.REQUIRED_FIELDS:
+            if field not in data:
+                raise ValueError(f'{field} is required')
+        
+        counts = {}
+        for field in ('family_size', 'adults', 'children', 'seniors', 'kit_duration'):
+            value = data[field]
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(f'{field} must be an integer')
+            try:
+                counts[field] = int(value)
+            except ValueError:
+                raise ValueError(f'{field} must be an integer')
+            if counts[field] < 0:
+                raise ValueError(f'{field} cannot be negative')
+        if counts['family_size'] < 1 or counts['kit_duration'] < 1:
+            raise ValueError('family_size and kit_duration must be at least 1')
+        if not isinstance(data['disaster_type'], str) or not isinstance(data['budget_range'], str):
+            raise ValueError('disaster_type and budget_range must be strings')
+        
+        return {
+            'disaster_type': data['disaster_type'],
+            'family_size': counts['family_size'],
+            'adults': counts['adults'],
+            'children': counts['children'],
+            'seniors': counts['seniors'],
+            'has_medical': bool(data.get('has_medical_conditions', False)),
+            'has_disabilities': bool(data.get('has_disabilities', False)),
+            'has_pets': bool(data.get('has_pets', False)),
+            'duration': counts['kit_duration'],
+            'budget': data['budget_range']
+        }
+    
+    def generate_kit(self, disaster_type: str, family_size: int, adults: int, 
+                    children: int, seniors: int, has_medical: bool, 
+                    has_disabilities: bool, has_pets: bool, duration: int, 
+                    budget: str) -> Dict[str, Any]:
+        """Generate emergency kit configuration
+        
+        The adult/child/senior split is stored with a saved kit but does not
+        change its contents, so it is not part of the cache key.
+        """
+        key = self.config_key(disaster_type, family_size, duration, budget, has_medical, has_disabilities, has_pets)
+        with self._lock:
+            kit = self._kits.get(key)
+            if kit is not None:
+                self._kits.move_to_end(key)
+                self.stats['hits'] += 1
+                return kit
+            self.stats['misses'] += 1
+        
+        kit = self._build(*key)
+        with self._lock:
+            self._kits[key] = kit
+            while len(self._kits) > self.max_entries:
+                self._kits.popitem(last=False)
+        return kit
+    
+    @staticmethod
+    def config_key(disaster_type: str, family_size: int, duration: int, budget: str, has_medical: bool,
+                   has_disabilities: bool, has_pets: bool, **_) -> Tuple[Any, ...]:
+        """Normalized parameters that fully determine a kit's contents"""
+        return (disaster_type, family_size, duration, budget, bool(has_medical), bool(has_disabilities), bool(has_pets))
+    
+    def _build(self, disaster_type: str, family_size: int, duration: int, budget: str,
+               has_medical: bool, has_disabilities: bool, has_pets: bool) -> Dict[str, Any]:
+        template_type = disaster_type if disaster_type in self.DISASTER_ITEMS else None
+        template = self._templates[(template_type, has_medical, has_disabilities, has_pets)]
+        
+        items = dict(template['items'])
+        for name, priority, per_person, per_day, amount, quantity in template['scaled']:
+            amount *= (family_size if per_person else 1) * (duration if per_day else 1)
+            items[name] = {'quantity': quantity.format(amount), 'priority': priority}
+        
+        multiplier = self.BUDGET_MULTIPLIERS.get(budget, 1.0)
+        return {
+            'items': items,
+            'estimated_cost': int(family_size * duration * self.COST_PER_PERSON_DAY * multiplier),
+            'total_items': template['total_items'],
+            'high_priority_items': template['high_priority_items'],
+            'disaster_type': disaster_type,
+            'family_size': family_size,
             'duration_days': duration,
             'budget_range': budget
         }
+    
+    def generate_batch(self, households: List[Any]) -> List[Dict[str, Any]]:
+        """Plan kits for many households; one ``{index, success, kit | error}`` result per entry"""
+        results = []
+        for index, household in enumerate(households):
+            try:
+                kit = self.generate_kit(**self.parse_household(household))
+            except ValueError as e:
+                results.append({'index': index, 'success': False, 'error': str(e)})
+                continue
+            results.append({'index': index, 'success': True, 'kit': kit})
+        return results
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Cache counters for the kit engine"""
+        with self._lock:
+            return {**self.stats, 'entries': len(self._kits), 'templates': len(self._templates)}
+
+class DistrictKitPlanner:
+    """Total kit supplies and cost for a whole district from household census rows
+    
+    Uses the same item tables as ``EmergencyKitGenerator``, but instead of
+    building a kit per household it reduces the census to a handful of sums per
+    household group (count, people, days, person-days) with NumPy and scales
+    each item rule by the matching sum.
+    """
+    
+    COLUMNS = ('family_size', 'adults', 'children', 'seniors', 'kit_duration', 'budget_range',
+               'disaster_type', 'has_medical_conditions', 'has_disabilities', 'has_pets')
+    TRUE_VALUES = ('true', '1', 'yes', 'y', 't')
+    
+    def __init__(self, generator: EmergencyKitGenerator):
+        self.generator = generator
+    
+    def read_csv(self, source) -> 'pd.DataFrame':
+        """Read a census CSV (path or file object); unknown columns are ignored"""
+        import pandas as pd
+        
+        return pd.read_csv(source, usecols=lambda column: column in self.COLUMNS)
+    
+    def plan(self, households, disaster_type: Optional[str] = None, kit_duration: int = 7,
+             budget_range: str = 'standard') -> Dict[str, Any]:
+        """Summed supplies for ``households`` (DataFrame, or list of dicts)
+        
+        ``disaster_type``, ``kit_duration`` and ``budget_range`` apply to rows
+        without their own value. ``family_size`` defaults to adults + children
+        + seniors. Rows that are still invalid are skipped and counted.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        df = households if isinstance(households, pd.DataFrame) else pd.DataFrame.from_records(households)
+        
+        def numeric(column, default):
+            if column not in df:
+                return np.full(len(df), default, dtype=np.float64)
+            # Blank cells take the default; anything else unparseable stays NaN and fails the row
+            missing = (df[column].isna() | (df[column] == '')).to_numpy()
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            return np.where(missing, default, values)
+        
+        def flag(column):
+            if column not in df:
+                return np.zeros(len(df), dtype=bool)
+            values = df[column]
+            if values.dtype == bool:
+                return values.to_numpy()
+            return values.astype(str).str.strip().str.lower().isin(self.TRUE_VALUES).to_numpy()
+        
+        def text(column, default):
+            if column not in df:
+                return pd.Series(default, index=df.index, dtype=object)
+            return df[column].where(df[column].notna() & (df[column] != ''), default)
+        
+        adults, children, seniors = numeric('adults', 0), numeric('children', 0), numeric('seniors', 0)
+        family_size = numeric('family_size', np.nan)
+        family_size = np.where(np.isnan(family_size), adults + children + seniors, family_size)
+        duration = numeric('kit_duration', kit_duration)
+        
+        people = np.stack([family_size, adults, children, seniors, duration])
+        valid = np.isfinite(people).all(axis=0) & (people >= 0).all(axis=0) & (people == np.floor(people)).all(axis=0)
+        valid &= (family_size >= 1) & (duration >= 1)
+        
+        disaster_types = list(self.generator.DISASTER_ITEMS)
+        disaster = text('disaster_type', disaster_type)
+        budget = text('budget_range', budget_range)
+        # Disaster code 0 is "no disaster-specific items"; known types are 1..n
+        disaster_code = (pd.Categorical(disaster, categories=disaster_types).codes + 1)[valid]
+        multiplier = budget.map(self.generator.BUDGET_MULTIPLIERS).fillna(1.0).to_numpy(dtype=np.float64)[valid]
+        
+        family_size = family_size[valid].astype(np.int64)
+        duration = duration[valid].astype(np.int64)
+        person_days = family_size * duration
+        flags = {
+            'has_medical': flag('has_medical_conditions')[valid],
+            'has_disabilities': flag('has_disabilities')[valid],
+            'has_pets': flag('has_pets')[valid]
+        }
+        
+        def sums(mask=None):
+            """(households, people, days, person-days) over the masked rows"""
+            if mask is None:
+                return len(family_size), int(family_size.sum()), int(duration.sum()), int(person_days.sum())
+            return int(mask.sum()), int(family_size[mask].sum()), int(duration[mask].sum()), int(person_days[mask].sum())
+        
+        groups = [(self.generator.BASE_ITEMS, sums())]
+        minlength = len(disaster_types) + 1
+        by_disaster = np.stack([
+            np.bincount(disaster_code, minlength=minlength),
+            np.bincount(disaster_code, weights=family_size, minlength=minlength),
+            np.bincount(disaster_code, weights=duration, minlength=minlength),
+            np.bincount(disaster_code, weights=person_days, minlength=minlength)
+        ]).astype(np.int64)
+        for code, name in enumerate(disaster_types, start=1):
+            groups.append((self.generator.DISASTER_ITEMS[name], tuple(int(value) for value in by_disaster[:, code])))
+        groups.append((self.generator.MEDICAL_ITEMS, sums(flags['has_medical'])))
+        groups.append((self.generator.DISABILITY_ITEMS, sums(flags['has_disabilities'])))
+        groups.append((self.generator.PET_ITEMS, sums(flags['has_pets'])))
+        
+        items = {}
+        for specs, (count, total_people, total_days, total_person_days) in groups:
+            if not count:
+                continue
+            for name, priority, per_person, per_day, amount, quantity in specs:
+                if amount is not None:
+                    scale = (total_person_days if per_day else total_people) if per_person else (total_days if per_day else count)
+                    total, unit = amount * scale, quantity.replace('{}', '').strip() or None
+                else:
+                    total, unit = self._fixed_quantity(quantity, count)
+                items[name] = {'quantity': total, 'unit': unit, 'households': count, 'priority': priority}
+        
+        # Same truncation as EmergencyKitGenerator, applied per household before summing
+        costs = (person_days * self.generator.COST_PER_PERSON_DAY * multiplier).astype(np.int64)
+        return {
+            'households': int(valid.sum()),
+            'skipped_rows': int((~valid).sum()),
+            'people': {
+                'total': int(family_size.sum()),
+                'adults': int(adults[valid].sum()),
+                'children': int(children[valid].sum()),
+                'seniors': int(seniors[valid].sum())
+            },
+            'households_by_disaster_type': dict(
+                {name: int(by_disaster[0, code]) for code, name in enumerate(disaster_types, start=1)},
+                other=int(by_disaster[0, 0])
+            ),
+            'person_days': int(person_days.sum()),
+            'estimated_cost': int(costs.sum()),
+            'items': items
+        }
+    
+    @staticmethod
+    def _fixed_quantity(quantity: str, count: int) -> Tuple[Optional[int], Optional[str]]:
+        """Total for a fixed per-kit quantity such as '20+' or '50+ meters'; None for 'As needed'"""
+        import re
+        
+        match = re.match(r'^(\D*)(\d+)\+?\s*(.*)$', quantity)
+        if not match:
+            return None, None
+        prefix, number, unit = match.groups()
+        return int(number) * count, (unit or prefix or None)
+
+class EmergencyKitStore:
+    """Content-addressed storage for generated kit bodies
+    
+    A kit body is stored once in ``emergency_kit_contents`` under the sha256
+    of its normalized parameters (and the generator's rules version); every
+    ``EmergencyKit`` row just references that hash. Bodies never change once
+    written, so known hashes and their bodies are kept in a process-local LRU
+    and repeated configurations cost no reads or body writes.
+    """
+    
+    def __init__(self, db, generator: EmergencyKitGenerator, max_entries: int = 4096):
+        self.db = db
+        self.generator = generator
+        self.max_entries = max_entries
+        self._bodies: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'stored': 0, 'loaded': 0}
+    
+    def content_hash(self, params: Dict[str, Any]) -> str:
+        """Address of the kit for ``generate_kit`` arguments"""
+        key = (self.generator.rules_version,) + self.generator.config_key(**params)
+        return hashlib.sha256(json.dumps(key, separators=(',', ':')).encode()).hexdigest()
+    
+    def save(self, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Make sure the body for ``params`` is stored; returns (content_hash, kit_items)"""
+        content_hash = self.content_hash(params)
+        kit_items = self._cached(content_hash)
+        if kit_items is not None:
+            return content_hash, kit_items
+        
+        kit_items = self.generator.generate_kit(**params)
+        self._insert(content_hash, kit_items)
+        self._remember(content_hash, kit_items)
+        self.stats['stored'] += 1
+        return content_hash, kit_items
+    
+    def body(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Kit body for a hash, from memory when possible"""
+        from models import EmergencyKitContent
+        
+        kit_items = self._cached(content_hash)
+        if kit_items is None:
+            kit_items = self.db.session.query(EmergencyKitContent.kit_items).filter(
+                EmergencyKitContent.content_hash == content_hash
+            ).scalar()
+            if kit_items is not None:
+                self._remember(content_hash, kit_items)
+                self.stats['loaded'] += 1
+        return kit_items
+    
+    def _insert(self, content_hash: str, kit_items: Dict[str, Any]):
+        """Write the body in its own short transaction so it is never rolled back with the caller's"""
+        from models import EmergencyKitContent
+        
+        table = EmergencyKitContent.__table__
+        row = {'content_hash': content_hash, 'kit_items': kit_items, 'created_at': datetime.utcnow()}
+        dialect = self.db.engine.dialect.name
+        with self.db.engine.begin() as conn:
+            if dialect in ('sqlite', 'postgresql'):
+                if dialect == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                else:
+                    from sqlalchemy.dialects.postgresql import insert
+                conn.execute(insert(table).values(row).on_conflict_do_nothing(index_elements=['content_hash']))
+            elif conn.execute(table.select().where(table.c.content_hash == content_hash)).first() is None:
+                conn.execute(table.insert().values(row))
+    
+    def _cached(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            kit_items = self._bodies.get(content_hash)
+            if kit_items is not None:
+                self._bodies.move_to_end(content_hash)
+                self.stats['hits'] += 1
+            return kit_items
+    
+    def _remember(self, content_hash: str, kit_items: Dict[str, Any]):
+        with self._lock:
+            self._bodies[content_hash] = kit_items
+            self._bodies.move_to_end(content_hash)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+    
+    def compact(self, batch_size: int = 1000) -> int:
+        """Move inline bodies of legacy EmergencyKit rows into the content store
+        
+        Those bodies came from older rules, so they are addressed by a hash of
+        the body itself rather than of the parameters. Returns rows moved.
+        """
+        from sqlalchemy import null
+        from models import EmergencyKit
+        
+        moved = 0
+        while True:
+            kits = EmergencyKit.query.filter(EmergencyKit.kit_items.isnot(None)).order_by(EmergencyKit.id).limit(batch_size).all()
+            if not kits:
+                return moved
+            for kit in kits:
+                content_hash = hashlib.sha256(
+                    json.dumps(kit.kit_items, sort_keys=True, separators=(',', ':')).encode()
+                ).hexdigest()
+                if self._cached(content_hash) is None:
+                    self._insert(content_hash, kit.kit_items)
+                    self._remember(content_hash, kit.kit_items)
+                kit.content_hash = content_hash
+                kit.kit_items = null()  # SQL NULL; plain None would store a JSON 'null'
+                moved += 1
+            self.db.session.commit()
 
 def validate_email(email: str) -> bool:
     """Validate email format"""
@@ -311,21 +4591,12 @@ def validate_coordinates(lat: float, lon: float) -> bool:
     return -90 <= lat <= 90 and -180 <= lon <= 180
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two coordinates in kilometers"""
-    from math import radians, cos, sin, asin, sqrt
-    
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
+    """Calculate distance between two coordinates in kilometers.
     
-    # Radius of earth in kilometers
-    r = 6371
-    return c * r
+    Scalar wrapper around ``geo.haversine_km``; rank many points with that
+    (or ``geo.pairwise_haversine_km``) instead of calling this in a loop.
+    """
+    return float(haversine_km(lat1, lon1, lat2, lon2))
 
 def format_datetime(dt: datetime) -> str:
     """Format datetime for display"""